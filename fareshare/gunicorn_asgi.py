@@ -0,0 +1,20 @@
+"""
+Gunicorn config for the ASGI app, with uvicorn workers:
+
+    gunicorn -c fareshare/gunicorn_asgi.py fareshare.asgi:application
+
+Each worker runs one event loop serving many requests at once, so fewer
+workers are needed than with the sync WSGI workers in the Procfile.
+Compare the two with `manage.py bench_servers` before switching.
+"""
+
+import os
+
+worker_class = 'uvicorn_worker.UvicornWorker'
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+keepalive = 5
+timeout = 30 # seconds a worker may be unresponsive before it is restarted
+graceful_timeout = 30
+max_requests = 2000 # recycle workers now and then, with jitter so they do not all restart together
+max_requests_jitter = 200
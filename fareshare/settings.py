@@ -14,6 +14,7 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 import os
+import tempfile
 
 import dj_database_url
 
@@ -46,17 +47,20 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', # fare search (full-text and trigram lookups), only active on Postgres connections
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'main_app.middleware.StaticFilesMiddleware', # WhiteNoise, async capable for the ASGI app
+    'main_app.perf.PerfMiddleware', # after WhiteNoise so static files are not timed
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'main_app.routers.ReplicaMiddleware', # read-only pages read from the replica, when one is configured
 ]
 
 ROOT_URLCONF = 'fareshare.urls'
@@ -91,6 +95,13 @@ if 'ON_HEROKU' in os.environ:
             ssl_require=True,
         ),
     }
+    if os.getenv('DATABASE_REPLICA_URL'): # e.g. a Heroku follower database
+        DATABASES['replica'] = dj_database_url.config(
+            env='DATABASE_REPLICA_URL',
+            conn_max_age=600,
+            conn_health_checks=True,
+            ssl_require=True,
+        )
 else:
     DATABASES = {
         'default': {
@@ -98,6 +109,31 @@ else:
             'NAME': 'fareshare',
         }
     }
+    if os.getenv('DATABASE_REPLICA_URL'): # a second local Postgres, or a copy of the data in SQLite (sqlite:////path/to/copy.sqlite3)
+        DATABASES['replica'] = dj_database_url.config(env='DATABASE_REPLICA_URL')
+
+# Read-only pages read from the replica when there is one, see main_app/routers.py
+DATABASE_ROUTERS = ['main_app.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10')) # after a write, that user reads from the primary this long
+if 'replica' in DATABASES:
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'} # tests read the "replica" through the default connection
+
+# Async Home / ShareIndex / ShareDetail views, switched on by fareshare/asgi.py (the WSGI app keeps the sync ones)
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == '1'
+
+# Optional connection pool (psycopg 3, Postgres only) instead of persistent connections, DB_POOL=1 turns it on.
+# Each worker process gets its own pool, keep workers x DB_POOL_MAX_SIZE under the database's connection limit.
+DB_POOL = os.getenv('DB_POOL') == '1'
+for database in DATABASES.values():
+    if DB_POOL and database['ENGINE'] == 'django.db.backends.postgresql':
+        database['CONN_MAX_AGE'] = 0 # Django refuses persistent connections together with a pool
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')), # seconds to wait for a free connection
+        }
+    elif ASYNC_VIEWS:
+        database['CONN_MAX_AGE'] = 0 # persistent connections are per request context under ASGI and would pile up
 
 
 # Password validation
@@ -138,11 +174,65 @@ STATIC_URL = 'static/'
 
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# Pages link to the bundles built by `manage.py build_css` (see main_app/assets.py). In production collected files get a
+# content hash in their names plus gzip / brotli copies, and WhiteNoise serves them as immutable, cached for years.
+if 'ON_HEROKU' in os.environ:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+    }
+
+# Receipts and photos (main_app/attachments.py). Uploads stream to FILE_UPLOAD_TEMP_DIR in chunks instead of being
+# held in worker memory, and since that is on the same disk as MEDIA_ROOT saving one is a rename. Files are served by
+# the attachment-file view, which checks access, so MEDIA_ROOT must not be published by the web server.
+MEDIA_URL = 'media/'
+MEDIA_ROOT = Path(os.getenv('MEDIA_ROOT', BASE_DIR / 'media'))
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler'] # no MemoryFileUploadHandler, even small files go to disk
+FILE_UPLOAD_TEMP_DIR = MEDIA_ROOT / 'tmp' # created by main_app/apps.py
+ATTACHMENT_MAX_BYTES = int(os.getenv('ATTACHMENT_MAX_BYTES', str(20 * 1024 * 1024)))
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2')) # background threads per worker process, 0 makes thumbnails during the request
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache for the share page ledger blocks (keyed on each share's version, see ledger.cached_summary_context)
+# CACHE_BACKEND picks one: locmem (per process, the default), file or db (run `manage.py createcachetable` first)
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fareshare',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'fareshare-cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'fareshare_cache',
+    },
+}
+CACHES = {'default': CACHE_BACKENDS[os.getenv('CACHE_BACKEND', 'locmem')]}
+
+# Request timing (main_app/perf.py): share of requests timed, 0 turns the middleware off
+PERF_SAMPLE_RATE = float(os.getenv('PERF_SAMPLE_RATE', '0.1'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'main_app.perf': { # one INFO line per timed request, logged on Heroku and quiet locally unless PERF_LOG_LEVEL=INFO
+            'handlers': ['console'],
+            'level': os.getenv('PERF_LOG_LEVEL', 'INFO' if 'ON_HEROKU' in os.environ else 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 LOGIN_URL = 'home'
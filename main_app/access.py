@@ -0,0 +1,41 @@
+from django.db.models import Prefetch
+from django.http import Http404
+
+from .models import Share, Fare, FareSplit
+
+# Share membership and access checks for the fare routes.
+#
+# Membership is always checked in the database, as part of the query that
+# loads the share or fare, so a route still costs one query and a removed
+# participant loses access on every worker at once. Nothing here is cached
+# across requests: the default cache is per process, and a stale membership
+# would be an authorization bug rather than a slow page.
+
+
+def member_share_ids(user):
+    # the ids of the user's shares as a subquery, evaluated inside the query that uses it
+    return Share.participants.through.objects.filter(user_id=user.pk).values('share_id')
+
+
+def share_participants(share_id):
+    # the share's participants (id and username only), for form choices and labels
+    share = Share(pk=share_id)
+    return list(share.participants.only('id', 'username').order_by('username'))
+
+
+def share_for(user, share_id):
+    try:
+        return Share.objects.get(pk=share_id, participants=user)
+    except Share.DoesNotExist:
+        raise Http404("No share found matching the query")
+
+
+def fare_for(user, share_id, fare_id, with_splits=False):
+    # the fare, with its share loaded, only if it belongs to that share and the user is a participant
+    fares = Fare.objects.select_related('share', 'paid_by')
+    if with_splits:
+        fares = fares.prefetch_related(Prefetch('faresplit_set', queryset=FareSplit.objects.select_related('user')))
+    try:
+        return fares.get(pk=fare_id, share_id=share_id, share__participants=user)
+    except Fare.DoesNotExist:
+        raise Http404("No fare found matching the query")
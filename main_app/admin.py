@@ -1,7 +1,126 @@
-from django.contrib import admin
-from .models import Share, Fare
+import json
 
-admin.site.register(Share)
-admin.site.register(Fare)
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
 
+from . import bulk, ledger, search
+from .models import Share, Fare, FareSplit, FARE_TYPES
+from .pagination import FARE_ORDERING, SHARE_ORDERING
 
+# Admin for the big Share and Fare tables.
+#
+# Every changelist page costs the same few queries however many rows there
+# are: foreign keys shown in a column are joined (list_select_related),
+# related users and shares are picked through autocomplete widgets, which
+# only render the selected rows, and the filters and default ordering are
+# served by the indexes declared on the models. Counting the rows for the
+# paginator is the one thing that still grows with the table, so on Postgres
+# a large list shows the planner's row estimate instead of running COUNT(*).
+
+EXACT_COUNT_BELOW = 10000 # estimates under this are counted exactly, that stays cheap
+
+
+def estimated_count(queryset):
+    # the planner's row estimate for the queryset, None where there is no planner to ask
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate < EXACT_COUNT_BELOW:
+            return super().count
+        return estimate
+
+
+class FareActionForm(ActionForm):
+    category = forms.ChoiceField(choices=[('', '---------')] + FARE_TYPES, required=False)
+
+
+class FareSplitInline(admin.TabularInline):
+    # read-only, splits are allocated from the fare's amount and split method when the fare is saved
+    model = FareSplit
+    fields = readonly_fields = ('user', 'weight', 'amount')
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Share)
+class ShareAdmin(admin.ModelAdmin):
+    list_display = ('title', 'currency', 'creator', 'created_at')
+    list_select_related = ('creator',)
+    list_filter = ('currency', 'created_at') # share_currency_created_idx, share_created_idx
+    ordering = SHARE_ORDERING
+    search_fields = ('title',) # also used by the share autocomplete on fares
+    autocomplete_fields = ('creator', 'participants')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False # would count the whole table on every filtered page
+    actions = ('rebuild_ledgers',)
+
+    def delete_queryset(self, request, queryset):
+        with bulk.deleting_shares(queryset.values('pk')): # the bulk delete action, like Share.delete()
+            queryset.delete()
+
+    @admin.action(description="Rebuild ledger summaries of selected shares")
+    def rebuild_ledgers(self, request, queryset):
+        count = 0
+        for share in queryset.iterator():
+            ledger.rebuild_summary(share)
+            count += 1
+        self.message_user(request, f"Rebuilt the ledger summaries of {count} shares.")
+
+
+@admin.register(Fare)
+class FareAdmin(admin.ModelAdmin):
+    list_display = ('name', 'share', 'amount', 'date', 'category', 'paid_by')
+    list_select_related = ('share', 'paid_by')
+    list_filter = ('category', 'date') # fare_category_date_idx, fare_date_idx
+    ordering = FARE_ORDERING
+    search_fields = ('name',)
+    autocomplete_fields = ('share', 'paid_by')
+    inlines = (FareSplitInline,)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    action_form = FareActionForm
+    actions = ('set_category',)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search.ranked(queryset, search_term), False # the fare name search indexes on Postgres
+
+    @admin.action(description="Set category of selected fares")
+    def set_category(self, request, queryset):
+        category = request.POST.get('category')
+        if category not in dict(FARE_TYPES):
+            self.message_user(request, "Pick a category to set.", messages.WARNING)
+            return
+        share_ids = set(queryset.order_by().values_list('share_id', flat=True).distinct())
+        with transaction.atomic():
+            updated = Fare.objects.filter(pk__in=queryset.values('pk')).update(category=category) # one UPDATE, skips the ledger signals
+            for share in Share.objects.filter(pk__in=share_ids):
+                ledger.rebuild_summary(share)
+        self.message_user(request, f"Moved {updated} fares to {dict(FARE_TYPES)[category]}.")
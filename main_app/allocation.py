@@ -0,0 +1,102 @@
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+from fractions import Fraction
+
+from .models import Fare, FareSplit
+
+# Splits a fare's amount between its members in exact integer cents.
+#
+#   equal    every member gets the same share
+#   shares   weights are relative shares (2 = twice as much as 1)
+#   percent  weights are percentages and must add up to 100
+#   fixed    weights are amounts and must add up to the fare amount
+#
+# Proportional splits use largest-remainder rounding: everyone gets the
+# floor of their exact share, and the cents left over go to the largest
+# fractional parts, so the pieces always add back up to the fare total.
+# The result is stored on FareSplit.amount_cents once, at write time.
+# Forms, the CSV import and the batch API reject weights that don't fit.
+# A fare changed another way (the admin, a member removed from the split)
+# whose weights stop fitting becomes an equal split, logged and recorded
+# on the fare, so the stored split method always says how it was split.
+
+logger = logging.getLogger(__name__)
+
+
+class AllocationError(ValueError):
+    pass
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def largest_remainder(total_cents, weights):
+    weights = [Fraction(w) for w in weights]
+    total_weight = sum(weights)
+    if not weights or total_weight <= 0 or any(w < 0 for w in weights):
+        raise AllocationError("Weights must be zero or more and add up to more than zero.")
+
+    sign = -1 if total_cents < 0 else 1 # refunds are split the same way
+    total_cents = abs(total_cents)
+    quotas = [total_cents * w / total_weight for w in weights]
+    cents = [int(q) for q in quotas]
+    left_over = total_cents - sum(cents)
+    by_remainder = sorted(range(len(quotas)), key=lambda i: (-(quotas[i] - cents[i]), i))
+    for i in by_remainder[:left_over]:
+        cents[i] += 1
+    return [sign * c for c in cents]
+
+
+def allocate(total_cents, method, weights):
+    if not weights:
+        return []
+    if method == 'equal':
+        return largest_remainder(total_cents, [1] * len(weights))
+    if method == 'shares':
+        return largest_remainder(total_cents, weights)
+    if method == 'percent':
+        if sum(Decimal(w) for w in weights) != 100:
+            raise AllocationError("Percentages must add up to 100.")
+        return largest_remainder(total_cents, weights)
+    if method == 'fixed':
+        cents = [to_cents(w) for w in weights]
+        if sum(cents) != total_cents:
+            raise AllocationError("Fixed amounts must add up to the fare amount.")
+        return cents
+    raise AllocationError(f"Unknown split method {method!r}.")
+
+
+def allocate_rows(fare, rows):
+    # sets amount_cents on FareSplit rows, ordered by user so results are stable
+    rows = sorted(rows, key=lambda row: row.user_id)
+    total = to_cents(fare.amount)
+    method = fare.split_method
+    if method == 'fixed' and fare.original_amount is not None:
+        method = 'shares' # fixed amounts were entered in the paid currency, keep their proportions after conversion
+    try:
+        cents = allocate(total, method, [row.weight for row in rows])
+    except AllocationError as e: # weights that no longer fit (e.g. the amount changed)
+        logger.warning("Fare %s is split equally instead of %s: %s", fare.pk, fare.split_method, e)
+        fare.split_method = 'equal'
+        for row in rows:
+            row.weight = Decimal("1")
+        cents = allocate(total, 'equal', [row.weight for row in rows])
+    for row, amount in zip(rows, cents):
+        row.amount_cents = amount
+    return rows
+
+
+def allocate_fare(fare, weights=None):
+    # re-allocates a saved fare's split rows, optionally with new weights ({user_id: weight})
+    rows = list(FareSplit.objects.filter(fare=fare))
+    if weights is not None:
+        for row in rows:
+            row.weight = weights.get(row.user_id, row.weight)
+    method = fare.split_method
+    allocate_rows(fare, rows)
+    if fare.split_method != method: # fell back to an equal split, an UPDATE so the save signals don't run again
+        Fare.objects.filter(pk=fare.pk).update(split_method=fare.split_method)
+    FareSplit.objects.bulk_update(rows, ['weight', 'amount_cents'])
+    return rows
+
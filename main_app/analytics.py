@@ -0,0 +1,64 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from . import ledger
+from .models import DailyTotal
+
+# Spending over time, per share and per person.
+#
+# DailyTotal holds what each person paid in a share per day and category,
+# kept up to date by the same fare contribution deltas as the ledger rows
+# (ledger.apply_delta). A series is one GROUP BY over those rows truncated
+# to the day, week or month, so it costs as many rows as there are active
+# days and never reads the fares themselves. Share series are also cached
+# per share version like the ledger blocks, so a chart loads from the cache
+# until the next fare change.
+
+PERIODS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth} # weeks start on Monday
+GROUPS = {'category': 'category', 'paid_by': 'paid_by_id'}
+
+
+def grouped(rows, period, fields):
+    # [(period start, *fields, total, fare count)] in period order
+    return list(
+        rows.filter(fare_count__gt=0)
+        .annotate(period=PERIODS[period]('date'))
+        .values_list('period', *fields)
+        .annotate(sum_total=Sum('total'), sum_count=Sum('fare_count'))
+        .order_by('period', *fields)
+    )
+
+
+def build_series(rows):
+    # one point per period, with the total split by the group field
+    points = []
+    for start, key, total, fare_count in rows:
+        total = ledger.quantize(total) # SQLite sums decimals as floats
+        if not points or points[-1]["start"] != start:
+            points.append({"start": start, "total": Decimal("0"), "fare_count": 0, "parts": {}})
+        point = points[-1]
+        point["total"] += total
+        point["fare_count"] += fare_count
+        point["parts"][key] = total
+    return points
+
+
+def share_series(share, summary, period='month', by='category'):
+    key = f"spending:{ledger.cache_key(share, summary)}:{period}:{by}"
+    points = cache.get(key)
+    if points is None:
+        points = build_series(grouped(DailyTotal.objects.filter(share=share), period, [GROUPS[by]]))
+        cache.set(key, points, ledger.CACHE_SECONDS)
+    return points
+
+
+def user_series(user, period='month'):
+    # what the user paid across every share, by category, one series per share currency
+    series = {}
+    for start, currency, category, total, fare_count in grouped(
+            DailyTotal.objects.filter(paid_by=user), period, ['share__currency', 'category']):
+        series.setdefault(currency, []).append((start, category, total, fare_count))
+    return {currency: build_series(rows) for currency, rows in sorted(series.items())}
@@ -1,6 +1,13 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MainAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_app'
+
+    def ready(self):
+        from . import signals # noqa: F401 - connects the ledger signal handlers
+        os.makedirs(settings.FILE_UPLOAD_TEMP_DIR, exist_ok=True) # uploads stream there, see attachments.py
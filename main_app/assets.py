@@ -0,0 +1,108 @@
+import re
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test.utils import override_settings
+
+# Stylesheet bundles and static file caching.
+#
+# Every page used to load base.css and then its own stylesheet, two requests
+# of unminified CSS. manage.py build_css joins and minifies them into one
+# bundle per page in static/css/bundles/, which the templates link to from
+# their `stylesheet` block. The bundles are committed so a deploy only runs
+# collectstatic. Edit the sources in static/css and rebuild, the tests fail
+# while a bundle is out of date.
+#
+# In production the compressed manifest storage puts a content hash in every
+# collected file name and writes gzip and brotli copies next to it. WhiteNoise
+# serves hashed files as immutable and cacheable for years, so a repeat visit
+# loads no static bytes at all. manage.py check_static checks that for the
+# real pages with check_repeat_loads.
+
+STATIC_DIR = Path(__file__).resolve().parent / 'static'
+BUNDLE_DIR = 'css/bundles'
+BUNDLES = {
+    'base': ['css/base.css'],
+    'home': ['css/base.css', 'css/home.css'],
+    'about': ['css/base.css', 'css/about.css'],
+    'form': ['css/base.css', 'css/form.css'],
+    'confirm-delete': ['css/base.css', 'css/confirm-delete.css'],
+    'share-index': ['css/base.css', 'css/shares/share-index.css'],
+    'share-detail': ['css/base.css', 'css/shares/share-detail.css'],
+    'fare-detail': ['css/base.css', 'css/shares/fare-detail.css'],
+}
+MANIFEST_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+YEAR_SECONDS = 365 * 24 * 60 * 60
+
+
+def minify(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S) # comments
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r' ?([{};,>]) ?', r'\1', css) # not around + or ~, calc() needs those spaces
+    css = re.sub(r': ', ':', css) # only after the colon, " :hover" in a selector means something else
+    return css.replace(';}', '}').strip()
+
+
+def bundle(name):
+    return ''.join(minify((STATIC_DIR / source).read_text(encoding='utf-8')) for source in BUNDLES[name]) + '\n'
+
+
+def build(check=False):
+    # writes the bundles that changed and returns their names, check only reports them
+    changed = []
+    (STATIC_DIR / BUNDLE_DIR).mkdir(exist_ok=True)
+    for name in BUNDLES:
+        path = STATIC_DIR / BUNDLE_DIR / f'{name}.css'
+        css = bundle(name)
+        if not path.exists() or path.read_text(encoding='utf-8') != css:
+            changed.append(name)
+            if not check:
+                path.write_text(css, encoding='utf-8')
+    return changed
+
+
+@contextmanager
+def collected_static():
+    # collectstatic into a throwaway STATIC_ROOT with the production storage, served the way production serves it
+    with tempfile.TemporaryDirectory() as root:
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': MANIFEST_STORAGE}}
+        with override_settings(STATIC_ROOT=root, STORAGES=storages, DEBUG=False):
+            call_command('collectstatic', interactive=False, verbosity=0, ignore_patterns=['admin']) # the pages never load admin files
+            yield root
+
+
+def static_urls(html):
+    return re.findall(r'(?:href|src)="(%s[^"]+)"' % re.escape(settings.STATIC_URL), html)
+
+
+def max_age(cache_control):
+    match = re.search(r'max-age=(\d+)', cache_control)
+    return int(match.group(1)) if match else 0
+
+
+def check_repeat_loads(client, paths):
+    # every static file the pages use, what the first load costs and what a repeat load would
+    pages = {}
+    for path in paths:
+        response = client.get(path)
+        if response.status_code != 200:
+            raise ValueError(f"{path} returned {response.status_code}")
+        for url in static_urls(response.content.decode()):
+            pages.setdefault(url, path)
+
+    results = []
+    for url, page in sorted(pages.items()):
+        response = client.get(url, headers={'accept-encoding': 'br, gzip'})
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        cache_control = response.get('Cache-Control', '')
+        cached = response.status_code == 200 and 'immutable' in cache_control and max_age(cache_control) >= YEAR_SECONDS
+        results.append({
+            'url': url, 'page': page, 'status': response.status_code, 'bytes': len(body),
+            'encoding': response.get('Content-Encoding', 'identity'), 'cache_control': cache_control,
+            'repeat_bytes': 0 if cached else len(body), # a fresh immutable copy is not even revalidated
+        })
+    return results
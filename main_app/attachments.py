@@ -0,0 +1,166 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.http import FileResponse, Http404
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from PIL import Image, ImageOps
+
+from .models import Attachment
+
+# Receipts and photos on shares and fares.
+#
+# Uploads never sit in worker memory: the only upload handler is Django's
+# TemporaryFileUploadHandler, which streams every upload to FILE_UPLOAD_TEMP_DIR
+# in 64 KB chunks as it arrives. That directory is on the same disk as
+# MEDIA_ROOT (apps.py creates it), so saving the attachment is a rename.
+# The request does nothing else with the bytes, which keeps upload latency
+# the same whether the photo is 200 KB or 15 MB.
+#
+# The WebP thumbnail and preview are made afterwards by a small thread pool
+# in each worker process (THUMBNAIL_WORKERS, 0 makes them inline, which the
+# tests use). Pillow does its decoding and resizing outside the GIL, so the
+# threads do not hold up requests. A job that is lost when a worker restarts
+# leaves its attachment pending; manage.py process_attachments picks those up.
+#
+# Stored files never change, so they are served with a year of private caching.
+
+ALLOWED_TYPES = {
+    '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png',
+    '.webp': 'image/webp', '.gif': 'image/gif', '.pdf': 'application/pdf',
+}
+VARIANTS = {'preview': 1280, 'thumbnail': 256} # longest side in pixels, largest first
+VARIANT_FORMAT = ('WEBP', 'image/webp', '.webp')
+CACHE_SECONDS = 365 * 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def content_type(filename):
+    return ALLOWED_TYPES.get(Path(filename).suffix.lower())
+
+
+def attach(share, upload, user, fare=None):
+    attachment = Attachment.objects.create(
+        share=share, fare=fare, uploaded_by=user, file=upload, content_type=content_type(upload.name), size=upload.size)
+    transaction.on_commit(lambda: schedule(attachment.pk)) # the worker must be able to see the row
+    return attachment
+
+
+def for_share(share, fare=None):
+    # the fare's attachments, or the share's own ones (not those of its fares)
+    return list(Attachment.objects.filter(share=share, fare=fare).select_related('uploaded_by').order_by('created_at', 'id'))
+
+
+####
+# Thumbnail pipeline
+
+def executor():
+    # started on first use, so each gunicorn worker gets its own threads after the fork
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+        return _executor
+
+
+def schedule(attachment_id):
+    if settings.THUMBNAIL_WORKERS:
+        executor().submit(run_in_worker, attachment_id)
+    else:
+        process(attachment_id)
+
+
+def run_in_worker(attachment_id):
+    try:
+        process(attachment_id)
+    except Exception:
+        logger.exception("Processing attachment %s failed", attachment_id) # stays pending for process_attachments
+    finally:
+        connections.close_all() # the thread's own connections, they would otherwise stay open until it exits
+
+
+def wait():
+    # runs whatever is queued and stops the threads, the next schedule() starts new ones
+    global _executor
+    with _executor_lock:
+        pool, _executor = _executor, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def make_variants(attachment):
+    # {field: stored name}, each size is cut from the one before it
+    storage = attachment.file.storage
+    stem = os.path.splitext(attachment.file.name)[0]
+    image_format, _, extension = VARIANT_FORMAT
+    names = {}
+    with attachment.file.open('rb') as f, Image.open(f) as image:
+        largest = max(VARIANTS.values())
+        image.draft('RGB', (largest, largest)) # JPEGs decode straight at 1/2, 1/4 or 1/8 scale, most of the work for camera photos
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+        for field, size in VARIANTS.items():
+            image.thumbnail((size, size))
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, quality=80)
+            names[field] = storage.save(f"{stem}-{field}{extension}", ContentFile(buffer.getvalue()))
+    return names
+
+
+def process(attachment_id):
+    attachment = Attachment.objects.filter(pk=attachment_id, status='pending').first()
+    if attachment is None:
+        return # deleted, or already done
+    names, status = {}, 'ready'
+    if attachment.is_image:
+        try:
+            names = make_variants(attachment)
+        except (OSError, ValueError, Image.DecompressionBombError) as e: # not an image after all, truncated, or too many pixels
+            logger.warning("Attachment %s has no thumbnails: %s", attachment_id, e)
+            status = 'failed'
+    if not Attachment.objects.filter(pk=attachment_id).update(status=status, **names):
+        for name in names.values(): # deleted while it was processed
+            attachment.file.storage.delete(name)
+
+
+def pending_ids(older_than=timedelta(minutes=5)):
+    # attachments a worker should have finished by now
+    return list(Attachment.objects.filter(status='pending', created_at__lt=timezone.now() - older_than)
+                .order_by('pk').values_list('pk', flat=True))
+
+
+def delete_files(attachment):
+    for field in (attachment.file, attachment.thumbnail, attachment.preview):
+        if field:
+            field.storage.delete(field.name)
+
+
+####
+# Serving
+
+def file_response(attachment, variant):
+    if variant == 'original':
+        field, mime = attachment.file, attachment.content_type
+    elif variant in VARIANTS:
+        field, mime = getattr(attachment, variant), VARIANT_FORMAT[1]
+    else:
+        raise Http404("No such variant")
+    if not field:
+        raise Http404("Not processed yet") # not cached, the page shows a placeholder until then
+    response = FileResponse(
+        field.open('rb'), content_type=mime,
+        as_attachment=not mime.startswith('image/'), filename=Path(field.name).name) # PDFs download instead of opening inline
+    patch_cache_control(response, private=True, max_age=CACHE_SECONDS, immutable=True) # names are random, the bytes never change
+    return response
@@ -0,0 +1,190 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .allocation import allocate_rows
+from .bulk import participant_ids, clean_fare_fields, clean_weight, check_split, insert_fares, finish_bulk_write, deferred_ledger
+from .fx import MissingRate
+from .importer import CURRENCY_CODES
+from .models import Fare, FareSplit
+
+# Batch fare writes for one share (POST /api/shares/<pk>/fares/batch/).
+#
+# The body is {"operations": [...]}, each operation one of
+#   {"op": "create", "name", "amount", "date", "paid_by", ...}
+#   {"op": "update", "id", ...the fields to change}
+#   {"op": "delete", "id"}
+# with the optional fields category, split_method, currency (the amount
+# was paid in, converted to the share's currency) and split_between: user
+# ids, or {user id: weight} for weighted splits. Creates split between
+# everyone when split_between is left out, updates keep the current split.
+#
+# Every operation is validated first, against one participant lookup and
+# one query for the fares being changed. A batch with any invalid operation
+# changes nothing and reports each one's errors. Otherwise the whole batch
+# is written in one transaction with bulk inserts, one bulk update and
+# batched deletes, and the share's summary is rebuilt once at the end, so
+# 500 fares cost one request and a fixed number of queries.
+
+MAX_OPERATIONS = 1000
+OPERATIONS = ('create', 'update', 'delete')
+UPDATE_FIELDS = ['name', 'amount', 'date', 'category', 'paid_by', 'split_method', 'original_currency', 'original_amount']
+
+
+class BatchResult:
+    def __init__(self, size):
+        self.items = [{"index": i, "op": None, "id": None, "errors": []} for i in range(size)]
+        self.applied = False
+        self.version = None
+
+    @property
+    def error_count(self):
+        return sum(1 for item in self.items if item["errors"])
+
+    def as_json(self, share):
+        return {
+            "share_id": share.pk, "applied": self.applied, "version": self.version,
+            "error_count": self.error_count, "results": self.items,
+        }
+
+
+def is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def fare_values(operation, fare=None):
+    # the plain fields of the fare after the operation, the amount in the currency it was paid in
+    values = {}
+    if fare is not None:
+        values = {
+            'name': fare.name, 'date': fare.date, 'category': fare.category, 'split_method': fare.split_method,
+            'amount': fare.original_amount if fare.original_currency else fare.amount, 'currency': fare.original_currency,
+        }
+    values.update({k: v for k, v in operation.items() if k not in ('op', 'id', 'paid_by', 'split_between')})
+    if isinstance(values.get('amount'), float):
+        values['amount'] = str(values['amount']) # 12.1, not the float's 12.0999999999999996447...
+    return values
+
+
+def parse_split(value, members):
+    # {user id: weight} from a list of ids or an {id: weight} object
+    if isinstance(value, list):
+        value = {str(user_id): 1 for user_id in value}
+    if not isinstance(value, dict) or not value:
+        return None, ["split_between: give a list of participant ids or an {id: weight} object"]
+    weights, errors = {}, []
+    for user_id, weight in value.items():
+        try:
+            user_id = int(user_id) # JSON object keys are strings
+            weights[user_id] = clean_weight(str(weight)) # also rejects NaN, Infinity and too many digits
+        except (TypeError, ValueError, ValidationError):
+            errors.append(f"split_between: {user_id!r}: {weight!r} is not a weight")
+            continue
+        if user_id not in members:
+            errors.append(f"split_between: {user_id} is not a participant")
+    return weights, errors
+
+
+def build_fare(share, operation, members, fare=None, weights=None):
+    # (fare with the changes applied, {user id: weight}, errors); fare and weights are the current ones for updates
+    values = fare_values(operation, fare)
+    currency = str(values.pop('currency', '') or '').upper()
+    cleaned, errors = clean_fare_fields(values)
+    if currency and currency not in CURRENCY_CODES:
+        errors.append(f"currency: {currency!r} is not supported")
+
+    paid_by = operation.get('paid_by', fare.paid_by_id if fare else None)
+    if not is_id(paid_by) or paid_by not in members:
+        errors.append(f"paid_by: {paid_by!r} is not a participant")
+
+    if 'split_between' in operation:
+        weights, split_errors = parse_split(operation['split_between'], members)
+        errors.extend(split_errors)
+    elif weights is None:
+        weights = {user_id: Decimal("1") for user_id in members} # everyone, like the CSV import
+    if errors:
+        return None, None, errors
+
+    if fare is None:
+        fare = Fare(share=share)
+    for name, value in cleaned.items():
+        setattr(fare, name, value)
+    fare.paid_by_id = paid_by
+    fare.original_currency, fare.original_amount = currency, cleaned['amount']
+    try:
+        fare.convert_original_amount(share.currency) # rates are cached per date
+    except MissingRate as e:
+        return None, None, [f"currency: {e}"]
+    split_error = check_split(fare, weights)
+    if split_error:
+        return None, None, [split_error]
+    return fare, weights, []
+
+
+def apply_operations(share, operations):
+    # a list of at most MAX_OPERATIONS operations, the view checks that
+    result = BatchResult(len(operations))
+    members = set(participant_ids(share).values()) # the only lookup needed to validate every payer and split
+    ids = [op.get('id') for op in operations if isinstance(op, dict) and op.get('op') in ('update', 'delete')]
+    existing = Fare.objects.filter(share=share, pk__in=[i for i in ids if is_id(i)]).in_bulk() # every fare the batch changes
+    current_weights = {}
+    update_ids = [op['id'] for op in operations if isinstance(op, dict) and op.get('op') == 'update' and is_id(op.get('id'))]
+    for fare_id, user_id, weight in FareSplit.objects.filter(fare_id__in=update_ids).values_list('fare_id', 'user_id', 'weight'):
+        current_weights.setdefault(fare_id, {})[user_id] = weight
+
+    created, updated, deleted = [], [], []
+    seen = set()
+    for item, operation in zip(result.items, operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            item["errors"].append(f"op: must be one of {', '.join(OPERATIONS)}")
+            continue
+        item["op"] = op = operation['op']
+        if op == 'create':
+            fare, weights, errors = build_fare(share, operation, members)
+            item["errors"].extend(errors)
+            created.append((item, fare, weights))
+            continue
+
+        fare_id = item["id"] = operation.get('id')
+        if not is_id(fare_id) or fare_id not in existing:
+            item["errors"].append(f"id: no fare {fare_id!r} in this share")
+            continue
+        if fare_id in seen:
+            item["errors"].append(f"id: fare {fare_id} is already changed by another operation")
+        elif op == 'delete':
+            deleted.append(existing[fare_id])
+        else:
+            before = existing[fare_id].amount
+            fare, weights, errors = build_fare(share, operation, members, existing[fare_id], current_weights.get(fare_id, {}))
+            item["errors"].extend(errors)
+            updated.append((fare, weights, before))
+        seen.add(fare_id)
+
+    if result.error_count:
+        return result
+
+    with transaction.atomic(), deferred_ledger():
+        if deleted:
+            Fare.objects.filter(pk__in=[fare.pk for fare in deleted]).delete() # splits and attachments cascade
+        if updated:
+            fares = [fare for fare, weights, before in updated]
+            Fare.objects.bulk_update(fares, UPDATE_FIELDS)
+            FareSplit.objects.filter(fare__in=fares).delete()
+            rows = []
+            for fare, weights, before in updated:
+                rows.extend(allocate_rows(fare, [FareSplit(fare_id=fare.pk, user_id=u, weight=w) for u, w in weights.items()]))
+            FareSplit.objects.bulk_create(rows)
+        if created:
+            fares = insert_fares([fare for item, fare, weights in created], [weights for item, fare, weights in created])
+            for (item, _, _), fare in zip(created, fares):
+                item["id"] = fare.pk
+        expenses = (
+            sum((fare.amount for item, fare, weights in created), Decimal("0"))
+            + sum((fare.amount - before for fare, weights, before in updated), Decimal("0"))
+            - sum((fare.amount for fare in deleted), Decimal("0"))
+        )
+        summary = finish_bulk_write(share, len(created) - len(deleted), expenses)
+    result.applied = True
+    result.version = summary.version
+    return result
@@ -0,0 +1,244 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.client import encode_multipart
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import attachments
+from .models import Share, Fare, Attachment
+
+# View benchmarks (manage.py bench_views).
+# Each view is requested through the Django test client as the busiest
+# participant of the busiest share, timing every request and counting its
+# queries. Everything runs in one transaction that is rolled back at the
+# end, so the POSTs (create, update, delete) leave the database untouched.
+#
+# BUDGETS holds the p95 latency (ms) and the most queries a single request
+# may take. Query counts must not depend on how much data a share holds,
+# so those budgets are tight; latency ones leave room for slow machines.
+#
+# upload_latency (manage.py bench_uploads) posts photos of growing size to
+# a fare, with the thumbnails made by the background workers and then inline.
+#
+# load_test drives a real server over HTTP instead (manage.py bench_servers
+# uses it to compare the WSGI and ASGI deployments under concurrency).
+
+BUDGETS = {
+    'home': (50, 4),
+    'share-index': (100, 4),
+    'share-detail': (150, 6), # ledger blocks come from the cache after the first view
+    'fare-create': (100, 4), # the share with its membership check, then its participants
+    'fare-create post': (200, 25), # the fare, its splits, the ledger deltas and the site counters, in one transaction
+    'fare-update': (100, 6),
+    'fare-update post': (200, 23),
+    'fare-delete post': (150, 19), # one more to collect the fare's attachments
+    'fare-batch post': (1000, 50), # BATCH_SIZE fares in one request; SQLite cuts bulk inserts into 999-parameter batches, Postgres sends one each
+}
+BATCH_SIZE = 500
+
+
+class BenchmarkTarget:
+    # the user, share and fare every request is made with
+    def __init__(self, share=None):
+        if share is None:
+            share = Share.objects.annotate(fares=Count('fare')).order_by('-fares', 'pk').first()
+        self.share = share
+        self.user = share.creator
+        self.members = list(share.participants.values_list('pk', flat=True))
+        self.fare = share.fare_set.order_by('-date', '-id').first()
+
+    def fare_data(self, name):
+        return {
+            'name': name, 'amount': '42.00', 'original_currency': '', 'date': '2025-06-01',
+            'category': 'food_drink', 'paid_by': self.user.pk, 'split_between': self.members, 'split_method': 'equal',
+        }
+
+    def batch_body(self, size):
+        operations = [
+            {'op': 'create', 'name': f'Bench batch {i}', 'amount': '12.50', 'date': '2025-06-01', 'paid_by': self.user.pk}
+            for i in range(size)
+        ]
+        return json.dumps({'operations': operations})
+
+    def throwaway_fare(self):
+        fare = Fare.objects.create(share=self.share, name='Bench', amount=10, date=date(2025, 6, 1), paid_by=self.user)
+        fare.split_between.set(self.members)
+        return fare
+
+
+def bench_requests(target):
+    # view name -> function returning (method, url, data[, client options]), called before each timed request
+    share_id = target.share.pk
+    fare_urls = lambda name, fare: reverse(name, kwargs={'share_id': share_id, 'pk': fare.pk})
+    return {
+        'home': lambda: ('get', reverse('home'), None),
+        'share-index': lambda: ('get', reverse('share-index'), None),
+        'share-detail': lambda: ('get', reverse('share-detail', kwargs={'pk': share_id}), None),
+        'fare-create': lambda: ('get', reverse('fare-create', kwargs={'share_id': share_id}), None),
+        'fare-create post': lambda: ('post', reverse('fare-create', kwargs={'share_id': share_id}), target.fare_data('Bench dinner')),
+        'fare-update': lambda: ('get', fare_urls('fare-update', target.fare), None),
+        'fare-update post': lambda: ('post', fare_urls('fare-update', target.fare), target.fare_data('Bench update')),
+        'fare-delete post': lambda: ('post', fare_urls('fare-delete', target.throwaway_fare()), None),
+        'fare-batch post': lambda: ('post', reverse('api-share-fares-batch', kwargs={'pk': share_id}),
+                                    target.batch_body(BATCH_SIZE), {'content_type': 'application/json'}),
+    }
+
+
+def percentile(timings, p):
+    # nearest-rank percentile of a non-empty list
+    ordered = sorted(timings)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))]
+
+
+def run(views=None, repeat=20, budgets=None, share=None):
+    budgets = {**BUDGETS, **(budgets or {})}
+    results = []
+    with transaction.atomic():
+        target = BenchmarkTarget(share)
+        client = Client()
+        client.force_login(target.user)
+        for name, make_request in bench_requests(target).items():
+            if views and name not in views:
+                continue
+            timings, queries, statuses = [], [], set()
+            for i in range(repeat + 1):
+                method, url, data, *options = make_request()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = getattr(client, method)(url, data, **(options[0] if options else {}))
+                    elapsed = (time.perf_counter() - start) * 1000
+                statuses.add(response.status_code)
+                if i: # the first request warms up templates and caches
+                    timings.append(elapsed)
+                    queries.append(len(captured))
+
+            p95_budget, query_budget = budgets.get(name, (None, None))
+            result = {
+                'view': name, 'p50': percentile(timings, 50), 'p95': percentile(timings, 95), 'p99': percentile(timings, 99),
+                'queries': max(queries), 'statuses': sorted(statuses), 'p95_budget': p95_budget, 'query_budget': query_budget,
+            }
+            result['problems'] = problems(result)
+            results.append(result)
+        transaction.set_rollback(True)
+    return results
+
+
+def problems(result):
+    found = []
+    if any(status not in (200, 302) for status in result['statuses']):
+        found.append(f"returned {result['statuses']}")
+    if result['p95_budget'] is not None and result['p95'] > result['p95_budget']:
+        found.append(f"p95 {result['p95']:.1f}ms is over {result['p95_budget']}ms")
+    if result['query_budget'] is not None and result['queries'] > result['query_budget']:
+        found.append(f"{result['queries']} queries is over {result['query_budget']}")
+    return found
+
+
+UPLOAD_SIZES = {'small': (800, 600), 'medium': (2000, 1500), 'large': (4000, 3000)} # the large one is a 12 MP camera photo
+UPLOAD_MS_PER_MB = 5 # with deferred thumbnails an upload only costs receiving its bytes, a few ms per MB
+BOUNDARY = 'BenchBoundary'
+
+
+def noise_jpeg(width, height):
+    # random pixels barely compress, about as many bytes as a real photo of that size
+    image = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def upload_latency(share=None, repeat=10, sizes=UPLOAD_SIZES):
+    # [{'mode', 'size', 'bytes', 'p50', 'p95'}] for deferred and inline thumbnails
+    # the bodies are encoded up front and the background work runs between requests, so only the upload is timed
+    target = BenchmarkTarget(share)
+    client = Client()
+    client.force_login(target.user)
+    url = reverse('fare-attachments', kwargs={'share_id': target.share.pk, 'pk': target.fare.pk})
+    bodies = {
+        name: encode_multipart(BOUNDARY, {'file': SimpleUploadedFile(f'{name}.jpg', noise_jpeg(*size), 'image/jpeg')})
+        for name, size in sizes.items()
+    }
+    results = []
+    began = timezone.now()
+    with tempfile.TemporaryDirectory() as media:
+        for mode, workers in (('deferred', settings.THUMBNAIL_WORKERS or 2), ('inline', 0)):
+            with override_settings(MEDIA_ROOT=media, FILE_UPLOAD_TEMP_DIR=media, THUMBNAIL_WORKERS=workers):
+                for name, body in bodies.items():
+                    timings = []
+                    for i in range(repeat + 1):
+                        start = time.perf_counter()
+                        response = client.post(url, body, content_type=f'multipart/form-data; boundary={BOUNDARY}')
+                        elapsed = (time.perf_counter() - start) * 1000
+                        attachments.wait() # the thumbnails, so they do not share the CPU with the next upload
+                        if response.status_code != 302:
+                            raise ValueError(f"Upload returned {response.status_code}")
+                        if i: # the first request warms up
+                            timings.append(elapsed)
+                    results.append({'mode': mode, 'size': name, 'bytes': len(body), 'p50': percentile(timings, 50), 'p95': percentile(timings, 95)})
+                Attachment.objects.filter(fare=target.fare, created_at__gte=began).delete() # while MEDIA_ROOT still points at the temporary one
+    return results
+
+
+def ms_per_mb(results, mode):
+    # how much longer an upload takes per extra MB, from the smallest to the largest
+    rows = [r for r in results if r['mode'] == mode]
+    smallest, largest = min(rows, key=lambda r: r['bytes']), max(rows, key=lambda r: r['bytes'])
+    return (largest['p50'] - smallest['p50']) / ((largest['bytes'] - smallest['bytes']) / 1e6)
+
+
+def upload_problems(results):
+    slope = ms_per_mb(results, 'deferred')
+    if slope > UPLOAD_MS_PER_MB:
+        return [f"deferred uploads take {slope:.1f}ms more per MB, over {UPLOAD_MS_PER_MB}ms"]
+    return []
+
+
+def load_test(base_url, paths, cookie, concurrency=10, total=500, timeout=30):
+    # hammers a running server with `concurrency` clients until `total` requests are done, paths round robin
+    latencies, errors = [], []
+    counter = iter(range(total))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            request = urllib.request.Request(base_url + paths[i % len(paths)], headers={'Cookie': cookie})
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+            except (OSError, urllib.error.HTTPError) as e:
+                errors.append(str(e))
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': len(latencies), 'errors': len(errors), 'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50) if latencies else None,
+        'p95': percentile(latencies, 95) if latencies else None,
+        'p99': percentile(latencies, 99) if latencies else None,
+    }
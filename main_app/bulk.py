@@ -0,0 +1,111 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Sum
+
+from . import counters, ledger
+from .allocation import allocate, allocate_rows, to_cents, AllocationError
+from .models import Share, Fare, FareSplit, ShareSummary
+
+# Helpers shared by the bulk fare writers (CSV import, batch API).
+# bulk_create skips model signals, so these writers validate rows against
+# one participant lookup, insert fares and split rows in batches and then
+# refresh the share's summary once at the end. Saves and deletes do send
+# signals, so they run inside deferred_ledger(), which the Fare handlers
+# leave alone.
+# Share deletes use it too (deleting_shares), their summaries go with them.
+
+FARE_FIELDS = ('name', 'amount', 'date', 'category', 'split_method')
+
+_ledger_deferred = ContextVar('ledger_deferred', default=False)
+
+
+def participant_ids(share):
+    return dict(share.participants.values_list('username', 'id')) # 1 query, username -> id
+
+
+def clean_fare_fields(values):
+    # validates the plain Fare columns with the model's own field rules, no queries
+    cleaned = {}
+    errors = []
+    for name in FARE_FIELDS:
+        field = Fare._meta.get_field(name)
+        value = values.get(name)
+        if value in (None, '') and field.has_default():
+            cleaned[name] = field.get_default()
+            continue
+        try:
+            cleaned[name] = field.clean(value, None)
+        except ValidationError as e:
+            errors.append(f"{name}: {' '.join(e.messages)}")
+        except TypeError: # a JSON number or object where the field parses strings, e.g. {"date": 20250101}
+            errors.append(f"{name}: {value!r} is not a valid value")
+    return cleaned, errors
+
+
+def clean_weight(value):
+    # a split weight as FareSplit.weight stores it, NaN, Infinity and too many digits raise ValidationError
+    return FareSplit._meta.get_field('weight').clean(value, None)
+
+
+@contextmanager
+def deferred_ledger():
+    # the Fare save and delete signals skip their per-fare ledger work, the writer updates the ledger itself
+    token = _ledger_deferred.set(True)
+    try:
+        yield
+    finally:
+        _ledger_deferred.reset(token)
+
+
+def ledger_deferred():
+    return _ledger_deferred.get()
+
+
+@contextmanager
+def deleting_shares(shares):
+    # wraps a delete of the shares (a queryset or ids): their fares cascade without per-fare ledger
+    # work, as the summary rows are deleted with them, and the site counters drop once per currency
+    with transaction.atomic(), deferred_ledger():
+        for share in Share.objects.filter(pk__in=shares, summary__isnull=True):
+            ledger.rebuild_summary(share) # shares never viewed since before summaries existed
+        removed = list(
+            ShareSummary.objects.filter(share__in=shares).values('share__currency')
+            .annotate(fares=Sum('fare_count'), expenses=Sum('total_expenses')).order_by()
+        )
+        yield
+        for row in removed:
+            counters.bump(fares=-row['fares'])
+            counters.bump_expenses(row['share__currency'], -row['expenses'])
+
+
+def insert_fares(fares, splits, batch_size=None):
+    # fares: unsaved Fare objects, splits: {member id: weight} per fare
+    created = Fare.objects.bulk_create(fares, batch_size=batch_size)
+    rows = []
+    for fare, weights in zip(created, splits):
+        rows.extend(allocate_rows(fare, [FareSplit(fare_id=fare.pk, user_id=u, weight=w) for u, w in weights.items()]))
+    FareSplit.objects.bulk_create(rows, batch_size=batch_size)
+    return created
+
+
+def finish_bulk_write(share, fares_added=0, expenses_added=Decimal("0")):
+    summary = ledger.rebuild_summary(share) # one pass over the share instead of per-row signal work
+    counters.bump(fares=fares_added)
+    counters.bump_expenses(share.currency, expenses_added)
+    return summary
+
+
+def check_split(fare, weights):
+    # the error message for a split that cannot be allocated, or None
+    amount = fare.amount
+    if fare.split_method == 'fixed' and fare.original_amount is not None:
+        amount = fare.original_amount # fixed amounts are in the paid currency, like FareForm.clean and allocate_rows
+    try:
+        allocate(to_cents(amount), fare.split_method, list(weights.values()))
+    except AllocationError as e:
+        return f"split_between: {e}"
+    return None
@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, F, Sum
+
+from . import fx
+from .models import Share, Fare, SiteCounter, CURRENCIES
+
+# Site-wide totals shown on the Home page.
+# Kept as a few SiteCounter rows that signal handlers adjust with F()
+# updates, so the landing page reads a handful of rows however much data
+# exists. Missing rows are rebuilt from database aggregates on first read.
+#
+# Expenses are counted per currency ("expenses:EUR") and only converted
+# to the base currency when displayed, one conversion per currency.
+
+CURRENCY_CODES = [code for code, label in CURRENCIES]
+COUNTERS = ("shares", "fares", *(f"expenses:{code}" for code in CURRENCY_CODES))
+
+
+def compute():
+    values = {name: Decimal("0") for name in COUNTERS}
+    values["shares"] = Decimal(Share.objects.count())
+    for row in Fare.objects.values('share__currency').annotate(fares=Count('id'), expenses=Sum('amount')): # 1 GROUP BY query
+        values["fares"] += row["fares"]
+        values[f"expenses:{row['share__currency']}"] = row["expenses"] or Decimal("0")
+    return values
+
+
+def rebuild():
+    values = compute()
+    for name, value in values.items():
+        SiteCounter.objects.update_or_create(name=name, defaults={"value": value})
+    SiteCounter.objects.exclude(name__in=COUNTERS).delete()
+    return values
+
+
+def bump(**deltas):
+    # only adjusts existing rows, a missing counter is rebuilt from aggregates on the next read
+    for name, delta in deltas.items():
+        if delta:
+            SiteCounter.objects.filter(name=name).update(value=F('value') + delta)
+
+
+def bump_expenses(currency, delta):
+    bump(**{f"expenses:{currency}": delta})
+
+
+def record_fare_change(before, after):
+    # before / after are ledger.fare_contribution() results
+    bump(fares=(1 if after else 0) - (1 if before else 0))
+    if before:
+        bump_expenses(before["currency"], -before["total"])
+    if after:
+        bump_expenses(after["currency"], after["total"])
+
+
+def home_metrics():
+    values = dict(SiteCounter.objects.filter(name__in=COUNTERS).values_list('name', 'value'))
+    if len(values) < len(COUNTERS):
+        values = rebuild()
+    return metrics(values)
+
+
+async def ahome_metrics():
+    values = {name: value async for name, value in SiteCounter.objects.filter(name__in=COUNTERS).values_list('name', 'value')}
+    if len(values) < len(COUNTERS) or not fx.rates_cached(): # a counter rebuild or the first rate table read, both rare
+        return await sync_to_async(home_metrics)()
+    return metrics(values)
+
+
+def metrics(values):
+    by_currency = {code: values[f"expenses:{code}"] for code in CURRENCY_CODES}
+    try:
+        total = fx.convert_totals(by_currency) # in fx.BASE_CURRENCY
+    except fx.MissingRate: # the page shows each currency's total instead of failing
+        total = None
+    return {
+        "total_shares": int(values["shares"]),
+        "total_fares": int(values["fares"]),
+        "total_expenses": total,
+        "expenses_by_currency": by_currency,
+    }
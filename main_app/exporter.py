@@ -0,0 +1,101 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .ledger import summary_context, cents_to_amount
+from .models import FareSplit
+
+# Streaming exports of a share's fares and balances.
+# Fares are read with .iterator(chunk_size=...) and written out as they
+# arrive, so the first bytes leave immediately and worker memory only ever
+# holds one chunk. The fare columns match the CSV importer's format.
+# CSV text cells that a spreadsheet would run as a formula get a leading
+# quote, which the importer takes off again.
+
+CHUNK_SIZE = 500
+FARE_COLUMNS = ['id', 'name', 'amount', 'date', 'category', 'paid_by', 'split_method', 'split_between', 'currency']
+BALANCE_COLUMNS = ['participant', 'paid', 'owes', 'net']
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r', "'") # the quote too, so a name starting with one survives a round trip
+
+
+def spreadsheet_safe(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def unescape_cell(value):
+    # the importer's side of spreadsheet_safe
+    if value.startswith("'") and value[1:].startswith(FORMULA_PREFIXES):
+        return value[1:]
+    return value
+
+
+class Echo:
+    # csv.writer needs a file, this one just hands each line back to the generator
+    def write(self, value):
+        return value
+
+
+def iter_fares(share, chunk_size=CHUNK_SIZE):
+    fares = (
+        share.fare_set
+        .select_related('paid_by')
+        .prefetch_related(Prefetch('faresplit_set', queryset=FareSplit.objects.select_related('user'))) # one query per chunk
+        .order_by('date', 'id')
+    )
+    for fare in fares.iterator(chunk_size=chunk_size):
+        splits = sorted(fare.faresplit_set.all(), key=lambda split: split.user.username)
+        yield {
+            'id': fare.pk,
+            'name': fare.name,
+            'amount': fare.amount,
+            'date': fare.date,
+            'category': fare.category,
+            'paid_by': fare.paid_by.username,
+            'split_method': fare.split_method,
+            'currency': fare.original_currency, # blank for the share's currency
+            'original_amount': fare.original_amount, # as paid, fixed split weights are in this currency
+            'split_between': [
+                {'username': split.user.username, 'weight': split.weight, 'amount': cents_to_amount(split.amount_cents)}
+                for split in splits
+            ],
+        }
+
+
+def iter_balances(share, user):
+    for b in summary_context(share, user)["balances"]:
+        yield {'participant': b["participant"].username, 'paid': b["paid"], 'owes': b["owes"], 'net': b["net"]}
+
+
+def stream_csv(share, user, section='fares'):
+    writer = csv.writer(Echo())
+    if section == 'balances':
+        yield writer.writerow(BALANCE_COLUMNS)
+        for row in iter_balances(share, user):
+            yield writer.writerow([spreadsheet_safe(row[c]) for c in BALANCE_COLUMNS])
+        return
+
+    yield writer.writerow(FARE_COLUMNS)
+    for row in iter_fares(share):
+        if row['currency']: # the importer reads the amount as paid and converts it again
+            row['amount'] = row['original_amount']
+        if row['split_method'] == 'equal':
+            row['split_between'] = ';'.join(split['username'] for split in row['split_between'])
+        else: # same "username:weight" form the importer reads
+            row['split_between'] = ';'.join(f"{split['username']}:{split['weight']}" for split in row['split_between'])
+        yield writer.writerow([spreadsheet_safe(row[c]) for c in FARE_COLUMNS])
+
+
+def stream_json(share, user):
+    encode = DjangoJSONEncoder().encode
+    header = {'id': share.pk, 'title': share.title, 'currency': share.currency}
+    yield '{"share": ' + encode(header)
+    yield ', "balances": ' + encode(list(iter_balances(share, user)))
+    yield ', "fares": ['
+    separator = ''
+    for row in iter_fares(share):
+        yield separator + encode(row)
+        separator = ', '
+    yield ']}\n'
@@ -1,11 +1,116 @@
+from decimal import Decimal
+
 from django import forms 
-from .models import Fare
+from django.forms.models import ModelChoiceIterator
+from django.conf import settings
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+from django.urls import reverse_lazy
+from .models import Share, Fare, FareSplit, FARE_TYPES
+from . import counters, ledger
+from .allocation import allocate, allocate_rows, to_cents, AllocationError
+from .bulk import deferred_ledger
+from .attachments import ALLOWED_TYPES, content_type
 from django.contrib.auth import get_user_model
 
+class ParticipantChoiceIterator(ModelChoiceIterator):
+    # choices from the participant list the form was given, instead of one query per field
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for participant in self.field.participants:
+            yield self.choice(participant)
+
+    def __len__(self):
+        return len(self.field.participants) + (self.field.empty_label is not None)
+
+
+class UserAutocompleteWidget(forms.SelectMultiple):
+    # only the chosen users are rendered, people are added by searching usernames (js/participant-picker.js)
+    template_name = 'widgets/user_autocomplete.html'
+
+    class Media:
+        js = [forms.Script('js/participant-picker.js', defer=True)]
+
+    def __init__(self, attrs=None):
+        super().__init__({'data-autocomplete-url': reverse_lazy('api-users'), **(attrs or {})})
+
+    def optgroups(self, name, value, attrs=None):
+        ids = [v for v in value if str(v).isdigit()]
+        users = get_user_model().objects.filter(pk__in=ids).only('id', 'username').order_by('username') if ids else []
+        return [(None, [self.create_option(name, user.pk, user.username, True, i, attrs=attrs)], i) for i, user in enumerate(users)]
+
+
+class ShareForm(forms.ModelForm):
+    participants = forms.ModelMultipleChoiceField( # validates the submitted ids in one query, whatever the number of users
+        queryset=get_user_model().objects.filter(is_active=True), widget=UserAutocompleteWidget, required=False)
+
+    class Meta:
+        model = Share
+        fields = ['title', 'currency', 'participants']
+
+
 class FareForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['original_currency'].choices = [('', 'Share currency')] + self.fields['original_currency'].choices[1:]
+        if self.instance.original_amount is not None: # edit the amount as it was paid, not the converted one
+            self.initial['amount'] = self.instance.original_amount
+        self.split_weights = {}
+
+    def set_participants(self, participants): # limit payer / split fields to the Share's participants, one weight box each
+        for name in ('paid_by', 'split_between'):
+            field = self.fields[name]
+            field.participants = participants
+            field.iterator = ParticipantChoiceIterator # before the queryset, which builds the widget's choices
+            field.queryset = get_user_model().objects.filter(pk__in=[p.pk for p in participants]) # only queried to validate a POST
+        current = {}
+        if self.instance.pk:
+            current = dict(FareSplit.objects.filter(fare=self.instance).values_list('user_id', 'weight'))
+        for p in participants:
+            self.fields[f'weight_{p.pk}'] = forms.DecimalField(
+                label=f'{p.username} weight', required=False, min_value=0, max_digits=10, decimal_places=2,
+                initial=current.get(p.pk),
+                help_text='Shares, percent or amount, depending on how the fare is split',
+            )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        self.instance.original_amount = cleaned_data.get('amount') if cleaned_data.get('original_currency') else None # converted in Fare.save()
+
+        method = cleaned_data.get('split_method')
+        members = cleaned_data.get('split_between')
+        amount = cleaned_data.get('amount')
+        if method and members and amount is not None:
+            default = Decimal("1") if method in ('equal', 'shares') else None
+            weights = {u.pk: cleaned_data.get(f'weight_{u.pk}') for u in members}
+            self.split_weights = {pk: weight if weight is not None else default for pk, weight in weights.items()} # 0 is a weight
+            if None in self.split_weights.values():
+                raise forms.ValidationError('Enter a weight for everyone the fare is split between.')
+            try:
+                allocate(to_cents(amount), method, list(self.split_weights.values()))
+            except AllocationError as e:
+                raise forms.ValidationError(str(e))
+        return cleaned_data
+
+    def save(self, commit=True):
+        fare = super().save(commit=False) # split_between is written below as FareSplit rows with their weights
+        if not commit:
+            return fare
+        with transaction.atomic(), deferred_ledger(): # the fare, its splits, the ledger and the counters together
+            before = ledger.fare_contribution(fare.pk) if fare.pk else None
+            fare.save()
+            rows = allocate_rows(fare, [FareSplit(fare=fare, user_id=u, weight=w) for u, w in self.split_weights.items()])
+            FareSplit.objects.filter(fare=fare).delete()
+            FareSplit.objects.bulk_create(rows) # everyone's exact cents
+            after = ledger.fare_contribution(fare.pk)
+            ledger.apply_change(before, after) # once, one version bump
+            counters.record_fare_change(before, after)
+        return fare
+
     class Meta:
         model = Fare
-        fields = ['name', 'amount', 'date', 'category', 'paid_by', 'split_between']
+        fields = ['name', 'amount', 'original_currency', 'date', 'category', 'paid_by', 'split_between', 'split_method']
         widgets = {
             'date': forms.DateInput(
                 format=('%Y-%m-%d'),
@@ -14,4 +119,35 @@ class FareForm(forms.ModelForm):
                     'type': 'date'
                 }
             ),
-        }
\ No newline at end of file
+        }
+
+class FareImportForm(forms.Form):
+    file = forms.FileField(
+        label='CSV file',
+        help_text='Columns: name, amount, date (YYYY-MM-DD), category, paid_by, split_between (usernames separated by ";", empty for everyone)',
+    )
+
+
+class AttachmentForm(forms.Form):
+    file = forms.FileField(label='Receipt or photo', help_text='JPEG, PNG, WebP, GIF or PDF')
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if content_type(upload.name) is None:
+            raise forms.ValidationError(f"Upload one of {', '.join(sorted(ALLOWED_TYPES))}.")
+        if upload.size > settings.ATTACHMENT_MAX_BYTES: # already on disk, not in memory, see settings.FILE_UPLOAD_HANDLERS
+            raise forms.ValidationError(f"Files can be up to {filesizeformat(settings.ATTACHMENT_MAX_BYTES)}.")
+        return upload
+
+
+class FareSearchForm(forms.Form):
+    q = forms.CharField(label='Search', max_length=100, required=False)
+    category = forms.ChoiceField(choices=[('', 'Any category')] + FARE_TYPES, required=False)
+    paid_by = forms.ModelChoiceField(queryset=get_user_model().objects.none(), empty_label='Anyone', required=False)
+    min_amount = forms.DecimalField(label='From amount', min_value=0, decimal_places=2, required=False)
+    max_amount = forms.DecimalField(label='To amount', min_value=0, decimal_places=2, required=False)
+
+    def __init__(self, *args, share_ids=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['paid_by'].queryset = ( # people the user shares with
+            get_user_model().objects.filter(shares_participating__in=share_ids).distinct().only('id', 'username').order_by('username'))
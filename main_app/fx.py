@@ -0,0 +1,84 @@
+import csv
+from bisect import bisect_right
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from pathlib import Path
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import FxRate
+
+# Currency conversion from the local FxRate table.
+# The whole table is small (one row per currency per day), so it is read
+# once per process and the rates for each date are cached, which keeps
+# bulk conversions at zero queries after the first one.
+# Dates before the first loaded rate use the earliest rate available.
+
+BASE_CURRENCY = 'USD'
+DEFAULT_RATES_FILE = Path(__file__).resolve().parent / 'fixtures' / 'fx_rates.csv'
+CENTS = Decimal("0.01")
+
+
+class MissingRate(Exception):
+    pass
+
+
+@lru_cache(maxsize=1)
+def rate_table():
+    table = {}
+    for currency, day, rate in FxRate.objects.order_by('currency', 'date').values_list('currency', 'date', 'usd_rate'):
+        days, rates = table.setdefault(currency, ([], []))
+        days.append(day)
+        rates.append(rate)
+    return table
+
+
+@lru_cache(maxsize=1024)
+def rates_on(day):
+    rates = {BASE_CURRENCY: Decimal("1")}
+    for currency, (days, values) in rate_table().items():
+        index = bisect_right(days, day) - 1
+        rates[currency] = values[max(index, 0)]
+    return rates
+
+
+def rates_cached():
+    # True once this process has read the rate table, conversions then run no queries
+    return rate_table.cache_info().currsize > 0
+
+
+def clear_cache():
+    rate_table.cache_clear()
+    rates_on.cache_clear()
+
+
+def convert(amount, from_currency, to_currency, day=None):
+    if from_currency == to_currency:
+        return amount
+    rates = rates_on(day or timezone.localdate())
+    try:
+        usd = amount * rates[from_currency]
+        return (usd / rates[to_currency]).quantize(CENTS, rounding=ROUND_HALF_UP)
+    except KeyError as e:
+        raise MissingRate(f"No exchange rate loaded for {e.args[0]}")
+
+
+def convert_totals(totals, to_currency=BASE_CURRENCY, day=None):
+    # totals: {currency: amount}, e.g. per-currency sums from a GROUP BY; zero totals need no rate
+    return sum((convert(amount, currency, to_currency, day) for currency, amount in totals.items() if amount), Decimal("0"))
+
+
+def read_rates(path=DEFAULT_RATES_FILE):
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            yield row['date'], row['currency'].upper(), Decimal(row['usd_rate'])
+
+
+def load_rates(rows):
+    rates = [FxRate(date=day, currency=currency, usd_rate=rate) for day, currency, rate in rows]
+    with transaction.atomic():
+        FxRate.objects.bulk_create(
+            rates, update_conflicts=True, unique_fields=['date', 'currency'], update_fields=['usd_rate'])
+    clear_cache()
+    return len(rates)
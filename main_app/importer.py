@@ -0,0 +1,149 @@
+import csv
+import io
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .bulk import participant_ids, clean_fare_fields, clean_weight, check_split, insert_fares, finish_bulk_write
+from .exporter import unescape_cell
+from .fx import MissingRate
+from .models import Fare, FARE_TYPES, CURRENCIES
+
+# Streaming CSV import of fares into one share.
+#
+# Expected header: name, amount, date, category, paid_by, split_between
+# and optionally currency and split_method
+#   date           YYYY-MM-DD
+#   category       key or label from FARE_TYPES, defaults to the model default
+#   paid_by        username of a participant
+#   split_between  participant usernames separated by ";", empty means everyone,
+#                  each may carry a weight for weighted splits: "alice:2;bob:1"
+#   currency       code the amount was paid in, converted to the share's currency
+#   split_method   equal (default), shares, percent or fixed
+#
+# Rows are read one at a time and written in batches, so memory stays flat
+# whatever the file size. Invalid rows are reported and skipped, the rest
+# of the file is still imported, all inside one transaction. A file that
+# is not UTF-8 or not CSV is reported as one error and imports nothing.
+
+BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 200
+REQUIRED_COLUMNS = {'name', 'amount', 'date', 'paid_by'}
+CURRENCY_CODES = {code for code, label in CURRENCIES}
+CATEGORY_BY_LABEL = {label.lower(): key for key, label in FARE_TYPES}
+CATEGORY_BY_LABEL.update({label.rsplit(' ', 1)[0].lower(): key for key, label in FARE_TYPES}) # labels without the emoji
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.total = Decimal("0")
+        self.error_count = 0
+        self.errors = [] # (line number, message), capped at MAX_REPORTED_ERRORS
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def text_stream(fileobj):
+    if isinstance(fileobj, io.TextIOBase):
+        return fileobj
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+def parse_split(value, members):
+    entries = [entry.strip() for entry in value.split(';') if entry.strip()]
+    if not entries:
+        return {user_id: Decimal("1") for user_id in members.values()}, []
+
+    weights = {}
+    errors = []
+    for entry in entries:
+        username, _, weight = entry.partition(':')
+        user_id = members.get(username.strip())
+        if user_id is None:
+            errors.append(f"split_between: {username.strip()!r} is not a participant")
+            continue
+        try:
+            weights[user_id] = clean_weight(weight.strip() or "1")
+        except ValidationError as e:
+            errors.append(f"split_between: {weight.strip()!r}: {' '.join(e.messages)}")
+    return weights, errors
+
+
+def parse_row(row, share, members):
+    values = {k.strip().lower(): unescape_cell((v or '').strip()) for k, v in row.items() if k}
+    category = values.get('category', '')
+    values['category'] = CATEGORY_BY_LABEL.get(category.lower(), category)
+    cleaned, errors = clean_fare_fields(values)
+
+    paid_by = members.get(values.get('paid_by', ''))
+    if paid_by is None:
+        errors.append(f"paid_by: {values.get('paid_by')!r} is not a participant")
+
+    weights, split_errors = parse_split(values.get('split_between', ''), members)
+    errors.extend(split_errors)
+
+    currency = values.get('currency', '').upper()
+    if currency and currency not in CURRENCY_CODES:
+        errors.append(f"currency: {currency!r} is not supported")
+
+    if errors:
+        return None, None, errors
+    fare = Fare(share=share, paid_by_id=paid_by, original_currency=currency, original_amount=cleaned['amount'], **cleaned)
+    try:
+        fare.convert_original_amount(share.currency) # rates are cached per date, no query per row
+    except MissingRate as e:
+        return None, None, [f"currency: {e}"]
+    split_error = check_split(fare, weights)
+    if split_error:
+        return None, None, [split_error]
+    return fare, weights, []
+
+
+def import_fares(share, fileobj, batch_size=BATCH_SIZE, dry_run=False):
+    result = ImportResult()
+    reader = csv.DictReader(text_stream(fileobj))
+    try:
+        columns = {c.strip().lower() for c in (reader.fieldnames or []) if c}
+        missing = REQUIRED_COLUMNS - columns
+        if missing:
+            result.add_error(1, f"missing columns: {', '.join(sorted(missing))}")
+            return result
+
+        members = participant_ids(share) # the only lookup needed to validate every row
+
+        with transaction.atomic():
+            fares, splits = [], []
+            for row in reader:
+                fare, split, errors = parse_row(row, share, members)
+                if errors:
+                    result.add_error(reader.line_num, '; '.join(errors))
+                    continue
+                fares.append(fare)
+                splits.append(split)
+                result.created += 1
+                result.total += fare.amount
+                if len(fares) >= batch_size:
+                    if not dry_run:
+                        insert_fares(fares, splits)
+                    fares, splits = [], []
+
+            if fares and not dry_run:
+                insert_fares(fares, splits)
+            if result.created and not dry_run:
+                finish_bulk_write(share, result.created, result.total)
+    except (UnicodeDecodeError, csv.Error) as e: # the whole file is unreadable, the transaction is rolled back
+        result.created, result.total = 0, Decimal("0")
+        result.add_error(reader.line_num or 1, file_error(e))
+
+    return result
+
+
+def file_error(e):
+    if isinstance(e, UnicodeDecodeError):
+        return 'the file is not UTF-8 text, save it as "CSV UTF-8" and upload it again; nothing was imported'
+    return f"the file is not valid CSV ({e}); nothing was imported"
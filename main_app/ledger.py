@@ -0,0 +1,434 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from . import fx
+from .models import Fare, FARE_TYPES, FareSplit, ShareSummary, CategoryTotal, ParticipantBalance, DailyTotal
+
+# Balance engine for a single Share.
+# Loads fares, split rows and participants in a fixed number of queries
+# and computes every total in one pass over the rows, so the cost of a
+# Share page no longer grows with (participants x fares).
+#
+# The same numbers are persisted in ShareSummary / CategoryTotal /
+# ParticipantBalance (and DailyTotal for the spending charts) and adjusted
+# per Fare change (see signals.py), so ShareDetail only has to read those rows.
+
+CENTS = Decimal("0.01")
+CATEGORY_LABELS = dict(FARE_TYPES)
+CATEGORY_KEYS = {label: key for key, label in FARE_TYPES}
+CACHE_SECONDS = 24 * 60 * 60 # keys change with the share's version, old entries simply expire
+
+
+def quantize(value):
+    return value.quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def load_rows(share):
+    fares = list(share.fare_set.values_list('id', 'amount', 'category', 'paid_by_id')) # 1 query
+    splits = list( # 1 query on the Fare.split_between through table
+        FareSplit.objects
+        .filter(fare__share=share)
+        .values_list('fare_id', 'user_id', 'amount_cents')
+    )
+    return fares, splits
+
+
+def cents_to_amount(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def compute_totals(fares, splits):
+    # every person's part of a fare was allocated in exact cents when the fare was written,
+    # so owes is a plain sum and always adds back up to the fare totals
+    owes = {}
+    for fare_id, user_id, amount_cents in splits:
+        owes[user_id] = owes.get(user_id, 0) + amount_cents
+
+    total_expenses = Decimal("0")
+    category_totals = {}
+    category_counts = {}
+    paid = {}
+
+    for fare_id, amount, category, paid_by_id in fares:
+        total_expenses += amount
+        category_totals[category] = category_totals.get(category, Decimal("0")) + amount
+        category_counts[category] = category_counts.get(category, 0) + 1
+        paid[paid_by_id] = paid.get(paid_by_id, Decimal("0")) + amount
+
+    return {
+        "total_fares": len(fares),
+        "total_expenses": total_expenses,
+        "category_totals": category_totals,
+        "category_counts": category_counts,
+        "paid": paid,
+        "owes": {user_id: cents_to_amount(cents) for user_id, cents in owes.items()},
+    }
+
+
+def build_balances(participants, paid, owes, user):
+    balances = []
+    for p in participants:
+        p_owes = owes.get(p.pk, Decimal("0"))
+        p_paid = paid.get(p.pk, Decimal("0"))
+        balances.append({
+            "participant": p,
+            "owes": quantize(p_owes),
+            "paid": quantize(p_paid),
+            "net": quantize(p_paid - p_owes),
+        })
+    return sorted(balances, key=lambda b: (b["participant"].id != user.id)) # sorts logged in user first
+
+
+def sort_category_totals(category_totals):
+    labelled = {CATEGORY_LABELS.get(key, key): total for key, total in category_totals.items()}
+    return dict(sorted(labelled.items(), key=lambda item: item[1], reverse=True)) # sorting by value in descending order
+
+
+def build_ledger(share, user):
+    fares, splits = load_rows(share)
+    participants = list(share.participants.all()) # 1 query
+    totals = compute_totals(fares, splits)
+
+    return {
+        "total_fares": totals["total_fares"],
+        "total_expenses": totals["total_expenses"],
+        "my_expenses": quantize(totals["owes"].get(user.pk, Decimal("0"))),
+        "balances": build_balances(participants, totals["paid"], totals["owes"], user),
+        "category_totals": sort_category_totals(totals["category_totals"]),
+    }
+
+####
+# Persisted summaries
+
+
+def get_summary(share):
+    summary = ShareSummary.objects.filter(share=share).first()
+    if summary is None: # shares created before summaries existed are filled in on first view
+        summary = rebuild_summary(share)
+    return summary
+
+
+def summary_context(share, user, summary=None):
+    summary = summary or get_summary(share)
+
+    categories = share.category_totals.filter(fare_count__gt=0).order_by('-total')
+    balance_rows = {b.user_id: b for b in share.balances.all()}
+    participants = list(share.participants.all())
+
+    paid = {user_id: b.paid for user_id, b in balance_rows.items()}
+    owes = {user_id: b.owes for user_id, b in balance_rows.items()}
+
+    return {
+        "total_fares": summary.fare_count,
+        "total_expenses": summary.total_expenses,
+        "my_expenses": quantize(owes.get(user.pk, Decimal("0"))),
+        "balances": build_balances(participants, paid, owes, user),
+        "category_totals": {CATEGORY_LABELS.get(c.category, c.category): c.total for c in categories},
+    }
+
+
+def share_summary(share):
+    try:
+        return share.summary # loaded with select_related('summary') by the views
+    except ShareSummary.DoesNotExist:
+        return get_summary(share)
+
+
+def cache_key(share, summary):
+    # ids can come back after a restore or a rolled back transaction, created_at tells those shares apart
+    return f"share:{share.pk}:{share.created_at.timestamp():.6f}:v{summary.version}"
+
+
+def cached_summary_context(share, user):
+    # summary_context from the cache, keyed on the share's version which every fare,
+    # split, participant and share edit bumps (signals.py), so repeat views run no ledger queries
+    summary = share_summary(share)
+    key = cache_key(share, summary)
+    shared = cache.get(key)
+    if shared is None:
+        shared = cache_shared_rows(share, summary, key)
+    return viewer_context(shared, key, user)
+
+
+async def acached_summary_context(share, user):
+    # the same for the async views, a cache hit never leaves the event loop
+    try:
+        summary = share.summary
+    except ShareSummary.DoesNotExist:
+        summary = await sync_to_async(get_summary)(share)
+    key = cache_key(share, summary)
+    shared = await cache.aget(key)
+    if shared is None:
+        shared = await sync_to_async(cache_shared_rows)(share, summary, key)
+    return viewer_context(shared, key, user)
+
+
+def cache_shared_rows(share, summary, key):
+    balance_rows = share.balances.all()
+    shared = {
+        "total_fares": summary.fare_count,
+        "total_expenses": summary.total_expenses,
+        "participants": list(share.participants.only('id', 'username')), # no password hashes in the cache
+        "paid": {b.user_id: b.paid for b in balance_rows},
+        "owes": {b.user_id: b.owes for b in balance_rows},
+        "category_totals": {
+            CATEGORY_LABELS.get(c.category, c.category): c.total
+            for c in share.category_totals.filter(fare_count__gt=0).order_by('-total')
+        },
+    }
+    cache.set(key, shared, CACHE_SECONDS)
+    return shared
+
+
+def viewer_context(shared, key, user):
+    return { # the per-user part is plain Python over the cached rows
+        "ledger_cache_key": key,
+        "total_fares": shared["total_fares"],
+        "total_expenses": shared["total_expenses"],
+        "my_expenses": quantize(shared["owes"].get(user.pk, Decimal("0"))),
+        "balances": build_balances(shared["participants"], shared["paid"], shared["owes"], user),
+        "category_totals": shared["category_totals"],
+    }
+
+
+def expected_rows(share):
+    fares, splits = load_rows(share)
+    totals = compute_totals(fares, splits)
+    participant_ids = set(share.participants.values_list('id', flat=True))
+    user_ids = participant_ids | set(totals["paid"]) | set(totals["owes"])
+
+    summary = {"fare_count": totals["total_fares"], "total_expenses": totals["total_expenses"]}
+    categories = {
+        category: {"fare_count": totals["category_counts"][category], "total": total}
+        for category, total in totals["category_totals"].items()
+    }
+    balances = {
+        user_id: {"paid": totals["paid"].get(user_id, Decimal("0")), "owes": totals["owes"].get(user_id, Decimal("0"))}
+        for user_id in user_ids
+    }
+    days = { # 1 query, grouped by the database
+        (row["date"], row["category"], row["paid_by_id"]): {"fare_count": row["fare_count"], "total": row["total"]}
+        for row in share.fare_set.order_by().values('date', 'category', 'paid_by_id').annotate(fare_count=Count('id'), total=Sum('amount'))
+    }
+    return summary, categories, balances, days
+
+
+def rebuild_summary(share):
+    summary_values, categories, balances, days = expected_rows(share)
+    with transaction.atomic():
+        summary, _ = ShareSummary.objects.update_or_create(share=share, defaults=summary_values)
+        share.category_totals.all().delete()
+        CategoryTotal.objects.bulk_create(
+            CategoryTotal(share=share, category=category, **values) for category, values in categories.items()
+        )
+        share.balances.all().delete()
+        ParticipantBalance.objects.bulk_create(
+            ParticipantBalance(share=share, user_id=user_id, **values) for user_id, values in balances.items()
+        )
+        share.daily_totals.all().delete()
+        DailyTotal.objects.bulk_create(
+            DailyTotal(share=share, date=date, category=category, paid_by_id=paid_by_id, **values)
+            for (date, category, paid_by_id), values in days.items()
+        )
+        bump_version(share.pk)
+    summary.refresh_from_db()
+    return summary
+
+
+def verify_summary(share):
+    # returns a list of human readable differences between the stored rows and a fresh computation
+    summary_values, categories, balances, days = expected_rows(share)
+    problems = []
+
+    summary = ShareSummary.objects.filter(share=share).first()
+    if summary is None:
+        return ["summary row is missing"]
+    for field, expected in summary_values.items():
+        if getattr(summary, field) != expected:
+            problems.append(f"{field}: stored {getattr(summary, field)}, expected {expected}")
+
+    stored_categories = {c.category: c for c in share.category_totals.filter(fare_count__gt=0)}
+    for category in set(stored_categories) | set(categories):
+        row = stored_categories.get(category)
+        expected = categories.get(category, {"fare_count": 0, "total": Decimal("0")})
+        if row is None or row.fare_count != expected["fare_count"] or row.total != expected["total"]:
+            problems.append(f"category {category}: stored {row.total if row else None}, expected {expected['total']}")
+
+    zero = {"paid": Decimal("0"), "owes": Decimal("0")}
+    stored_balances = {b.user_id: b for b in share.balances.all()}
+    for user_id in set(stored_balances) | set(balances):
+        row = stored_balances.get(user_id)
+        expected = balances.get(user_id, zero)
+        stored = {"paid": row.paid, "owes": row.owes} if row else zero
+        if stored != expected:
+            problems.append(f"user {user_id}: stored {stored}, expected {expected}")
+
+    stored_days = {
+        (d.date, d.category, d.paid_by_id): {"fare_count": d.fare_count, "total": d.total}
+        for d in share.daily_totals.filter(fare_count__gt=0)
+    }
+    for day in set(stored_days) | set(days):
+        if stored_days.get(day) != days.get(day):
+            problems.append(f"day {day[0]} {day[1]} paid by {day[2]}: stored {stored_days.get(day)}, expected {days.get(day)}")
+
+    return problems
+
+####
+# Incremental updates
+#
+# A fare's contribution is everything it adds to its share's summary rows.
+# Signal handlers read the contribution before and after a change and
+# apply the difference, so each write touches a constant number of rows.
+
+
+def fare_contribution(fare_id):
+    row = Fare.objects.filter(pk=fare_id).values_list('share_id', 'amount', 'category', 'paid_by_id', 'share__currency', 'date').first()
+    if row is None:
+        return None
+    share_id, amount, category, paid_by_id, currency, date = row
+    owes = {
+        user_id: cents_to_amount(cents)
+        for user_id, cents in FareSplit.objects.filter(fare_id=fare_id).values_list('user_id', 'amount_cents')
+    }
+    return {
+        "share_id": share_id,
+        "currency": currency,
+        "fare_count": 1,
+        "total": amount,
+        "categories": {category: amount},
+        "paid": {paid_by_id: amount},
+        "owes": owes,
+        "days": {(date, category, paid_by_id): amount},
+    }
+
+
+def empty_delta(share_id):
+    return {"share_id": share_id, "fare_count": 0, "total": Decimal("0"), "categories": {}, "category_counts": {}, "paid": {}, "owes": {}, "days": {}}
+
+
+def add_to_delta(delta, contribution, sign):
+    delta["fare_count"] += sign
+    delta["total"] += sign * contribution["total"]
+    for key in ("categories", "paid", "owes"):
+        for k, v in contribution[key].items():
+            delta[key][k] = delta[key].get(k, Decimal("0")) + sign * v
+    for category in contribution["categories"]:
+        delta["category_counts"][category] = delta["category_counts"].get(category, 0) + sign
+    for day, amount in contribution["days"].items(): # (date, category, paid_by_id) -> [fare count, total]
+        counts = delta["days"].setdefault(day, [0, Decimal("0")])
+        counts[0] += sign
+        counts[1] += sign * amount
+
+
+def contribution_deltas(before, after):
+    deltas = {}
+    for contribution, sign in ((before, -1), (after, 1)):
+        if contribution is None:
+            continue
+        delta = deltas.setdefault(contribution["share_id"], empty_delta(contribution["share_id"]))
+        add_to_delta(delta, contribution, sign)
+    return list(deltas.values())
+
+
+def add_to_row(model, lookup, values):
+    # adds values to an existing row with F() expressions, creating the row if it is missing
+    values = {k: v for k, v in values.items() if v}
+    if not values:
+        return
+    if model.objects.filter(**lookup).update(**{k: F(k) + v for k, v in values.items()}):
+        return
+    if all(v < 0 for v in values.values()):
+        return # nothing to take away from, e.g. the share is being deleted
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **values)
+    except IntegrityError: # created by a concurrent request
+        model.objects.filter(**lookup).update(**{k: F(k) + v for k, v in values.items()})
+
+
+def apply_delta(delta):
+    share_id = delta["share_id"]
+    add_to_row(ShareSummary, {"share_id": share_id}, {"fare_count": delta["fare_count"], "total_expenses": delta["total"]})
+
+    for category, total in delta["categories"].items():
+        add_to_row(CategoryTotal, {"share_id": share_id, "category": category},
+                   {"fare_count": delta["category_counts"].get(category, 0), "total": total})
+
+    for (date, category, paid_by_id), (fare_count, total) in delta["days"].items():
+        add_to_row(DailyTotal, {"share_id": share_id, "date": date, "category": category, "paid_by_id": paid_by_id},
+                   {"fare_count": fare_count, "total": total})
+
+    for user_id, amount in delta["paid"].items():
+        add_to_row(ParticipantBalance, {"share_id": share_id, "user_id": user_id}, {"paid": amount})
+
+    by_amount = {} # most members of a split owe the same amount, so most fares need one or two UPDATEs
+    for user_id, amount in delta["owes"].items():
+        if amount:
+            by_amount.setdefault(amount, []).append(user_id)
+    owed_more = [user_id for amount, user_ids in by_amount.items() if amount > 0 for user_id in user_ids]
+    if owed_more: # rows are only created for positive amounts, never for a share that is being deleted
+        ensure_balance_rows(share_id, owed_more)
+    for amount, user_ids in by_amount.items():
+        ParticipantBalance.objects.filter(share_id=share_id, user_id__in=user_ids).update(owes=F('owes') + amount)
+
+
+def apply_change(before, after):
+    with transaction.atomic():
+        for delta in contribution_deltas(before, after):
+            apply_delta(delta)
+            bump_version(delta["share_id"]) # even a rename changes the fare list
+
+
+def bump_version(share_id):
+    ShareSummary.objects.filter(share_id=share_id).update(version=F('version') + 1)
+
+
+def ensure_balance_rows(share_id, user_ids):
+    ParticipantBalance.objects.bulk_create(
+        [ParticipantBalance(share_id=share_id, user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+
+
+def drop_empty_balance_rows(share_id, user_ids):
+    ParticipantBalance.objects.filter(share_id=share_id, user_id__in=user_ids, paid=0, owes=0).delete()
+
+####
+# Cross-share balances for one user
+
+
+def user_dashboard(user):
+    rows = ( # 1 query, served by balance_user_share_idx
+        ParticipantBalance.objects
+        .filter(user=user, share__participants=user)
+        .select_related('share')
+        .order_by('-share__created_at')
+    )
+
+    shares = []
+    currencies = {}
+    for row in rows:
+        net = row.paid - row.owes
+        shares.append({"share": row.share, "paid": quantize(row.paid), "owes": quantize(row.owes), "net": quantize(net)})
+        totals = currencies.setdefault(row.share.currency, {"paid": Decimal("0"), "owes": Decimal("0"), "net": Decimal("0")})
+        totals["paid"] += row.paid
+        totals["owes"] += row.owes
+        totals["net"] += net
+
+    try:
+        base_net = quantize(fx.convert_totals({currency: totals["net"] for currency, totals in currencies.items()}))
+    except fx.MissingRate: # the per-currency nets are still shown
+        base_net = None
+    return {
+        "share_balances": shares,
+        "base_currency": fx.BASE_CURRENCY,
+        "base_net": base_net,
+        "currency_totals": [
+            {"currency": currency, **{key: quantize(value) for key, value in totals.items()}}
+            for currency, totals in sorted(currencies.items())
+        ],
+    }
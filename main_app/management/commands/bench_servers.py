@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from main_app.benchmarks import BenchmarkTarget, load_test
+from main_app.models import Share
+
+SERVERS = {
+    'wsgi': ['fareshare.wsgi'],
+    'asgi': ['-c', 'fareshare/gunicorn_asgi.py', 'fareshare.asgi:application'],
+}
+
+
+def wait_until_up(url, seconds=20):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return True
+        except (OSError, urllib.error.HTTPError):
+            time.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = "Starts the WSGI and ASGI (uvicorn worker) servers with gunicorn and compares them under concurrent load."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', dest='servers', choices=list(SERVERS))
+        parser.add_argument('--workers', type=int, default=2, help="Gunicorn workers for each server.")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--requests', type=int, default=500, help="Requests per run.")
+        parser.add_argument('--share', type=int, help="Share to load, defaults to the one with the most fares.")
+        parser.add_argument('--port', type=int, default=8101)
+
+    def handle(self, *args, **options):
+        share = Share.objects.filter(pk=options['share']).first() if options['share'] else None
+        if not Share.objects.exists():
+            raise CommandError("No shares to benchmark, run manage.py seed_fareshare first.")
+        target = BenchmarkTarget(share)
+        client = Client()
+        client.force_login(target.user) # a real session row the servers can read
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        paths = [reverse('home'), reverse('share-index'), reverse('share-detail', kwargs={'pk': target.share.pk})]
+
+        self.stdout.write(f"{'server':<6} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for name in options['servers'] or list(SERVERS):
+            env = {k: v for k, v in os.environ.items() if k != 'ASYNC_VIEWS'} # asgi.py switches it on for its own app
+            command = [sys.executable, '-m', 'gunicorn', *SERVERS[name],
+                       '--workers', str(options['workers']), '--bind', f"127.0.0.1:{options['port']}", '--log-level', 'warning']
+            server = subprocess.Popen(command, env=env, cwd=settings.BASE_DIR)
+            try:
+                base_url = f"http://127.0.0.1:{options['port']}"
+                if not wait_until_up(base_url + '/'):
+                    raise CommandError(f"The {name} server did not start.")
+                load_test(base_url, paths, cookie, concurrency=4, total=40) # warm up every worker
+                for concurrency in options['concurrency']:
+                    r = load_test(base_url, paths, cookie, concurrency, options['requests'])
+                    self.stdout.write(
+                        f"{name:<6} {concurrency:>7} {r['rps']:>8.1f} {r['p50'] or 0:>8.1f} {r['p95'] or 0:>8.1f} "
+                        f"{r['p99'] or 0:>8.1f} {r['errors']:>7}")
+            finally:
+                server.terminate()
+                server.wait()
@@ -0,0 +1,36 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from main_app.settlement import settle_cents, EXACT_LIMIT
+
+
+def random_nets(size, rng):
+    nets = {i: rng.randint(-500_000, 500_000) for i in range(size - 1)}
+    nets[size - 1] = -sum(nets.values()) # balances always sum to zero
+    return nets
+
+
+class Command(BaseCommand):
+    help = "Times settle-up suggestions for random groups of increasing size."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[4, 8, EXACT_LIMIT, 100, 1000, 5000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"{'participants':>12} {'mode':>7} {'transfers':>10} {'best ms':>9} {'worst ms':>9}")
+
+        for size in options['sizes']:
+            timings = []
+            for _ in range(options['repeat']):
+                nets = random_nets(size, rng)
+                start = time.perf_counter()
+                transfers = settle_cents(nets)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            mode = "exact" if size <= EXACT_LIMIT else "greedy"
+            self.stdout.write(f"{size:>12} {mode:>7} {len(transfers):>10} {min(timings):>9.2f} {max(timings):>9.2f}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.benchmarks import upload_latency, upload_problems, ms_per_mb
+from main_app.models import Share
+
+
+class Command(BaseCommand):
+    help = "Times photo uploads of growing size with deferred and with inline thumbnails."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--share', type=int, help="Share to upload to, defaults to the one with the most fares.")
+
+    def handle(self, *args, **options):
+        share = None
+        if options['share']:
+            share = Share.objects.filter(pk=options['share']).first()
+            if share is None:
+                raise CommandError(f"Share {options['share']} does not exist.")
+        elif not Share.objects.exists():
+            raise CommandError("No shares to upload to, run manage.py seed_fareshare first.")
+
+        results = upload_latency(share, options['repeat'])
+        self.stdout.write(f"{'mode':<10} {'size':<8} {'MB':>6} {'p50 ms':>8} {'p95 ms':>8}")
+        for r in results:
+            self.stdout.write(f"{r['mode']:<10} {r['size']:<8} {r['bytes'] / 1e6:>6.1f} {r['p50']:>8.1f} {r['p95']:>8.1f}")
+        for mode in ('deferred', 'inline'):
+            self.stdout.write(f"{mode}: {ms_per_mb(results, mode):.1f}ms per extra MB")
+
+        problems = upload_problems(results)
+        if problems:
+            raise CommandError('; '.join(problems))
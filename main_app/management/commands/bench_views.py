@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.benchmarks import run, BUDGETS
+from main_app.models import Share
+
+
+def parse_budget(value):
+    # "share-detail=200:12" -> ('share-detail', (200.0, 12))
+    try:
+        name, limits = value.rsplit('=', 1)
+        ms, queries = limits.split(':')
+        return name, (float(ms), int(queries))
+    except ValueError:
+        raise CommandError(f"Budgets look like view=ms:queries, got {value!r}")
+
+
+class Command(BaseCommand):
+    help = "Times the main views through the test client and fails when a latency or query budget is exceeded."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', action='append', dest='views', choices=list(BUDGETS), help="Only this view (repeatable).")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--share', type=int, help="Share to benchmark, defaults to the one with the most fares.")
+        parser.add_argument('--budget', action='append', default=[], help="Override a budget: view=p95ms:queries (repeatable).")
+
+    def handle(self, *args, **options):
+        share = None
+        if options['share']:
+            share = Share.objects.filter(pk=options['share']).first()
+            if share is None:
+                raise CommandError(f"Share {options['share']} does not exist.")
+        elif not Share.objects.exists():
+            raise CommandError("No shares to benchmark, run manage.py seed_fareshare first.")
+
+        budgets = dict(parse_budget(value) for value in options['budget'])
+        results = run(options['views'], options['repeat'], budgets, share)
+
+        self.stdout.write(f"{'view':<18} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+        failed = 0
+        for r in results:
+            line = f"{r['view']:<18} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f} {r['queries']:>8}"
+            if r['problems']:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"{line}  {'; '.join(r['problems'])}"))
+            else:
+                self.stdout.write(line)
+
+        if failed:
+            raise CommandError(f"{failed} views are over budget.")
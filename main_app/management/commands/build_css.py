@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.assets import build, BUNDLE_DIR
+
+
+class Command(BaseCommand):
+    help = "Bundles and minifies each page's stylesheets into static/css/bundles (run it after editing static/css)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only fail if a bundle is out of date, write nothing.")
+
+    def handle(self, *args, **options):
+        changed = build(check=options['check'])
+        if options['check'] and changed:
+            raise CommandError(f"Out of date bundles: {', '.join(changed)}. Run manage.py build_css.")
+        for name in changed:
+            self.stdout.write(f"Wrote {BUNDLE_DIR}/{name}.css")
+        if not changed:
+            self.stdout.write("Bundles are up to date.")
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from main_app.assets import check_repeat_loads, collected_static
+from main_app.benchmarks import BenchmarkTarget
+from main_app.models import Share
+
+
+class Command(BaseCommand):
+    help = "Collects static files with the production storage and checks that repeat page loads download no static files."
+
+    def handle(self, *args, **options):
+        paths = [reverse('home'), reverse('about'), reverse('login'), reverse('signup')]
+        try:
+            results = self.check(paths)
+        except ValueError as e: # a page did not load
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{'file':<52} {'bytes':>7} {'encoding':>8} {'repeat':>7}")
+        failed = 0
+        for r in results:
+            line = f"{r['url']:<52} {r['bytes']:>7} {r['encoding']:>8} {r['repeat_bytes']:>7}"
+            if r['status'] != 200 or r['repeat_bytes']:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"{line}  {r['status']} {r['cache_control']!r}"))
+            else:
+                self.stdout.write(line)
+        self.stdout.write(f"first load {sum(r['bytes'] for r in results)} bytes, repeat load {sum(r['repeat_bytes'] for r in results)} bytes")
+
+        if failed:
+            raise CommandError(f"{failed} static files would be downloaded again on a repeat visit.")
+
+    def check(self, paths):
+        with collected_static():
+            client = Client()
+            results = check_repeat_loads(client, paths)
+            if Share.objects.exists(): # the pages behind the login, as the busiest share's creator
+                target = BenchmarkTarget()
+                client.force_login(target.user)
+                paths = [reverse('share-index'), reverse('share-detail', kwargs={'pk': target.share.pk}), reverse('profile')]
+                if target.fare:
+                    paths.append(reverse('fare-detail', kwargs={'share_id': target.share.pk, 'pk': target.fare.pk}))
+                seen = {r['url'] for r in results}
+                results += [r for r in check_repeat_loads(client, paths) if r['url'] not in seen]
+        return results
@@ -0,0 +1,38 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.models import Share
+from main_app.query_plans import run_checks, sample_user_and_share
+
+
+class Command(BaseCommand):
+    help = "Runs EXPLAIN on the main view queries and checks each one uses its index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to plan for, defaults to the participant of the busiest share.")
+        parser.add_argument('--share', type=int, help="Share id to plan for, defaults to the share with the most fares.")
+        parser.add_argument('--analyze', action='store_true', help="EXPLAIN ANALYZE (Postgres only), runs the queries.")
+        parser.add_argument('--plans', action='store_true', help="Print every plan, not only the failing ones.")
+
+    def handle(self, *args, **options):
+        user, share = sample_user_and_share()
+        if options['share']:
+            share = Share.objects.filter(pk=options['share']).first()
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        if user is None or share is None:
+            raise CommandError("No user or share to plan for, load some data first.")
+
+        failed = 0
+        for label, index, plan, ok in run_checks(user, share, options['analyze']):
+            if ok:
+                self.stdout.write(f"{self.style.SUCCESS('ok  ')} {label} uses {index}")
+            else:
+                failed += 1
+                self.stdout.write(f"{self.style.ERROR('MISS')} {label} does not use {index}")
+            if options['plans'] or not ok:
+                for line in plan.splitlines():
+                    self.stdout.write(f"       {line}")
+
+        if failed:
+            raise CommandError(f"{failed} queries are not using their index.")
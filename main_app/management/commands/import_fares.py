@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.importer import import_fares
+from main_app.models import Share
+
+
+class Command(BaseCommand):
+    help = "Imports fares into a share from a CSV file (name, amount, date, category, paid_by, split_between)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('share_id', type=int)
+        parser.add_argument('csv_path')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Validate the file without saving anything.")
+
+    def handle(self, *args, **options):
+        try:
+            share = Share.objects.get(pk=options['share_id'])
+        except Share.DoesNotExist:
+            raise CommandError(f"Share {options['share_id']} does not exist.")
+
+        with open(options['csv_path'], 'rb') as f:
+            result = import_fares(share, f, batch_size=options['batch_size'], dry_run=options['dry_run'])
+
+        for line, message in result.errors:
+            self.stdout.write(self.style.WARNING(f"line {line}: {message}"))
+        if result.error_count > len(result.errors):
+            self.stdout.write(self.style.WARNING(f"... and {result.error_count - len(result.errors)} more errors"))
+
+        verb = "Validated" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result.created} fares totalling {result.total} into '{share.title}', {result.error_count} rows skipped."))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app import counters
+from main_app.ledger import rebuild_summary, verify_summary
+from main_app.models import Share
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-share ledger summaries from raw fares, or verifies them with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--share', type=int, action='append', dest='share_ids', help="Only this share (repeatable).")
+        parser.add_argument('--verify', action='store_true', help="Report drift instead of rebuilding.")
+        parser.add_argument('--fix', action='store_true', help="With --verify, rebuild shares that drifted.")
+
+    def handle(self, *args, **options):
+        shares = Share.objects.order_by('pk')
+        if options['share_ids']:
+            shares = shares.filter(pk__in=options['share_ids'])
+
+        drifted = 0
+        checked = 0
+        for share in shares.iterator():
+            checked += 1
+            if not options['verify']:
+                rebuild_summary(share)
+                continue
+
+            problems = verify_summary(share)
+            if not problems:
+                continue
+            drifted += 1
+            self.stdout.write(self.style.WARNING(f"Share {share.pk} ({share.title}) has drifted:"))
+            for problem in problems:
+                self.stdout.write(f"  {problem}")
+            if options['fix']:
+                rebuild_summary(share)
+                self.stdout.write(f"  rebuilt share {share.pk}")
+
+        if not options['verify']:
+            counters.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {checked} share summaries and the site counters."))
+        elif drifted and not options['fix']:
+            raise CommandError(f"{drifted} of {checked} share summaries have drifted.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Checked {checked} share summaries, {drifted} drifted."))
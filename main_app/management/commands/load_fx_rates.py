@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from main_app.fx import DEFAULT_RATES_FILE, read_rates, load_rates
+
+
+class Command(BaseCommand):
+    help = "Loads exchange rates (date, currency, usd_rate) from a CSV file, updating existing days."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_RATES_FILE))
+
+    def handle(self, *args, **options):
+        count = load_rates(read_rates(options['path']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {count} rates from {options['path']}. Restart running workers to pick them up."))
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from main_app.attachments import pending_ids, process
+
+
+class Command(BaseCommand):
+    help = "Makes the thumbnails of attachments the background workers did not get to, e.g. after a restart."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=5, help="Minutes an attachment has been pending (default 5, 0 for all).")
+
+    def handle(self, *args, **options):
+        ids = pending_ids(timedelta(minutes=options['older_than']))
+        for attachment_id in ids:
+            process(attachment_id)
+        self.stdout.write(f"Processed {len(ids)} pending attachments.")
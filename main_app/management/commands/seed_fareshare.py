@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main_app.seeding import seed, PASSWORD
+
+
+class Command(BaseCommand):
+    help = "Generates synthetic users, shares, participants and fares for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--shares', type=int, default=50)
+        parser.add_argument('--fares-per-share', type=int, default=200, help="Average, each share gets 50%%-150%% of this.")
+        parser.add_argument('--prefix', default='seed', help="Usernames are <prefix>_<n>.")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed, the same seed gives the same data.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        result = seed(
+            users=options['users'], shares=options['shares'], fares_per_share=options['fares_per_share'],
+            prefix=options['prefix'], rng_seed=options['seed'], log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {result['users']} users, {result['shares']} shares and {result['fares']} fares "
+            f"in {time.perf_counter() - start:.1f}s. Every user's password is '{PASSWORD}'."))
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0011_alter_fare_options'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fare',
+            name='paid_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fares_paid', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='fare',
+            name='split_between',
+            field=models.ManyToManyField(related_name='fares_split', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='ShareSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fare_count', models.PositiveIntegerField(default=0)),
+                ('total_expenses', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('share', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='main_app.share')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('activities', 'Activities 🏖️'), ('entertainment', 'Entertainment 🎟️'), ('food_drink', 'Food & Drink 🍽️'), ('housing', 'Housing 🏨'), ('shopping', 'Shopping 🛍️'), ('transportation', 'Transportation 🚗'), ('misc', 'Miscellaneous 💡')], max_length=100)),
+                ('fare_count', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('share', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_totals', to='main_app.share')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('share', 'category'), name='unique_share_category_total')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ParticipantBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('owes', models.DecimalField(decimal_places=6, default=0, max_digits=16)),
+                ('share', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='main_app.share')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='share_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('share', 'user'), name='unique_share_participant_balance')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0013_site_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='participantbalance',
+            index=models.Index(fields=['user', 'share'], name='balance_user_share_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0014_balance_user_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sharesummary',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0015_share_summary_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fare',
+            name='original_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='fare',
+            name='original_currency',
+            field=models.CharField(blank=True, choices=[('USD', '$ USD 🇺🇸'), ('EUR', '€ EUR 🇪🇺'), ('GBP', '£ GBP 🇬🇧')], max_length=3, verbose_name='Paid In'),
+        ),
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('currency', models.CharField(choices=[('USD', '$ USD 🇺🇸'), ('EUR', '€ EUR 🇪🇺'), ('GBP', '£ GBP 🇬🇧')], max_length=3)),
+                ('usd_rate', models.DecimalField(decimal_places=6, max_digits=14)),
+            ],
+            options={
+                'ordering': ['currency', 'date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'currency'), name='unique_fx_rate_per_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+import csv
+from decimal import Decimal
+from pathlib import Path
+
+from django.db import migrations
+
+RATES_FILE = Path(__file__).resolve().parent.parent / 'fixtures' / 'fx_rates.csv'
+
+
+def load_rates(apps, schema_editor):
+    FxRate = apps.get_model('main_app', 'FxRate')
+    with open(RATES_FILE, newline='') as f:
+        rates = [
+            FxRate(date=row['date'], currency=row['currency'], usd_rate=Decimal(row['usd_rate']))
+            for row in csv.DictReader(f)
+        ]
+    FxRate.objects.bulk_create(rates, ignore_conflicts=True)
+
+
+def unload_rates(apps, schema_editor):
+    apps.get_model('main_app', 'FxRate').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0016_fx_rates'),
+    ]
+
+    operations = [
+        migrations.RunPython(load_rates, unload_rates),
+    ]
@@ -0,0 +1,99 @@
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def allocate_equal_splits(apps, schema_editor):
+    # existing fares were split equally, store each person's cents with largest-remainder rounding
+    Fare = apps.get_model('main_app', 'Fare')
+    FareSplit = apps.get_model('main_app', 'FareSplit')
+    for fare in Fare.objects.iterator():
+        rows = list(FareSplit.objects.filter(fare=fare).order_by('user_id'))
+        if not rows:
+            continue
+        total = int(fare.amount * 100)
+        sign = -1 if total < 0 else 1
+        base, remainder = divmod(abs(total), len(rows))
+        for i, row in enumerate(rows):
+            row.amount_cents = sign * (base + (1 if i < remainder else 0))
+        FareSplit.objects.bulk_update(rows, ['amount_cents'])
+    recompute_owes(apps)
+
+
+def recompute_owes(apps):
+    # owes becomes the sum of everyone's cents, the old division-based values were only cut to 2 places
+    FareSplit = apps.get_model('main_app', 'FareSplit')
+    ParticipantBalance = apps.get_model('main_app', 'ParticipantBalance')
+    owed = {
+        (row['fare__share_id'], row['user_id']): row['cents']
+        for row in FareSplit.objects.order_by().values('fare__share_id', 'user_id').annotate(cents=Sum('amount_cents')).iterator()
+    }
+    summarized = set(ParticipantBalance.objects.values_list('share_id', flat=True).distinct()) # shares without rows are built on first view
+    rows = []
+    for row in ParticipantBalance.objects.iterator():
+        row.owes = Decimal(owed.pop((row.share_id, row.user_id), 0)) / 100
+        rows.append(row)
+    ParticipantBalance.objects.bulk_update(rows, ['owes'], batch_size=1000)
+    ParticipantBalance.objects.bulk_create(
+        (ParticipantBalance(share_id=share_id, user_id=user_id, owes=Decimal(cents) / 100)
+         for (share_id, user_id), cents in owed.items() if share_id in summarized and cents),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0017_load_fx_rates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # the plain ManyToManyField's auto-created table becomes the FareSplit through model,
+        # only the state changes here, the table and its rows stay where they are
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='FareSplit',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('fare', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.fare')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'main_app_fare_split_between',
+                        'unique_together': {('fare', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='fare',
+                    name='split_between',
+                    field=models.ManyToManyField(related_name='fares_split', through='main_app.FareSplit', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='faresplit',
+            name='weight',
+            field=models.DecimalField(decimal_places=2, default=1, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='faresplit',
+            name='amount_cents',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fare',
+            name='split_method',
+            field=models.CharField(choices=[('equal', 'Equally'), ('shares', 'By shares'), ('percent', 'By percentage'), ('fixed', 'By fixed amounts')], default='equal', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='participantbalance',
+            name='owes',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(allocate_equal_splits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0018_weighted_splits'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # the composite index is created first so fares are never left without a share index
+        migrations.AddIndex(
+            model_name='fare',
+            index=models.Index(fields=['share', 'date', 'id'], name='fare_share_date_idx'),
+        ),
+        migrations.AlterField(
+            model_name='fare',
+            name='share',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.share'),
+        ),
+        # single-column foreign key indexes that a unique or composite index already starts with
+        migrations.AlterField(
+            model_name='faresplit',
+            name='fare',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.fare'),
+        ),
+        migrations.AlterField(
+            model_name='categorytotal',
+            name='share',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='category_totals', to='main_app.share'),
+        ),
+        migrations.AlterField(
+            model_name='participantbalance',
+            name='share',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='main_app.share'),
+        ),
+        migrations.AlterField(
+            model_name='participantbalance',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='share_balances', to=settings.AUTH_USER_MODEL),
+        ),
+        # Share.participants uses Django's automatic through table, which has no Meta to declare indexes on.
+        # Its unique (share_id, user_id) index serves lookups by share, this one serves "shares of this user".
+        migrations.RunSQL(
+            sql='CREATE INDEX share_participants_user_share_idx ON main_app_share_participants (user_id, share_id)',
+            reverse_sql='DROP INDEX share_participants_user_share_idx',
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_daily_totals(apps, schema_editor):
+    # one GROUP BY over the existing fares, later fare writes keep the rows up to date
+    Fare = apps.get_model('main_app', 'Fare')
+    DailyTotal = apps.get_model('main_app', 'DailyTotal')
+    rows = (
+        Fare.objects.order_by().values('share_id', 'date', 'category', 'paid_by_id')
+        .annotate(fare_count=Count('id'), total=Sum('amount'))
+    )
+    DailyTotal.objects.bulk_create((DailyTotal(**row) for row in rows.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0019_participant_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('category', models.CharField(choices=[('activities', 'Activities 🏖️'), ('entertainment', 'Entertainment 🎟️'), ('food_drink', 'Food & Drink 🍽️'), ('housing', 'Housing 🏨'), ('shopping', 'Shopping 🛍️'), ('transportation', 'Transportation 🚗'), ('misc', 'Miscellaneous 💡')], max_length=100)),
+                ('fare_count', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid_by', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_totals', to=settings.AUTH_USER_MODEL)),
+                ('share', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_totals', to='main_app.share')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['paid_by', 'date'], name='daily_payer_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('share', 'date', 'category', 'paid_by'), name='unique_share_daily_total')],
+            },
+        ),
+        migrations.RunPython(fill_daily_totals, migrations.RunPython.noop),
+    ]
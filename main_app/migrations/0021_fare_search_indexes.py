@@ -0,0 +1,42 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# GIN indexes for fare search (main_app/search.py), Postgres only: SQLite
+# test runs search with icontains and get no index. They are not declared
+# in Fare.Meta for that reason, the same way 0019 adds the participants index.
+# Built CONCURRENTLY so a big fare table stays writable meanwhile.
+
+INDEXES = [
+    GinIndex(SearchVector('name', config='simple'), name='fare_name_search_idx'), # full-text, same expression as search.name_vector()
+    GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='fare_name_trgm_idx'), # trigram similarity, typos and partial words
+]
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Fare = apps.get_model('main_app', 'Fare')
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index in INDEXES:
+        schema_editor.add_index(Fare, index, concurrently=True)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Fare = apps.get_model('main_app', 'Fare')
+    for index in INDEXES:
+        schema_editor.remove_index(Fare, index, concurrently=True)
+
+
+class Migration(migrations.Migration):
+    atomic = False # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+
+    dependencies = [
+        ('main_app', '0020_daily_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
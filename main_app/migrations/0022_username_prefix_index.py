@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Collate, Upper
+
+# Case-insensitive username prefix index for the participant autocomplete
+# (main_app/people.py), on Django's auth_user table. Postgres only, like the
+# search indexes in 0021; SQLite test runs scan the small user table.
+
+INDEX = models.Index(Collate(Upper('username'), 'C'), name='user_username_prefix_idx') # same expression as people.username_key()
+
+
+def add_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model(settings.AUTH_USER_MODEL), INDEX, concurrently=True)
+
+
+def remove_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model(settings.AUTH_USER_MODEL), INDEX, concurrently=True)
+
+
+class Migration(migrations.Migration):
+    atomic = False # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+
+    dependencies = [
+        ('main_app', '0021_fare_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(add_prefix_index, remove_prefix_index),
+    ]
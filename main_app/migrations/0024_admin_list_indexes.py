@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0023_attachments'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fare',
+            index=models.Index(fields=['date', 'id'], name='fare_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fare',
+            index=models.Index(fields=['category', 'date', 'id'], name='fare_category_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='share',
+            index=models.Index(fields=['created_at', 'id'], name='share_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='share',
+            index=models.Index(fields=['currency', 'created_at', 'id'], name='share_currency_created_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, F, Q, Sum
+
+
+def backfill_summaries(apps, schema_editor):
+    # shares created before 0012 had no summary rows until someone viewed them, so the profile page
+    # (built from ParticipantBalance alone) left them out; a fare written since then only created the
+    # rows it touched. Every share whose summary is missing or disagrees with its fares is rebuilt here
+    # with a few GROUP BY queries, later fare writes keep the rows up to date.
+    Share = apps.get_model('main_app', 'Share')
+    Fare = apps.get_model('main_app', 'Fare')
+    FareSplit = apps.get_model('main_app', 'FareSplit')
+    ShareSummary = apps.get_model('main_app', 'ShareSummary')
+    CategoryTotal = apps.get_model('main_app', 'CategoryTotal')
+    ParticipantBalance = apps.get_model('main_app', 'ParticipantBalance')
+    DailyTotal = apps.get_model('main_app', 'DailyTotal')
+
+    totals = (
+        Share.objects.order_by().annotate(fares=Count('fare'), expenses=Sum('fare__amount'))
+        .values('pk', 'fares', 'expenses', 'summary__fare_count', 'summary__total_expenses')
+    )
+    share_ids = [
+        row['pk'] for row in totals.iterator()
+        if row['summary__fare_count'] is None
+        or (row['summary__fare_count'], row['summary__total_expenses']) != (row['fares'], row['expenses'] or Decimal("0"))
+    ]
+    if not share_ids:
+        return
+
+    for start in range(0, len(share_ids), 500):
+        ids = share_ids[start:start + 500]
+        for model in (CategoryTotal, ParticipantBalance, DailyTotal):
+            model.objects.filter(share_id__in=ids).delete()
+        fares = Fare.objects.filter(share_id__in=ids).order_by()
+
+        summaries = {pk: {"fare_count": 0, "total_expenses": Decimal("0")} for pk in ids}
+        for row in fares.values('share_id').annotate(fare_count=Count('id'), total=Sum('amount')):
+            summaries[row['share_id']] = {"fare_count": row['fare_count'], "total_expenses": row['total']}
+        for pk, values in summaries.items():
+            ShareSummary.objects.update_or_create(share_id=pk, defaults=values)
+        ShareSummary.objects.filter(share_id__in=ids).update(version=F('version') + 1) # cached share pages are built again
+
+        CategoryTotal.objects.bulk_create(
+            (CategoryTotal(share_id=row['share_id'], category=row['category'], fare_count=row['fare_count'], total=row['total'])
+             for row in fares.values('share_id', 'category').annotate(fare_count=Count('id'), total=Sum('amount'))),
+            batch_size=1000,
+        )
+        DailyTotal.objects.bulk_create(
+            (DailyTotal(**row) for row in fares.values('share_id', 'date', 'category', 'paid_by_id')
+             .annotate(fare_count=Count('id'), total=Sum('amount'))),
+            batch_size=1000,
+        )
+
+        balances = { # participants, payers and everyone who owes, like ledger.expected_rows
+            (share_id, user_id): {"paid": Decimal("0"), "owes": Decimal("0")}
+            for share_id, user_id in Share.participants.through.objects.filter(share_id__in=ids).values_list('share_id', 'user_id')
+        }
+        for row in fares.values('share_id', 'paid_by_id').annotate(paid=Sum('amount')):
+            balances.setdefault((row['share_id'], row['paid_by_id']), {"paid": Decimal("0"), "owes": Decimal("0")})["paid"] = row['paid']
+        splits = FareSplit.objects.filter(fare__share_id__in=ids).order_by()
+        for row in splits.values('fare__share_id', 'user_id').annotate(cents=Sum('amount_cents')).filter(~Q(cents=0)):
+            balances.setdefault((row['fare__share_id'], row['user_id']), {"paid": Decimal("0"), "owes": Decimal("0")})["owes"] = Decimal(row['cents']) / 100
+        ParticipantBalance.objects.bulk_create(
+            (ParticipantBalance(share_id=share_id, user_id=user_id, **values) for (share_id, user_id), values in balances.items()),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0024_admin_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,8 @@
+from decimal import Decimal
+from pathlib import Path
+from uuid import uuid4
+
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
@@ -11,6 +16,13 @@ CURRENCIES = [
     ('GBP', '£ GBP 🇬🇧'),
 ]
 
+SPLIT_METHODS = [
+    ("equal", "Equally"),
+    ("shares", "By shares"),
+    ("percent", "By percentage"),
+    ("fixed", "By fixed amounts"),
+]
+
 FARE_TYPES = [
     ("activities", "Activities 🏖️"),
     ("entertainment", "Entertainment 🎟️"),
@@ -21,6 +33,12 @@ FARE_TYPES = [
     ("misc", "Miscellaneous 💡"),
 ]
 
+ATTACHMENT_STATUSES = [
+    ("pending", "Processing"),
+    ("ready", "Ready"),
+    ("failed", "Failed"),
+]
+
 
 
 
@@ -34,26 +52,200 @@ class Share(models.Model):
     def __str__(self):
         return self.title
 
+    def clean(self):
+        # fare amounts are stored in the share's currency, and the Home counters total them per currency,
+        # so the currency is fixed once there are fares (checked by ShareForm and the admin alike)
+        if self.pk and Fare.objects.filter(share_id=self.pk).exclude(share__currency=self.currency).exists():
+            raise ValidationError({'currency': "The currency can't be changed once the share has fares."})
+
+    def delete(self, *args, **kwargs):
+        from .bulk import deleting_shares # bulk imports the models
+        with deleting_shares([self.pk]): # one counter update instead of the ledger work of every fare
+            return super().delete(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse("share-detail", kwargs={"pk": self.pk})
 
+    class Meta:
+        indexes = [ # the admin changelist, newest first and by currency
+            models.Index(fields=['created_at', 'id'], name='share_created_idx'),
+            models.Index(fields=['currency', 'created_at', 'id'], name='share_currency_created_idx'),
+        ]
+
     
 class Fare(models.Model):
-    share = models.ForeignKey(Share, on_delete=models.CASCADE)
+    share = models.ForeignKey(Share, on_delete=models.CASCADE, db_index=False) # fare_share_date_idx starts with share
     name = models.CharField(max_length=100)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     date = models.DateField('Paid Date')
     category = models.CharField(max_length=100, choices=FARE_TYPES, default=FARE_TYPES[0][0])
     paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="fares_paid")
-    split_between = models.ManyToManyField(User, related_name="fares_split")
+    split_between = models.ManyToManyField(User, related_name="fares_split", through="FareSplit")
+    split_method = models.CharField(max_length=10, choices=SPLIT_METHODS, default=SPLIT_METHODS[0][0])
+    original_currency = models.CharField('Paid In', max_length=3, choices=CURRENCIES, blank=True) # blank means the share's currency
+    original_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True) # amount before conversion
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.convert_original_amount()
+        super().save(*args, **kwargs)
+
+    def convert_original_amount(self, share_currency=None):
+        # amount is always stored in the share's currency, the paid amount is kept alongside
+        from .fx import convert # fx imports the models
+        share_currency = share_currency or self.share.currency
+        if self.original_currency and self.original_currency != share_currency and self.original_amount is not None:
+            self.amount = convert(self.original_amount, self.original_currency, share_currency, self.date)
+        else:
+            self.original_currency = ''
+            self.original_amount = None
+
     def get_absolute_url(self):
         return reverse("share-detail", kwargs={"pk": self.share.pk})
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['share', 'date', 'id'], name='fare_share_date_idx'), # a share's fares newest first, keyset pages
+            models.Index(fields=['date', 'id'], name='fare_date_idx'), # the admin changelist across shares, and its date filter
+            models.Index(fields=['category', 'date', 'id'], name='fare_category_date_idx'), # the admin category filter
+        ]
+
+
+class FareSplit(models.Model):
+    # one row per person a fare is split between, amount_cents is allocated at write time (see allocation.py)
+    fare = models.ForeignKey(Fare, on_delete=models.CASCADE, db_index=False) # the unique (fare, user) index starts with fare
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    weight = models.DecimalField(max_digits=10, decimal_places=2, default=1) # shares, percent or fixed amount depending on split_method
+    amount_cents = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} in {self.fare}"
+
+    @property
+    def amount(self):
+        return Decimal(self.amount_cents).scaleb(-2)
+
+    class Meta:
+        db_table = 'main_app_fare_split_between' # the table Django created for the original plain ManyToManyField
+        unique_together = [('fare', 'user')]
+
+
+# Precomputed ledger rows, kept up to date by the signal handlers in signals.py
+# so ShareDetail reads a handful of rows instead of recomputing from every Fare.
+
+class ShareSummary(models.Model):
+    share = models.OneToOneField(Share, on_delete=models.CASCADE, related_name="summary")
+    fare_count = models.PositiveIntegerField(default=0)
+    total_expenses = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    version = models.PositiveBigIntegerField(default=0) # bumped on every fare or participant change
+
+    def __str__(self):
+        return f"{self.share} summary"
+
+
+class CategoryTotal(models.Model):
+    share = models.ForeignKey(Share, on_delete=models.CASCADE, related_name="category_totals", db_index=False) # covered by the unique (share, category) index
+    category = models.CharField(max_length=100, choices=FARE_TYPES)
+    fare_count = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    def __str__(self):
+        return f"{self.share} - {self.category}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['share', 'category'], name='unique_share_category_total'),
+        ]
+
+
+class ParticipantBalance(models.Model):
+    share = models.ForeignKey(Share, on_delete=models.CASCADE, related_name="balances", db_index=False) # covered by the unique (share, user) index
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="share_balances", db_index=False) # covered by balance_user_share_idx
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    owes = models.DecimalField(max_digits=12, decimal_places=2, default=0) # sum of allocated FareSplit amounts
+
+    def __str__(self):
+        return f"{self.user} in {self.share}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['share', 'user'], name='unique_share_participant_balance'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'share'], name='balance_user_share_idx'), # per-user dashboard lookups
+        ]
+
+
+class DailyTotal(models.Model):
+    # what one person paid in a share on one day in one category, the spending charts add these up (see analytics.py)
+    share = models.ForeignKey(Share, on_delete=models.CASCADE, related_name="daily_totals", db_index=False) # covered by the unique index
+    date = models.DateField()
+    category = models.CharField(max_length=100, choices=FARE_TYPES)
+    paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_totals", db_index=False) # covered by daily_payer_date_idx
+    fare_count = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.share} - {self.date} - {self.category}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['share', 'date', 'category', 'paid_by'], name='unique_share_daily_total'),
+        ]
+        indexes = [
+            models.Index(fields=['paid_by', 'date'], name='daily_payer_date_idx'), # one person's spending across shares
+        ]
+
+
+class SiteCounter(models.Model):
+    # running site-wide totals for the Home page, see counters.py
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class FxRate(models.Model):
+    # value of one unit of `currency` in USD on `date`, loaded from fixtures/fx_rates.csv
+    date = models.DateField()
+    currency = models.CharField(max_length=3, choices=CURRENCIES)
+    usd_rate = models.DecimalField(max_digits=14, decimal_places=6)
+
+    def __str__(self):
+        return f"{self.currency} {self.date}: {self.usd_rate}"
+
+    class Meta:
+        ordering = ['currency', 'date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'currency'], name='unique_fx_rate_per_day'),
+        ]
+
+
+def attachment_path(instance, filename):
+    # random names, an upload can never overwrite or guess another one
+    return f"attachments/{instance.share_id}/{uuid4().hex}{Path(filename).suffix.lower()}"
+
+
+class Attachment(models.Model):
+    # a receipt or photo on a share, or on one of its fares; thumbnails are made off-request, see attachments.py
+    share = models.ForeignKey(Share, on_delete=models.CASCADE, related_name="attachments")
+    fare = models.ForeignKey(Fare, on_delete=models.CASCADE, related_name="attachments", null=True, blank=True) # empty for the share's own photos
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="attachments")
+    file = models.FileField(upload_to=attachment_path)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    thumbnail = models.FileField(blank=True)
+    preview = models.FileField(blank=True)
+    status = models.CharField(max_length=10, choices=ATTACHMENT_STATUSES, default=ATTACHMENT_STATUSES[0][0])
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return Path(self.file.name).name
 
+    @property
+    def is_image(self):
+        return self.content_type.startswith('image/')
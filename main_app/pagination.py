@@ -0,0 +1,61 @@
+import base64
+import json
+
+from django.core.exceptions import BadRequest, ValidationError
+from django.db.models import Q
+
+# Keyset ("cursor") pagination.
+# Instead of OFFSET, each page continues after the last row of the previous
+# one: WHERE (date, id) < (last_date, last_id) ORDER BY date DESC, id DESC.
+# Every page is an index range scan of the same size, however deep it is.
+
+FARE_ORDERING = ('-date', '-id')
+SHARE_ORDERING = ('-created_at', '-id')
+
+
+def encode_cursor(obj, ordering):
+    values = [str(getattr(obj, name.lstrip('-'))) for name in ordering]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(values) != len(ordering):
+            raise ValueError
+        return [model._meta.get_field(name.lstrip('-')).to_python(value) for name, value in zip(ordering, values)]
+    except (ValueError, TypeError, ValidationError):
+        raise BadRequest("Invalid cursor")
+
+
+def after_cursor(ordering, values):
+    # (a, b) < (x, y) written as: a < x OR (a = x AND b < y), for any number of columns
+    condition = Q()
+    equal = {}
+    for name, value in zip(ordering, values):
+        field = name.lstrip('-')
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{field}__{lookup}': value})
+        equal[field] = value
+    return condition
+
+
+def page_query(queryset, ordering, cursor, size):
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(after_cursor(ordering, decode_cursor(cursor, queryset.model, ordering)))
+    return queryset[:size + 1] # one extra row tells us whether there is a next page
+
+
+def page_result(rows, ordering, size):
+    next_cursor = encode_cursor(rows[size - 1], ordering) if len(rows) > size else None
+    return rows[:size], next_cursor
+
+
+def keyset_page(queryset, ordering, cursor=None, size=50):
+    return page_result(list(page_query(queryset, ordering, cursor, size)), ordering, size)
+
+
+async def akeyset_page(queryset, ordering, cursor=None, size=50):
+    return page_result([row async for row in page_query(queryset, ordering, cursor, size)], ordering, size)
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models.functions import Collate, Upper
+
+# Username lookups for the participant picker (ShareForm).
+#
+# Usernames are matched case-insensitively by prefix, as a range on
+# UPPER(username) in byte order: key >= 'BO' AND key < 'BO\U0010ffff'. On
+# Postgres that range and the ORDER BY are both read straight off the
+# user_username_prefix_idx expression index (migration 0022), so a lookup
+# stops after LIMIT rows however many users there are. SQLite compares
+# BINARY, the same byte order, without an index.
+
+LIMIT = 10
+
+
+def username_key():
+    return Collate(Upper('username'), 'C' if connection.vendor == 'postgresql' else 'BINARY') # must stay the index expression
+
+
+def find_users(prefix, limit=LIMIT):
+    prefix = prefix.strip().upper()
+    if not prefix:
+        return []
+    return list(
+        get_user_model().objects.filter(is_active=True)
+        .alias(key=username_key())
+        .filter(key__gte=prefix, key__lt=prefix + '\U0010ffff') # the last code point, nothing sorts after it
+        .order_by('key')
+        .values('id', 'username')[:limit]
+    )
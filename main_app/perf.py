@@ -0,0 +1,220 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+# Per-request performance instrumentation.
+#
+# PerfMiddleware times a sampled share of requests: database time and query
+# count (through connection.execute_wrapper), view time and template render
+# time. Each sampled response gets a Server-Timing header (shown in the
+# browser's network tab), a log line on the "main_app.perf" logger and an
+# entry in an in-process rolling histogram per URL name, which staff can read
+# at /perf/. Histograms are per worker process, each worker has its own.
+#
+# PERF_SAMPLE_RATE (0 to 1) picks the share of requests that are timed. At 0
+# the middleware removes itself at startup, so it costs nothing at all.
+
+logger = logging.getLogger('main_app.perf')
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf')) # upper bounds
+WINDOW_SECONDS = 15 * 60 # the histogram forgets requests older than this
+SLICE_SECONDS = 60 # ...one minute at a time
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.view_start = None
+        self.view_end = None
+        self.rendered = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook, wraps every query the request runs
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def durations(self, end):
+        # milliseconds per phase, render is only known for TemplateResponse views
+        view_end = self.view_end or end
+        durations = {
+            'total': end - self.start,
+            'db': self.db,
+            'view': view_end - self.view_start if self.view_start else 0.0,
+            'render': self.rendered - self.view_end if self.rendered and self.view_end else 0.0,
+        }
+        return {name: seconds * 1000 for name, seconds in durations.items()}
+
+
+class RollingHistogram:
+    # latency buckets per URL name in one-minute slices, the last WINDOW_SECONDS are kept
+    def __init__(self, window=WINDOW_SECONDS, slice_seconds=SLICE_SECONDS, clock=time.monotonic):
+        self.slices = window // slice_seconds
+        self.slice_seconds = slice_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.data = defaultdict(dict) # url name -> {slice number: stats}
+
+    def add(self, name, total_ms, db_ms, queries):
+        now = int(self.clock() // self.slice_seconds)
+        bucket = next(i for i, bound in enumerate(BUCKETS_MS) if total_ms <= bound)
+        with self.lock:
+            slices = self.data[name]
+            stats = slices.get(now)
+            if stats is None:
+                stats = slices[now] = {'counts': [0] * len(BUCKETS_MS), 'total_ms': 0.0, 'db_ms': 0.0, 'queries': 0, 'max_ms': 0.0}
+                for old in [s for s in slices if s <= now - self.slices]:
+                    del slices[old]
+            stats['counts'][bucket] += 1
+            stats['total_ms'] += total_ms
+            stats['db_ms'] += db_ms
+            stats['queries'] += queries
+            stats['max_ms'] = max(stats['max_ms'], total_ms)
+
+    def snapshot(self):
+        oldest = int(self.clock() // self.slice_seconds) - self.slices
+        with self.lock:
+            views = {name: [s for n, s in slices.items() if n > oldest] for name, slices in self.data.items()}
+
+        result = {}
+        for name, slices in sorted(views.items()):
+            counts = [sum(s['counts'][i] for s in slices) for i in range(len(BUCKETS_MS))]
+            requests = sum(counts)
+            if not requests:
+                continue
+            result[name] = {
+                'requests': requests,
+                'mean_ms': round(sum(s['total_ms'] for s in slices) / requests, 2),
+                'mean_db_ms': round(sum(s['db_ms'] for s in slices) / requests, 2),
+                'mean_queries': round(sum(s['queries'] for s in slices) / requests, 2),
+                'max_ms': round(max(s['max_ms'] for s in slices), 2),
+                'p50_ms': bucket_percentile(counts, 50),
+                'p95_ms': bucket_percentile(counts, 95),
+                'p99_ms': bucket_percentile(counts, 99),
+                'buckets': {label(bound): count for bound, count in zip(BUCKETS_MS, counts)},
+            }
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+def label(bound):
+    return f"<={bound:g}ms" if bound != float('inf') else f">{BUCKETS_MS[-2]:g}ms"
+
+
+def bucket_percentile(counts, p):
+    # upper bound of the bucket the p-th percentile request falls in, None if it is the open-ended one
+    target = p / 100 * sum(counts)
+    seen = 0
+    for bound, count in zip(BUCKETS_MS, counts):
+        seen += count
+        if seen >= target and count:
+            return bound if bound != float('inf') else None
+    return None
+
+
+histogram = RollingHistogram()
+
+
+def server_timing(durations, queries):
+    return ', '.join([
+        f'db;dur={durations["db"]:.1f};desc="{queries} queries"',
+        f'view;dur={durations["view"]:.1f}',
+        f'render;dur={durations["render"]:.1f}',
+        f'total;dur={durations["total"]:.1f}',
+    ])
+
+
+class PerfMiddleware:
+    sync_capable = True
+    async_capable = True # stays on the event loop under ASGI
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PERF_SAMPLE_RATE', 0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed # taken out of the chain, zero per-request cost
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django would run the sync hooks through sync_to_async on every request
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        timings = request._perf_timings = RequestTimings()
+        with self.wrap_queries(timings):
+            response = self.get_response(request)
+        self.record(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timings = request._perf_timings = RequestTimings()
+        with self.wrap_queries(timings):
+            response = await self.get_response(request)
+        self.record(request, response, timings)
+        return response
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def wrap_queries(self, timings):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timings))
+        return stack
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(request, '_perf_timings', None)
+        if timings:
+            timings.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # the view has returned, the template is rendered right after the middleware hooks run
+        timings = getattr(request, '_perf_timings', None)
+        if timings:
+            timings.view_end = time.perf_counter()
+            response.add_post_render_callback(lambda r: setattr(timings, 'rendered', time.perf_counter()))
+        return response
+
+    async def aprocess_view(self, request, *args):
+        return PerfMiddleware.process_view(self, request, *args)
+
+    async def aprocess_template_response(self, request, response):
+        return PerfMiddleware.process_template_response(self, request, response)
+
+    def record(self, request, response, timings):
+        durations = timings.durations(time.perf_counter())
+        match = request.resolver_match
+        name = match.view_name if match else 'unresolved'
+        response['Server-Timing'] = server_timing(durations, timings.queries)
+        histogram.add(name, durations['total'], durations['db'], timings.queries)
+        logger.info(
+            "%s %s %s total=%.1fms view=%.1fms render=%.1fms db=%.1fms queries=%d",
+            name, request.method, response.status_code,
+            durations['total'], durations['view'], durations['render'], durations['db'], timings.queries,
+            extra={'url_name': name, 'method': request.method, 'status': response.status_code,
+                   'queries': timings.queries, **{f'{k}_ms': round(v, 2) for k, v in durations.items()}},
+        )
@@ -0,0 +1,95 @@
+from django.db import connection
+from django.db.models import Count
+
+from .models import Share, Fare, FareSplit, ParticipantBalance
+from .pagination import after_cursor, FARE_ORDERING, SHARE_ORDERING
+
+# EXPLAIN checks for the queries behind the main views.
+# Each check builds the same queryset a view runs and looks for the index
+# it should be served by in the database's plan. Run them against a
+# production-sized database (manage.py explain_queries): on tiny tables
+# Postgres rightly prefers a sequential scan, so a pass there means little.
+#
+# An index is named directly, or as (table, columns) for the ones Django
+# names itself (unique constraints, the through table's unique pair).
+
+
+def index_names(index):
+    # every name the index may appear under, SQLite also lists unique constraints as sqlite_autoindex_*
+    if isinstance(index, str):
+        return [index]
+    table, columns = index
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+        names = [
+            name for name, info in constraints.items()
+            if info['columns'] == list(columns) and (info['index'] or info['unique'])
+        ]
+        if connection.vendor == 'sqlite': # introspection skips the indexes SQLite creates for inline UNIQUE
+            for row in cursor.execute(f'PRAGMA index_list("{table}")').fetchall():
+                index_columns = [info[2] for info in cursor.execute(f'PRAGMA index_info("{row[1]}")').fetchall()]
+                if index_columns == list(columns):
+                    names.append(row[1])
+    return names
+
+
+def plan_checks(user, share):
+    fares = share.fare_set.order_by(*FARE_ORDERING)
+    middle = fares[25:26].first() or fares.first()
+    fare_ids = list(fares.values_list('id', flat=True)[:50])
+    return [
+        ("share index page",
+         Share.objects.filter(participants=user).order_by(*SHARE_ORDERING)[:25],
+         'share_participants_user_share_idx'),
+        ("share access check",
+         Share.objects.filter(participants=user, pk=share.pk),
+         ('main_app_share_participants', ['share_id', 'user_id'])),
+        ("share fare page",
+         fares.select_related('paid_by')[:51],
+         'fare_share_date_idx'),
+        ("share fare page after cursor",
+         fares.filter(after_cursor(FARE_ORDERING, [middle.date, middle.pk]))[:51] if middle else fares[:51],
+         'fare_share_date_idx'),
+        ("fare splits for a page",
+         FareSplit.objects.filter(fare__in=fare_ids).values_list('fare_id', 'user_id', 'amount_cents'),
+         ('main_app_fare_split_between', ['fare_id', 'user_id'])),
+        ("share balances",
+         ParticipantBalance.objects.filter(share=share),
+         ('main_app_participantbalance', ['share_id', 'user_id'])),
+        ("profile balances",
+         ParticipantBalance.objects.filter(user=user, share__participants=user).select_related('share'),
+         'balance_user_share_idx'),
+        ("admin fare list",
+         Fare.objects.order_by(*FARE_ORDERING)[:100],
+         'fare_date_idx'),
+        ("admin fares by category",
+         Fare.objects.filter(category=middle.category if middle else 'food_drink').order_by(*FARE_ORDERING)[:100],
+         'fare_category_date_idx'),
+        ("admin shares by currency",
+         Share.objects.filter(currency=share.currency).order_by(*SHARE_ORDERING)[:100],
+         'share_currency_created_idx'),
+    ]
+
+
+def explain(queryset, analyze=False):
+    if analyze and connection.vendor == 'postgresql':
+        return queryset.explain(analyze=True)
+    return queryset.explain()
+
+
+def sample_user_and_share():
+    # the busiest participant and share give the plans the most to choose between
+    share = Share.objects.annotate(fares=Count('fare')).order_by('-fares').first()
+    if share is None:
+        return None, None
+    user = share.participants.annotate(shares=Count('shares_participating')).order_by('-shares').first()
+    return user, share
+
+
+def run_checks(user, share, analyze=False):
+    # yields (label, expected index name, plan, whether the plan uses it)
+    for label, queryset, index in plan_checks(user, share):
+        names = index_names(index)
+        plan = explain(queryset, analyze)
+        used = [name for name in names if name in plan]
+        yield label, (used or names or [index])[0], plan, bool(used)
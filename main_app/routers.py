@@ -0,0 +1,114 @@
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Read replica routing.
+#
+# When DATABASES has a "replica" alias (DATABASE_REPLICA_URL), the read-only
+# pages below read from it and everything else, writes included, goes to the
+# primary. ReplicaMiddleware decides per request and ReplicaRouter follows
+# that decision through a context variable, so it holds for sync views,
+# async views and for streamed exports alike.
+#
+# Replicas lag the primary a little. After a POST (or any other write) the
+# middleware sets a short-lived cookie and that browser reads from the
+# primary until it expires, so people see their own changes right away.
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'primary_reads'
+READ_VIEWS = {
+    'home', 'share-index', 'share-detail', 'share-export', 'share-spending', 'fare-search',
+    'api-share', 'api-share-fares', 'api-share-spending', 'api-spending', 'api-users', 'attachment-file',
+}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+PRIMARY_APPS = {'sessions'} # a session created a moment ago may not have reached the replica yet
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or REPLICA not in connections.settings:
+            return None # the primary
+        if model._meta.app_label in PRIMARY_APPS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None # reads inside a transaction on the primary stay there
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True # both aliases hold the same data
+
+
+def reads_from_replica(request):
+    if request.method not in ('GET', 'HEAD') or STICKY_COOKIE in request.COOKIES:
+        return False
+    match = request.resolver_match
+    return match is not None and match.view_name in READ_VIEWS
+
+
+def on_replica(content):
+    # streamed responses (CSV exports) run their queries after the middleware has returned
+    previous = _use_replica.get()
+    _use_replica.set(True)
+    try:
+        yield from content
+    finally:
+        _use_replica.set(previous)
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not replica_configured():
+            raise MiddlewareNotUsed # no replica, every query goes to the primary anyway
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view # sets the flag in the request's own context
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica = _use_replica.get()
+            _use_replica.reset(token)
+        return self.finish(request, response, replica)
+
+    async def __acall__(self, request):
+        token = _use_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica = _use_replica.get()
+            _use_replica.reset(token)
+        return self.finish(request, response, replica)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if reads_from_replica(request):
+            _use_replica.set(True)
+
+    async def aprocess_view(self, request, *args):
+        return ReplicaMiddleware.process_view(self, request, *args)
+
+    def finish(self, request, response, replica):
+        if replica and response.streaming and not response.is_async:
+            response.streaming_content = on_replica(response.streaming_content)
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,74 @@
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from . import access
+from .models import Fare
+from .pagination import keyset_page, FARE_ORDERING
+
+# Fare search across every share a user participates in.
+#
+# On Postgres the name is matched with full-text search (the "simple"
+# configuration, fare names are short and multilingual) or, for typos and
+# partial words, trigram word similarity. Both are served by GIN indexes
+# (migration 0021) and ranked together. Other databases (SQLite test runs)
+# fall back to icontains on every word with a plain prefix ranking.
+#
+# Results with a text query are ranked, and paginated by page number up to
+# MAX_PAGES since a rank cannot be resumed from like a date. Filter-only
+# searches are ordered newest first and use the keyset pages of the share page.
+
+SEARCH_CONFIG = 'simple'
+PAGE_SIZE = 25
+MAX_PAGES = 20
+
+
+def name_vector():
+    from django.contrib.postgres.search import SearchVector # needs psycopg
+    return SearchVector('name', config=SEARCH_CONFIG) # must stay the fare_name_search_idx expression
+
+
+def ranked(fares, text):
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        return (
+            fares.alias(document=name_vector())
+            .filter(Q(document=query) | Q(name__trigram_word_similar=text))
+            .annotate(rank=SearchRank(name_vector(), query) + TrigramWordSimilarity(text, 'name'))
+        )
+    for word in text.split():
+        fares = fares.filter(name__icontains=word)
+    return fares.annotate(rank=Case(
+        When(name__iexact=text, then=Value(2)),
+        When(name__istartswith=text, then=Value(1)),
+        default=Value(0), output_field=IntegerField(),
+    ))
+
+
+def search_fares(user, text='', category='', paid_by=None, min_amount=None, max_amount=None, share_id=None):
+    fares = Fare.objects.filter(share_id__in=access.member_share_ids(user)).select_related('share', 'paid_by') # a subquery, still one query
+    if share_id is not None:
+        fares = fares.filter(share_id=share_id)
+    if category:
+        fares = fares.filter(category=category)
+    if paid_by is not None:
+        fares = fares.filter(paid_by=paid_by)
+    if min_amount is not None:
+        fares = fares.filter(amount__gte=min_amount)
+    if max_amount is not None:
+        fares = fares.filter(amount__lte=max_amount)
+    if text:
+        fares = ranked(fares, text)
+    return fares
+
+
+def search_page(fares, text='', page=1, cursor=None, size=PAGE_SIZE):
+    # (fares, next page number or None, next cursor or None)
+    if not text:
+        rows, next_cursor = keyset_page(fares, FARE_ORDERING, cursor, size)
+        return rows, None, next_cursor
+    page = max(1, min(page, MAX_PAGES))
+    start = (page - 1) * size
+    rows = list(fares.order_by('-rank', '-date', '-id')[start:start + size + 1])
+    next_page = page + 1 if len(rows) > size and page < MAX_PAGES else None
+    return rows[:size], next_page, None
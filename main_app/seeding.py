@@ -0,0 +1,113 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters, ledger
+from .bulk import insert_fares
+from .models import Share, Fare, FARE_TYPES, CURRENCIES
+
+# Synthetic data for benchmarks and query plan checks (manage.py seed_fareshare).
+# Everything is written with bulk_create in batches, so seeding a few hundred
+# thousand fares takes seconds, then the summaries and counters are rebuilt
+# once since bulk inserts skip the signal handlers.
+
+PASSWORD = 'fareshare'
+BATCH_SIZE = 2000
+
+# how many people a share has, roughly: most trips are small groups, a few are big ones
+GROUP_SIZES = [2, 3, 4, 5, 6, 8, 12, 20]
+GROUP_WEIGHTS = [20, 25, 25, 12, 8, 6, 3, 1]
+
+FARE_NAMES = {
+    'activities': ['Museum', 'Surf lesson', 'Hike guide', 'Boat tour'],
+    'entertainment': ['Concert', 'Cinema', 'Bowling', 'Comedy club'],
+    'food_drink': ['Dinner', 'Lunch', 'Groceries', 'Coffee', 'Drinks'],
+    'housing': ['Hotel', 'Cabin', 'Apartment', 'Hostel'],
+    'shopping': ['Souvenirs', 'Supplies', 'Sunscreen'],
+    'transportation': ['Taxi', 'Train', 'Fuel', 'Car rental', 'Parking'],
+    'misc': ['Tips', 'Laundry', 'Fees'],
+}
+
+
+def random_split(rng, members, payer):
+    # most fares are split with everyone, the rest with a few people, usually including the payer
+    if rng.random() < 0.7:
+        people = list(members)
+    else:
+        people = rng.sample(members, rng.randint(1, len(members)))
+        if payer not in people and rng.random() < 0.8:
+            people.append(payer)
+
+    roll = rng.random()
+    if roll < 0.8:
+        return 'equal', {u: Decimal("1") for u in people}
+    if roll < 0.95 or len(people) == 1:
+        return 'shares', {u: Decimal(rng.randint(1, 3)) for u in people}
+    cuts = sorted(rng.sample(range(1, 100), len(people) - 1)) # percentages that add up to 100
+    return 'percent', {u: Decimal(b - a) for u, a, b in zip(people, [0] + cuts, cuts + [100])}
+
+
+def random_fare(rng, share, members, today):
+    category = rng.choice(FARE_TYPES)[0]
+    payer = rng.choice(members)
+    method, weights = random_split(rng, members, payer)
+    fare = Fare(
+        share_id=share.pk, name=rng.choice(FARE_NAMES[category]), category=category, paid_by_id=payer,
+        amount=Decimal(str(round(min(rng.lognormvariate(3.2, 0.9), 5000), 2))), # mostly small, a few big ones
+        date=today - timedelta(days=rng.randint(0, 365)), split_method=method,
+    )
+    return fare, weights
+
+
+def seed(users=200, shares=50, fares_per_share=200, prefix='seed', rng_seed=1, log=None):
+    rng = random.Random(rng_seed)
+    today = timezone.localdate()
+    log = log or (lambda message: None)
+    result = {'users': 0, 'shares': 0, 'participants': 0, 'fares': 0, 'splits': 0}
+
+    with transaction.atomic():
+        start = User.objects.filter(username__startswith=f'{prefix}_').count() # reruns add new people
+        password = make_password(PASSWORD) # hashing once, not per user
+        people = User.objects.bulk_create(
+            [User(username=f'{prefix}_{start + i}', password=password) for i in range(users)], batch_size=BATCH_SIZE)
+        user_ids = [u.pk for u in people]
+        result['users'] = len(user_ids)
+        log(f"{len(user_ids)} users")
+
+        groups = [rng.sample(user_ids, min(rng.choices(GROUP_SIZES, GROUP_WEIGHTS)[0], len(user_ids))) for _ in range(shares)]
+        new_shares = Share.objects.bulk_create(
+            [Share(title=f'Trip {i + 1}', currency=rng.choice(CURRENCIES)[0], creator_id=group[0]) for i, group in enumerate(groups)],
+            batch_size=BATCH_SIZE)
+        Through = Share.participants.through
+        links = [Through(share_id=share.pk, user_id=u) for share, group in zip(new_shares, groups) for u in group]
+        Through.objects.bulk_create(links, batch_size=BATCH_SIZE)
+        result['shares'] = len(new_shares)
+        result['participants'] = len(links)
+        log(f"{len(new_shares)} shares with {len(links)} participants")
+
+        fares, weights = [], []
+        for share, group in zip(new_shares, groups):
+            for _ in range(rng.randint(fares_per_share // 2, fares_per_share * 3 // 2)):
+                fare, split = random_fare(rng, share, group, today)
+                fares.append(fare)
+                weights.append(split)
+                if len(fares) >= BATCH_SIZE:
+                    insert_fares(fares, weights, BATCH_SIZE)
+                    result['splits'] += sum(len(split) for split in weights)
+                    result['fares'] += len(fares)
+                    fares, weights = [], []
+        if fares:
+            insert_fares(fares, weights, BATCH_SIZE)
+            result['splits'] += sum(len(split) for split in weights)
+            result['fares'] += len(fares)
+        log(f"{result['fares']} fares with {result['splits']} splits")
+
+        for share in new_shares:
+            ledger.rebuild_summary(share)
+        counters.rebuild()
+    return result
@@ -0,0 +1,138 @@
+import heapq
+from decimal import Decimal, ROUND_HALF_UP
+
+# Settle-up suggestions: turns each participant's net balance into a short
+# list of "A pays B X" transfers. Everything is done in integer cents.
+#
+# Small groups get the exact minimum number of transfers: a group of n
+# balances needs n - k transfers, where k is the largest number of disjoint
+# subsets that each sum to zero, found with a DP over subsets.
+# Larger groups use a greedy matcher that always pairs the biggest
+# debtor with the biggest creditor (at most n - 1 transfers, O(n log n)).
+
+EXACT_LIMIT = 14 # 2^14 subsets is still a few milliseconds
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return (Decimal(cents) / 100).quantize(Decimal("0.01"))
+
+
+def balance_rounding(nets):
+    # per-person rounding can leave the group a cent or two off zero,
+    # the difference goes to the largest balance so the transfers still add up
+    drift = sum(nets.values())
+    if drift and nets:
+        largest = max(nets, key=lambda key: abs(nets[key]))
+        nets[largest] -= drift
+    return nets
+
+
+def greedy_transfers(nets):
+    creditors = [(-cents, i, key) for i, (key, cents) in enumerate(nets.items()) if cents > 0]
+    debtors = [(cents, i, key) for i, (key, cents) in enumerate(nets.items()) if cents < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, c_order, creditor = heapq.heappop(creditors)
+        debt, d_order, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, c_order, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, d_order, debtor))
+    return transfers
+
+
+def match_equal_pairs(nets):
+    # a debtor and creditor with the same amount always settle in one transfer
+    transfers = []
+    waiting = {}
+    rest = {}
+    for key, cents in nets.items():
+        partners = waiting.get(-cents)
+        if partners:
+            other = partners.pop()
+            transfers.append((other, key, cents) if cents > 0 else (key, other, -cents))
+            rest.pop(other)
+        else:
+            waiting.setdefault(cents, []).append(key)
+            rest[key] = cents
+    return transfers, rest
+
+
+def zero_sum_groups(keys, amounts):
+    n = len(amounts)
+    full = (1 << n) - 1
+    sums = [0] * (full + 1)
+    best = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + amounts[low.bit_length() - 1]
+        most = 0
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            if best[mask ^ bit] > most:
+                most = best[mask ^ bit]
+        best[mask] = most + (1 if sums[mask] == 0 else 0)
+
+    # walk back through the DP to recover the order elements were added in,
+    # every zero-sum prefix of that order closes a group
+    order = []
+    mask = full
+    while mask:
+        target = best[mask] - (1 if sums[mask] == 0 else 0)
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            if best[mask ^ bit] == target:
+                order.append(bit.bit_length() - 1)
+                mask ^= bit
+                break
+    order.reverse()
+
+    groups = []
+    current = []
+    running = 0
+    for index in order:
+        current.append(keys[index])
+        running += amounts[index]
+        if running == 0:
+            groups.append(current)
+            current = []
+    return groups
+
+
+def minimal_transfers(nets):
+    keys = list(nets)
+    transfers = []
+    for group in zero_sum_groups(keys, [nets[key] for key in keys]):
+        transfers.extend(greedy_transfers({key: nets[key] for key in group})) # k - 1 transfers per zero-sum group
+    return transfers
+
+
+def settle_cents(nets, exact_limit=EXACT_LIMIT):
+    nets = {key: cents for key, cents in balance_rounding(dict(nets)).items() if cents}
+    transfers, rest = match_equal_pairs(nets)
+    if len(rest) <= exact_limit:
+        return transfers + minimal_transfers(rest)
+    return transfers + greedy_transfers(rest)
+
+
+def suggest_transfers(balances, exact_limit=EXACT_LIMIT):
+    # balances are the dicts built by ledger.build_balances
+    people = {b["participant"].pk: b["participant"] for b in balances}
+    nets = {b["participant"].pk: to_cents(b["net"]) for b in balances}
+    return [
+        {"from": people[debtor], "to": people[creditor], "amount": from_cents(cents)}
+        for debtor, creditor, cents in settle_cents(nets, exact_limit)
+    ]
@@ -0,0 +1,111 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from . import allocation, attachments, bulk, counters, ledger
+from .models import Attachment, Share, Fare, ShareSummary
+
+# Keeps the ledger summary rows in sync with Fare and Share changes
+# and removes the files of deleted attachments.
+# "pre" handlers remember what a fare contributed before the change,
+# "post" handlers apply the difference once the change is written.
+
+
+@receiver(post_save, sender=Share)
+def create_share_summary(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        ShareSummary.objects.get_or_create(share=instance)
+        counters.bump(shares=1)
+    else:
+        ledger.bump_version(instance.pk) # title / currency are part of the share's representation
+
+
+@receiver(post_delete, sender=Share)
+def count_deleted_share(sender, instance, **kwargs):
+    counters.bump(shares=-1)
+
+
+@receiver(pre_save, sender=Fare)
+def remember_fare_before_save(sender, instance, raw=False, **kwargs):
+    if bulk.ledger_deferred():
+        return # the writer applies the ledger change itself (FareForm.save)
+    instance._ledger_before = ledger.fare_contribution(instance.pk) if instance.pk and not raw else None
+
+
+@receiver(post_save, sender=Fare)
+def update_ledger_after_save(sender, instance, raw=False, **kwargs):
+    if raw or bulk.ledger_deferred():
+        return
+    before = getattr(instance, '_ledger_before', None)
+    allocation.allocate_fare(instance) # the amount or split method may have changed
+    after = ledger.fare_contribution(instance.pk)
+    ledger.apply_change(before, after)
+    counters.record_fare_change(before, after)
+    instance._ledger_before = None
+
+
+@receiver(pre_delete, sender=Fare)
+def remember_fare_before_delete(sender, instance, **kwargs):
+    if bulk.ledger_deferred():
+        return # a bulk writer rebuilds the summary once at the end
+    instance._ledger_before = ledger.fare_contribution(instance.pk)
+
+
+@receiver(post_delete, sender=Fare)
+def update_ledger_after_delete(sender, instance, **kwargs):
+    if bulk.ledger_deferred():
+        return
+    ledger.apply_change(getattr(instance, '_ledger_before', None), None)
+    counters.record_fare_change(getattr(instance, '_ledger_before', None), None)
+    instance._ledger_before = None
+
+
+def changed_fare_ids(instance, reverse, pk_set):
+    if not reverse:
+        return [instance.pk]
+    if pk_set is None: # user.fares_split.clear()
+        return list(instance.fares_split.values_list('pk', flat=True))
+    return list(pk_set)
+
+
+@receiver(m2m_changed, sender=Fare.split_between.through)
+def update_ledger_on_split_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        fare_ids = changed_fare_ids(instance, reverse, pk_set)
+        instance._ledger_split_before = {fare_id: ledger.fare_contribution(fare_id) for fare_id in fare_ids}
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        before = getattr(instance, '_ledger_split_before', None) or {}
+        fares = Fare.objects.in_bulk(list(before)) if reverse else {instance.pk: instance}
+        for fare_id, contribution in before.items():
+            allocation.allocate_fare(fares[fare_id]) # re-split the fare between its new members
+            ledger.apply_change(contribution, ledger.fare_contribution(fare_id))
+        instance._ledger_split_before = None
+
+
+@receiver(m2m_changed, sender=Share.participants.through)
+def update_balances_on_participant_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._ledger_participants_before = list(
+            instance.participants.values_list('pk', flat=True) if not reverse
+            else instance.shares_participating.values_list('pk', flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_ledger_participants_before', None) or []
+
+    groups = {instance.pk: list(pk_set)} if not reverse else {share_id: [instance.pk] for share_id in pk_set}
+    for share_id, user_ids in groups.items():
+        if action == 'post_add':
+            ledger.ensure_balance_rows(share_id, user_ids) # new participants show up with a zero balance
+        else:
+            ledger.drop_empty_balance_rows(share_id, user_ids)
+        ledger.bump_version(share_id)
+
+
+@receiver(post_delete, sender=Attachment) # also sent for the attachments of a deleted fare or share
+def delete_attachment_files(sender, instance, **kwargs):
+    transaction.on_commit(lambda: attachments.delete_files(instance)) # a rolled back delete keeps its files
@@ -0,0 +1,24 @@
+// "Load more" links fetch the next keyset page as a fragment and append it.
+// The server sends the following cursor in the X-Next-Cursor header.
+// Without JavaScript the link still works and opens the next page in full.
+document.addEventListener('click', async (event) => {
+  const link = event.target.closest('a.load-more');
+  if (!link) return;
+  event.preventDefault();
+
+  const url = new URL(link.href);
+  url.searchParams.set('partial', '1');
+  const response = await fetch(url, { headers: { 'X-Requested-With': 'fetch' } });
+  if (!response.ok) return;
+
+  document.querySelector(link.dataset.target).insertAdjacentHTML('beforeend', await response.text());
+
+  const next = response.headers.get('X-Next-Cursor');
+  if (next) {
+    url.searchParams.delete('partial');
+    url.searchParams.set('cursor', next);
+    link.href = url.toString();
+  } else {
+    link.remove();
+  }
+});
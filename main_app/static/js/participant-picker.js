@@ -0,0 +1,71 @@
+// Participant picker for the share form (forms.UserAutocompleteWidget).
+// The <select multiple> only holds the people already chosen. This hides it,
+// shows them as removable chips and adds people found by username prefix
+// through the autocomplete endpoint. The select is still what gets submitted.
+document.querySelectorAll('.user-picker').forEach((picker) => {
+  const select = picker.querySelector('select[data-autocomplete-url]');
+  const chosen = picker.querySelector('.user-picker-chosen');
+  const search = picker.querySelector('.user-picker-search');
+  const results = picker.querySelector('.user-picker-results');
+  let timer = null;
+
+  const renderChosen = () => {
+    chosen.replaceChildren(...[...select.selectedOptions].map((option) => {
+      const chip = document.createElement('li');
+      chip.textContent = option.textContent;
+      const remove = document.createElement('button');
+      remove.type = 'button';
+      remove.textContent = '×';
+      remove.setAttribute('aria-label', `Remove ${option.textContent}`);
+      remove.addEventListener('click', () => { option.remove(); renderChosen(); });
+      chip.append(remove);
+      return chip;
+    }));
+  };
+
+  const choose = (user) => {
+    if (!select.querySelector(`option[value="${user.id}"]`)) {
+      select.append(new Option(user.username, user.id, true, true));
+    }
+    search.value = '';
+    results.hidden = true;
+    renderChosen();
+    search.focus();
+  };
+
+  const lookup = async () => {
+    const url = new URL(select.dataset.autocompleteUrl, window.location.origin);
+    url.searchParams.set('q', search.value.trim());
+    const response = await fetch(url, { headers: { 'X-Requested-With': 'fetch' } });
+    if (!response.ok) return;
+    const taken = new Set([...select.selectedOptions].map((option) => option.value));
+    const users = (await response.json()).results.filter((user) => !taken.has(String(user.id)));
+    results.replaceChildren(...users.map((user) => {
+      const item = document.createElement('li');
+      const button = document.createElement('button');
+      button.type = 'button';
+      button.textContent = user.username;
+      button.addEventListener('click', () => choose(user));
+      item.append(button);
+      return item;
+    }));
+    results.hidden = users.length === 0;
+  };
+
+  search.addEventListener('input', () => {
+    clearTimeout(timer);
+    if (!search.value.trim()) { results.hidden = true; return; }
+    timer = setTimeout(lookup, 150); // one request once typing pauses
+  });
+  search.addEventListener('keydown', (event) => {
+    if (event.key === 'Enter') { // pick the first match instead of submitting the form
+      event.preventDefault();
+      results.querySelector('button')?.click();
+    }
+  });
+
+  select.hidden = true;
+  chosen.hidden = false;
+  search.hidden = false;
+  renderChosen();
+});
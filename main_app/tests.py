@@ -1,3 +1,1302 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import CommandError
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, connections
+from django.http import Http404, HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from .ledger import build_ledger, summary_context, verify_summary, rebuild_summary
+from .models import Share, Fare, ShareSummary, CategoryTotal, DailyTotal, Attachment, FxRate
+from .settlement import settle_cents
+from .counters import home_metrics
+from .importer import import_fares
+from . import fx
+from .allocation import allocate, AllocationError
+from .pagination import keyset_page, FARE_ORDERING
+from .views import ShareDetail
+from .query_plans import run_checks
+from .seeding import seed
+from .benchmarks import run, BUDGETS, noise_jpeg
+from . import admin as fare_admin, analytics, assets, attachments, people, perf, routers, search, views
 
 # Create your tests here.
+
+
+def make_share(creator, participants, title="Trip", currency="USD"):
+    share = Share.objects.create(title=title, currency=currency, creator=creator)
+    share.participants.add(creator, *participants)
+    return share
+
+
+def make_fare(share, paid_by, amount, split_between, category="food_drink", name="Fare", day=None):
+    fare = Fare.objects.create(
+        share=share, name=name, amount=Decimal(amount), date=day or date(2025, 1, 1),
+        category=category, paid_by=paid_by,
+    )
+    fare.split_between.set(split_between)
+    return fare
+
+
+class LedgerTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.carol = User.objects.create_user('carol', password='pw')
+        self.share = make_share(self.alice, [self.bob, self.carol])
+
+    def test_balances_and_totals(self):
+        make_fare(self.share, self.alice, '90.00', [self.alice, self.bob, self.carol])
+        make_fare(self.share, self.bob, '30.00', [self.alice, self.bob], category="housing")
+
+        ledger = build_ledger(self.share, self.bob)
+
+        self.assertEqual(ledger["total_fares"], 2)
+        self.assertEqual(ledger["total_expenses"], Decimal("120.00"))
+        self.assertEqual(ledger["my_expenses"], Decimal("45.00"))
+        self.assertEqual(ledger["balances"][0]["participant"], self.bob) # viewer is listed first
+        nets = {b["participant"].username: b["net"] for b in ledger["balances"]}
+        self.assertEqual(nets, {"alice": Decimal("45.00"), "bob": Decimal("-15.00"), "carol": Decimal("-30.00")})
+        self.assertEqual(list(ledger["category_totals"].values()), [Decimal("90.00"), Decimal("30.00")])
+
+    def count_ledger_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            build_ledger(self.share, self.alice)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_fares_or_participants(self):
+        make_fare(self.share, self.alice, '10.00', [self.alice, self.bob])
+        baseline = self.count_ledger_queries()
+
+        extra = [User.objects.create_user(f'user{i}', password='pw') for i in range(10)]
+        self.share.participants.add(*extra)
+        everyone = [self.alice, self.bob, self.carol, *extra]
+        for i in range(25):
+            make_fare(self.share, everyone[i % len(everyone)], '12.34', everyone)
+
+        self.assertEqual(self.count_ledger_queries(), baseline)
+
+
+class LedgerSummaryTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.carol = User.objects.create_user('carol', password='pw')
+        self.share = make_share(self.alice, [self.bob, self.carol])
+
+    def assertSummaryMatchesFares(self):
+        self.assertEqual(verify_summary(self.share), [])
+        self.assertEqual(summary_context(self.share, self.alice), build_ledger(self.share, self.alice))
+
+    def test_summary_follows_fare_and_split_changes(self):
+        dinner = make_fare(self.share, self.alice, '90.00', [self.alice, self.bob, self.carol])
+        taxi = make_fare(self.share, self.bob, '20.00', [self.bob, self.carol], category="transportation")
+        self.assertSummaryMatchesFares()
+
+        dinner.amount = Decimal("100.00")
+        dinner.paid_by = self.carol
+        dinner.category = "misc"
+        dinner.save()
+        self.assertSummaryMatchesFares()
+
+        dinner.split_between.remove(self.carol)
+        self.carol.fares_split.add(taxi, dinner)
+        taxi.split_between.clear()
+        self.assertSummaryMatchesFares()
+
+        taxi.delete()
+        self.assertSummaryMatchesFares()
+        self.assertEqual(ShareSummary.objects.get(share=self.share).fare_count, 1)
+
+    def test_participant_changes_keep_balance_rows(self):
+        dave = User.objects.create_user('dave', password='pw')
+        self.share.participants.add(dave)
+        self.assertTrue(self.share.balances.filter(user=dave).exists())
+        self.share.participants.remove(dave)
+        self.assertFalse(self.share.balances.filter(user=dave).exists())
+        self.assertSummaryMatchesFares()
+
+    def test_command_detects_and_fixes_drift(self):
+        make_fare(self.share, self.alice, '30.00', [self.alice, self.bob])
+        ShareSummary.objects.filter(share=self.share).update(total_expenses=Decimal("1.00"))
+
+        with self.assertRaises(CommandError):
+            call_command('ledger_summaries', '--verify', stdout=StringIO())
+        call_command('ledger_summaries', stdout=StringIO())
+        self.assertSummaryMatchesFares()
+
+    def test_share_delete_skips_per_fare_ledger_work(self):
+        other = make_share(self.bob, [self.alice], currency="EUR")
+        make_fare(other, self.bob, '5.00', [self.bob])
+        home_metrics() # builds the counters
+        queries = {}
+        for size in (2, 20):
+            share = make_share(self.alice, [self.bob], title=f"Trip {size}")
+            for i in range(size):
+                make_fare(share, self.alice, '10.00', [self.alice, self.bob])
+            with CaptureQueriesContext(connection) as captured:
+                share.delete()
+            queries[size] = len(captured)
+        self.assertEqual(queries[2], queries[20])
+        self.assertEqual(home_metrics()["expenses_by_currency"]["USD"], Decimal("0"))
+        self.assertEqual(home_metrics()["total_fares"], 1)
+
+        self.client.force_login(self.bob)
+        self.client.post(reverse('share-delete', kwargs={'pk': other.pk}))
+        self.assertEqual((home_metrics()["total_fares"], home_metrics()["total_shares"]), (0, 1))
+
+
+class SettlementTests(TestCase):
+
+    def assertSettles(self, nets, transfers):
+        remaining = dict(nets)
+        for debtor, creditor, cents in transfers:
+            self.assertGreater(cents, 0)
+            remaining[debtor] += cents
+            remaining[creditor] -= cents
+        self.assertFalse(any(remaining.values()))
+
+    def test_exact_search_splits_into_zero_sum_groups(self):
+        # {a, d, f} and {b, c, e} settle separately in 2 + 2 transfers
+        nets = {"a": 700, "b": 500, "c": 100, "d": -400, "e": -600, "f": -300}
+        transfers = settle_cents(nets)
+        self.assertSettles(nets, transfers)
+        self.assertEqual(len(transfers), 4)
+        self.assertEqual(len(settle_cents(nets, exact_limit=0)), 5) # greedy alone needs one more
+
+    def test_large_groups_use_greedy_matcher(self):
+        nets = {i: (i % 97) * 13 - 600 for i in range(1500)}
+        nets[0] -= sum(nets.values())
+        transfers = settle_cents(nets)
+        self.assertSettles(nets, transfers)
+        self.assertLess(len(transfers), len(nets))
+
+    def test_settle_page_lists_transfers(self):
+        alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+        share = make_share(alice, [bob])
+        make_fare(share, alice, '50.00', [alice, bob])
+
+        self.client.force_login(bob)
+        response = self.client.get(reverse('share-settle', kwargs={'pk': share.pk}))
+        self.assertEqual(response.context["transfers"], [{"from": bob, "to": alice, "amount": Decimal("25.00")}])
+
+
+class HomeCounterTests(TestCase):
+
+    def totals(self):
+        metrics = home_metrics()
+        return metrics["total_shares"], metrics["total_fares"], metrics["total_expenses"]
+
+    def test_home_counters_follow_writes(self):
+        alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+        self.assertEqual(self.totals(), (0, 0, Decimal("0")))
+
+        share = make_share(alice, [bob])
+        fare = make_fare(share, alice, '40.00', [alice, bob])
+        make_fare(make_share(bob, []), bob, '10.50', [bob])
+        fare.amount = Decimal("45.00")
+        fare.save()
+        self.assertEqual(self.totals(), (2, 2, Decimal("55.50")))
+
+        share.delete()
+        self.assertEqual(self.totals(), (1, 1, Decimal("10.50")))
+
+    def test_share_currency_is_fixed_once_it_has_fares(self):
+        alice = User.objects.create_user('alice', password='pw')
+        share = make_share(alice, [])
+        self.client.force_login(alice)
+        url = reverse('share-update', kwargs={'pk': share.pk})
+        data = {'title': 'Trip', 'currency': 'EUR', 'participants': [alice.pk]}
+        self.assertEqual(self.client.post(url, data).status_code, 302) # no fares yet
+        share.refresh_from_db()
+        self.assertEqual(share.currency, 'EUR')
+
+        make_fare(share, alice, '20.00', [alice])
+        response = self.client.post(url, {**data, 'currency': 'USD'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('currency', response.context['form'].errors)
+        share.refresh_from_db()
+        self.assertEqual(share.currency, 'EUR')
+        self.assertEqual(home_metrics()["expenses_by_currency"]["EUR"], Decimal("20.00"))
+
+    def test_home_page_query_count_is_constant(self):
+        home_metrics()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context["total_shares"], 0)
+
+
+class ProfileTests(TestCase):
+
+    def test_net_position_across_shares_by_currency(self):
+        alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+        trip = make_share(alice, [bob], currency="USD")
+        dinner = make_share(bob, [alice], currency="USD")
+        london = make_share(bob, [alice], currency="GBP")
+        make_share(bob, []) # alice is not part of this one
+        make_fare(trip, alice, '100.00', [alice, bob])
+        make_fare(dinner, bob, '30.00', [alice, bob])
+        make_fare(london, bob, '12.00', [alice, bob])
+
+        self.client.force_login(alice)
+        with self.assertNumQueries(3): # session, user, balances
+            response = self.client.get(reverse('profile'))
+
+        self.assertEqual(len(response.context["share_balances"]), 3)
+        self.assertEqual(response.context["currency_totals"], [
+            {"currency": "GBP", "paid": Decimal("0.00"), "owes": Decimal("6.00"), "net": Decimal("-6.00")},
+            {"currency": "USD", "paid": Decimal("100.00"), "owes": Decimal("65.00"), "net": Decimal("35.00")},
+        ])
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.share = make_share(self.alice, [])
+        for i in range(7):
+            make_fare(self.share, self.alice, '1.00', [self.alice], name=f"fare {i}", day=date(2025, 1, 1 + i % 3))
+        self.client.force_login(self.alice)
+
+    def test_pages_cover_every_fare_once_in_date_order(self):
+        seen = []
+        cursor = None
+        while True:
+            fares, cursor = keyset_page(self.share.fare_set.all(), FARE_ORDERING, cursor, size=3)
+            seen.extend(fares)
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(seen, key=lambda f: (f.date, f.id), reverse=True))
+
+    def test_load_more_fragment_uses_the_same_cursor(self):
+        url = reverse('share-detail', kwargs={'pk': self.share.pk})
+        with mock.patch.object(ShareDetail, 'page_size', 4):
+            first = self.client.get(url)
+            with self.assertNumQueries(4): # session, user, share, fares with paid_by
+                rest = self.client.get(url, {'cursor': first["X-Next-Cursor"], 'partial': 1})
+
+        self.assertEqual(len(first.context["fares"]), 4)
+        self.assertEqual(len(rest.context["fares"]), 3)
+        self.assertNotIn("X-Next-Cursor", rest)
+        self.assertTemplateUsed(rest, 'shares/_fare_rows.html')
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(reverse('share-index'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ShareApiTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.share = make_share(self.alice, [self.bob])
+        make_fare(self.share, self.alice, '10.00', [self.alice, self.bob])
+        self.url = reverse('api-share', kwargs={'pk': self.share.pk})
+        self.client.force_login(self.bob)
+
+    def test_summary_json(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data["total_expenses"], "10.00")
+        self.assertEqual(data["my_expenses"], "5.00")
+        self.assertEqual(data["balances"][0], {"user_id": self.bob.pk, "username": "bob", "paid": "0.00", "owes": "5.00", "net": "-5.00"})
+        self.assertEqual(data["categories"], [{"category": "food_drink", "label": "Food & Drink 🍽️", "total": "10.00"}])
+
+    def test_unchanged_poll_gets_304_without_recomputing(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(3): # session, user, share joined to its summary
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        make_fare(self.share, self.bob, '4.00', [self.bob])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        self.share.participants.add(User.objects.create_user('carol', password='pw'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_fares_page_and_access_rule(self):
+        data = self.client.get(reverse('api-share-fares', kwargs={'pk': self.share.pk})).json()
+        self.assertEqual(len(data["fares"]), 1)
+        self.assertEqual(
+            sorted((s["user_id"], s["amount"]) for s in data["fares"][0]["split_between"]),
+            [(self.alice.pk, "5.00"), (self.bob.pk, "5.00")])
+
+        self.client.force_login(User.objects.create_user('mallory', password='pw'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class FareImportTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.share = make_share(self.alice, [self.bob])
+
+    def test_valid_rows_are_imported_and_bad_rows_reported(self):
+        csv_file = BytesIO(
+            "name,amount,date,category,paid_by,split_between\n"
+            "Hotel,300.00,2025-03-01,Housing,alice,\n"
+            "Taxi,abc,2025-03-02,transportation,bob,alice\n"
+            "Lunch,24.50,2025-03-02,food_drink,bob,alice;bob\n"
+            "Museum,10.00,2025-03-03,activities,mallory,alice\n"
+            "Snacks,6.00,2025-03-03,,alice,bob\n".encode()
+        )
+        result = import_fares(self.share, csv_file, batch_size=2)
+
+        self.assertEqual(result.created, 3)
+        self.assertEqual([line for line, _ in result.errors], [3, 5])
+        self.assertEqual(Fare.objects.get(name="Hotel").category, "housing")
+        self.assertEqual(set(Fare.objects.get(name="Hotel").split_between.all()), {self.alice, self.bob})
+        self.assertEqual(verify_summary(self.share), [])
+        self.assertEqual(home_metrics()["total_expenses"], Decimal("330.50"))
+
+    def test_weights_that_are_not_finite_or_too_long_are_row_errors(self):
+        body = ("name,amount,date,paid_by,split_between,split_method\n"
+                "A,10.00,2025-01-01,alice,alice:NaN;bob:1,shares\n"
+                "B,10.00,2025-01-01,alice,alice:Infinity;bob:1,shares\n"
+                "C,10.00,2025-01-01,alice,alice:123456789;bob:1,shares\n"
+                "D,10.00,2025-01-01,alice,alice:3;bob:1,shares\n")
+        result = import_fares(self.share, StringIO(body))
+        self.assertEqual((result.created, [line for line, _ in result.errors]), (1, [2, 3, 4]))
+
+    def test_a_file_that_is_not_utf8_is_one_error_not_a_500(self):
+        body = "name,amount,date,paid_by,split_between\nHotel,10.00,2025-01-01,alice,\nCafé €,4.00,2025-01-02,alice,\n"
+        self.client.force_login(self.alice)
+        response = self.client.post(reverse('fare-import', kwargs={'share_id': self.share.pk}),
+                                    {'file': SimpleUploadedFile('fares.csv', body.encode('cp1252'))})
+        self.assertEqual(response.status_code, 200)
+        result = response.context['result']
+        self.assertEqual((result.created, result.error_count), (0, 1))
+        self.assertIn("not UTF-8", result.errors[0][1])
+        self.assertFalse(Fare.objects.exists()) # the valid first row is rolled back too
+
+    def test_a_missing_exchange_rate_is_a_row_error(self):
+        FxRate.objects.filter(currency='GBP').delete()
+        fx.clear_cache()
+        self.addCleanup(fx.clear_cache)
+        body = ("name,amount,date,paid_by,split_between,currency\n"
+                "Tea,3.00,2025-01-01,alice,,GBP\n"
+                "Lunch,8.00,2025-01-01,alice,,\n")
+        result = import_fares(self.share, StringIO(body))
+        self.assertEqual((result.created, [line for line, _ in result.errors]), (1, [2]))
+        self.assertIn("GBP", result.errors[0][1])
+
+    def test_query_count_does_not_grow_per_row(self):
+        def run(rows):
+            body = "name,amount,date,paid_by,split_between\n" + "".join(
+                f"Fare {i},1.00,2025-01-01,alice,alice;bob\n" for i in range(rows))
+            with CaptureQueriesContext(connection) as ctx:
+                import_fares(self.share, BytesIO(body.encode()), batch_size=1000)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(run(5), run(100))
+
+    def test_upload_view_and_missing_columns(self):
+        self.client.force_login(self.bob)
+        upload = SimpleUploadedFile("fares.csv", b"name,amount\nHotel,1.00\n", content_type="text/csv")
+        response = self.client.post(reverse('fare-import', kwargs={'share_id': self.share.pk}), {'file': upload})
+        self.assertEqual(response.context["result"].errors, [(1, "missing columns: date, paid_by")])
+        self.assertFalse(Fare.objects.exists())
+
+
+class ShareExportTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.share = make_share(self.alice, [self.bob])
+        make_fare(self.share, self.alice, '30.00', [self.alice, self.bob], name="Hotel", day=date(2025, 3, 1))
+        make_fare(self.share, self.bob, '8.00', [self.bob], name="Taxi", day=date(2025, 3, 2))
+        self.client.force_login(self.alice)
+
+    def export(self, fmt, **params):
+        response = self.client.get(reverse('share-export', kwargs={'pk': self.share.pk, 'fmt': fmt}), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_round_trips_through_the_importer(self):
+        body = self.export('csv')
+        self.assertEqual(body.splitlines()[1], f"{Fare.objects.get(name='Hotel').pk},Hotel,30.00,2025-03-01,food_drink,alice,equal,alice;bob,")
+
+        copy = make_share(self.alice, [self.bob], title="Copy")
+        self.assertEqual(import_fares(copy, StringIO(body)).created, 2)
+
+    def test_csv_cells_never_run_as_formulas(self):
+        make_fare(self.share, self.alice, '-5.00', [self.alice], name='=HYPERLINK("http://x","refund")', day=date(2025, 3, 3))
+        make_fare(self.share, self.alice, '1.00', [self.alice], name="'quoted", day=date(2025, 3, 4))
+        lines = self.export('csv').splitlines()
+        self.assertIn(',"\'=HYPERLINK(""http://x"",""refund"")",-5.00,', lines[3])
+        self.assertIn(",''quoted,1.00,", lines[4])
+
+        copy = make_share(self.alice, [self.bob], title="Copy")
+        import_fares(copy, StringIO('\n'.join(lines)))
+        self.assertEqual(sorted(copy.fare_set.values_list('name', flat=True))[:2], ["'quoted", '=HYPERLINK("http://x","refund")'])
+
+    def test_json_and_balances(self):
+        data = json.loads(self.export('json'))
+        self.assertEqual([f["name"] for f in data["fares"]], ["Hotel", "Taxi"])
+        self.assertEqual(data["balances"][0], {"participant": "alice", "paid": "30.00", "owes": "15.00", "net": "15.00"})
+        self.assertIn("bob,8.00,23.00,-15.00", self.export('csv', section='balances'))
+
+
+class CurrencyTests(TestCase):
+
+    def setUp(self):
+        fx.load_rates([("2025-01-01", "EUR", Decimal("1.10")), ("2025-02-01", "EUR", Decimal("1.20")),
+                       ("2025-01-01", "GBP", Decimal("1.25"))])
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.share = make_share(self.alice, [], currency="EUR")
+
+    def tearDown(self):
+        fx.clear_cache()
+
+    def test_rates_use_the_latest_day_on_or_before_the_fare(self):
+        self.assertEqual(fx.convert(Decimal("11.00"), "USD", "EUR", date(2025, 1, 20)), Decimal("10.00"))
+        self.assertEqual(fx.convert(Decimal("10.00"), "EUR", "USD", date(2025, 2, 3)), Decimal("12.00"))
+        self.assertEqual(fx.convert(Decimal("10.00"), "GBP", "EUR", date(2025, 1, 5)), Decimal("11.36"))
+
+    def test_fares_paid_in_another_currency_are_stored_converted(self):
+        self.client.force_login(self.alice)
+        self.client.post(reverse('fare-create', kwargs={'share_id': self.share.pk}), {
+            'name': 'Pub', 'amount': '25.00', 'original_currency': 'GBP', 'date': '2025-01-10',
+            'category': 'food_drink', 'paid_by': self.alice.pk, 'split_between': [self.alice.pk], 'split_method': 'equal',
+        })
+        fare = Fare.objects.get()
+        self.assertEqual((fare.amount, fare.original_amount, fare.original_currency), (Decimal("28.41"), Decimal("25.00"), "GBP"))
+
+        body = "name,amount,date,paid_by,currency\nTaxi,11.00,2025-01-10,alice,USD\n"
+        import_fares(self.share, StringIO(body))
+        self.assertEqual(Fare.objects.get(name="Taxi").amount, Decimal("10.00"))
+
+    def test_fixed_splits_in_another_currency_import_like_the_form_saves_them(self):
+        bob = User.objects.create_user('bob', password='pw')
+        share = make_share(self.alice, [bob], currency="USD")
+        body = ("name,amount,date,paid_by,split_between,split_method,currency\n"
+                "Dinner,10,2025-06-01,alice,alice:6;bob:4,fixed,EUR\n"
+                "Taxi,10,2025-06-01,alice,alice:6;bob:5,fixed,EUR\n")
+        result = import_fares(share, StringIO(body))
+        self.assertEqual((result.created, [line for line, _ in result.errors]), (1, [3]))
+        fare = Fare.objects.get(name="Dinner")
+        cents = dict(fare.faresplit_set.values_list('user__username', 'amount_cents'))
+        self.assertEqual((fare.original_amount, sum(cents.values())), (Decimal("10.00"), int(fare.amount * 100)))
+        self.assertEqual(cents['alice'], round(fare.amount * 60)) # the 6:4 proportion survives the conversion
+
+    def test_export_round_trips_a_fixed_split_paid_in_another_currency(self):
+        bob = User.objects.create_user('bob', password='pw')
+        share = make_share(self.alice, [bob], currency="USD")
+        self.client.force_login(self.alice)
+        self.client.post(reverse('fare-create', kwargs={'share_id': share.pk}), {
+            'name': 'Dinner', 'amount': '10.00', 'original_currency': 'EUR', 'date': '2025-06-01', 'category': 'food_drink',
+            'paid_by': self.alice.pk, 'split_between': [self.alice.pk, bob.pk], 'split_method': 'fixed',
+            f'weight_{self.alice.pk}': '6', f'weight_{bob.pk}': '4'})
+        response = self.client.get(reverse('share-export', kwargs={'pk': share.pk, 'fmt': 'csv'}))
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.splitlines()[1].endswith(",Dinner,10.00,2025-06-01,food_drink,alice,fixed,alice:6.00;bob:4.00,EUR"), body)
+
+        copy = make_share(self.alice, [bob], title="Copy", currency="USD")
+        self.assertEqual(import_fares(copy, StringIO(body)).errors, [])
+        original, imported = Fare.objects.get(share=share), Fare.objects.get(share=copy)
+        fields = ('amount', 'original_amount', 'original_currency', 'split_method')
+        self.assertEqual([getattr(imported, f) for f in fields], [getattr(original, f) for f in fields])
+        splits = lambda fare: sorted(fare.faresplit_set.values_list('user_id', 'weight', 'amount_cents'))
+        self.assertEqual(splits(imported), splits(original))
+
+    def test_home_total_converts_each_currency_once(self):
+        make_fare(self.share, self.alice, '100.00', [self.alice], day=date(2025, 2, 2))
+        make_fare(make_share(self.alice, [], currency="USD"), self.alice, '5.00', [self.alice])
+        with mock.patch('main_app.fx.timezone.localdate', return_value=date(2025, 2, 15)):
+            self.assertEqual(home_metrics()["total_expenses"], Decimal("125.00"))
+
+    def test_home_and_profile_survive_a_missing_rate(self):
+        FxRate.objects.filter(currency='GBP').delete() # no GBP fares, so the Home total needs no GBP rate
+        fx.clear_cache()
+        self.addCleanup(fx.clear_cache)
+        bob = User.objects.create_user('bob', password='pw')
+        self.share.participants.add(bob)
+        make_fare(self.share, self.alice, '10.00', [bob]) # alice is owed 10.00 EUR
+        self.assertIsNotNone(home_metrics()["total_expenses"])
+
+        FxRate.objects.filter(currency='EUR').delete()
+        fx.clear_cache()
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context["total_expenses"])
+        self.assertContains(response, "10.00 EUR")
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "Overall Net")
+
+
+class AllocationTests(TestCase):
+
+    def test_largest_remainder_always_adds_up(self):
+        self.assertEqual(allocate(10000, 'equal', [1, 1, 1]), [3334, 3333, 3333])
+        self.assertEqual(allocate(1000, 'shares', [2, 1]), [667, 333])
+        self.assertEqual(allocate(-1000, 'percent', [Decimal("12.5"), Decimal("87.5")]), [-125, -875])
+        self.assertEqual(allocate(1000, 'fixed', [Decimal("2.50"), Decimal("7.50")]), [250, 750])
+        for weights in ([1] * 7, [3, 5, 11], [Decimal("0.01"), 1, 99]):
+            self.assertEqual(sum(allocate(12345, 'shares', weights)), 12345)
+
+    def test_invalid_weights_are_rejected(self):
+        with self.assertRaises(AllocationError):
+            allocate(1000, 'percent', [50, 40])
+        with self.assertRaises(AllocationError):
+            allocate(1000, 'fixed', [Decimal("5.00"), Decimal("4.00")])
+        with self.assertRaises(AllocationError):
+            allocate(1000, 'shares', [0, 0])
+
+    def test_weighted_fare_through_the_form(self):
+        alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+        share = make_share(alice, [bob])
+        self.client.force_login(alice)
+        url = reverse('fare-create', kwargs={'share_id': share.pk})
+        data = {
+            'name': 'Cabin', 'amount': '100.00', 'date': '2025-05-01', 'category': 'housing', 'paid_by': alice.pk,
+            'split_between': [alice.pk, bob.pk], 'split_method': 'percent', f'weight_{alice.pk}': '70', f'weight_{bob.pk}': '20',
+        }
+        response = self.client.post(url, data)
+        self.assertContains(response, "Percentages must add up to 100.")
+
+        data[f'weight_{bob.pk}'] = '30'
+        self.client.post(url, data)
+        fare = Fare.objects.get()
+        self.assertEqual(dict(fare.faresplit_set.values_list('user__username', 'amount_cents')), {'alice': 7000, 'bob': 3000})
+        self.assertEqual(verify_summary(share), [])
+        self.assertEqual(summary_context(share, alice)["balances"][1]["net"], Decimal("-30.00"))
+
+        version = ShareSummary.objects.get(share=share).version
+        self.client.post(reverse('fare-update', kwargs={'share_id': share.pk, 'pk': fare.pk}), {**data, 'amount': '50.00'})
+        self.assertEqual(ShareSummary.objects.get(share=share).version, version + 1) # the ledger moves once
+        self.assertEqual(verify_summary(share), [])
+
+    def test_a_weight_of_zero_is_kept(self):
+        alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+        share = make_share(alice, [bob])
+        self.client.force_login(alice)
+        url = reverse('fare-create', kwargs={'share_id': share.pk})
+        data = {'amount': '10.00', 'date': '2025-05-01', 'category': 'housing', 'paid_by': alice.pk, 'split_between': [alice.pk, bob.pk]}
+        self.client.post(url, {**data, 'name': 'Shares', 'split_method': 'shares', f'weight_{alice.pk}': '2', f'weight_{bob.pk}': '0'})
+        self.client.post(url, {**data, 'name': 'Fixed', 'split_method': 'fixed', f'weight_{alice.pk}': '10.00', f'weight_{bob.pk}': '0'})
+        for name in ('Shares', 'Fixed'):
+            fare = Fare.objects.get(name=name)
+            self.assertEqual(dict(fare.faresplit_set.values_list('user__username', 'amount_cents')), {'alice': 1000, 'bob': 0}, name)
+
+    def test_weights_that_stop_fitting_are_recorded_as_an_equal_split(self):
+        alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+        share = make_share(alice, [bob])
+        self.client.force_login(alice)
+        self.client.post(reverse('fare-create', kwargs={'share_id': share.pk}), {
+            'name': 'Cabin', 'amount': '10.00', 'date': '2025-05-01', 'category': 'housing', 'paid_by': alice.pk,
+            'split_between': [alice.pk, bob.pk], 'split_method': 'fixed', f'weight_{alice.pk}': '6', f'weight_{bob.pk}': '4'})
+        fare = Fare.objects.get()
+        fare.amount = Decimal("12.00") # e.g. through the admin, the fixed amounts no longer add up
+        with self.assertLogs('main_app.allocation', 'WARNING'):
+            fare.save()
+        fare.refresh_from_db()
+        self.assertEqual(fare.split_method, 'equal')
+        self.assertEqual(sorted(fare.faresplit_set.values_list('weight', 'amount_cents')), [(Decimal("1"), 600)] * 2)
+        self.assertEqual(verify_summary(share), [])
+
+    def test_form_save_is_all_or_nothing(self):
+        alice = User.objects.create_user('alice', password='pw')
+        share = make_share(alice, [])
+        self.client.force_login(alice)
+        data = {'name': 'Cabin', 'amount': '10.00', 'date': '2025-05-01', 'category': 'housing', 'paid_by': alice.pk,
+                'split_between': [alice.pk], 'split_method': 'equal'}
+        with mock.patch('main_app.forms.counters.record_fare_change', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse('fare-create', kwargs={'share_id': share.pk}), data)
+        self.assertFalse(Fare.objects.exists())
+        self.assertEqual(ShareSummary.objects.get(share=share).fare_count, 0)
+
+    def test_equal_split_owes_add_back_up_to_the_total(self):
+        alice = User.objects.create_user('alice', password='pw')
+        others = [User.objects.create_user(name, password='pw') for name in ('bob', 'carol')]
+        share = make_share(alice, others)
+        make_fare(share, alice, '100.00', [alice, *others])
+        balances = summary_context(share, alice)["balances"]
+        self.assertEqual(sum(b["owes"] for b in balances), Decimal("100.00"))
+        self.assertEqual(sum(b["net"] for b in balances), Decimal("0.00"))
+
+        import_fares(share, StringIO("name,amount,date,paid_by,split_method,split_between\nBoat,9.00,2025-01-01,bob,shares,alice:2;bob\n"))
+        self.assertEqual(dict(Fare.objects.get(name="Boat").faresplit_set.values_list('user__username', 'amount_cents')), {'alice': 600, 'bob': 300})
+        self.assertEqual(verify_summary(share), [])
+
+
+class QueryPlanTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        for i in range(5):
+            make_share(self.bob, [], title=f"Other {i}")
+        self.share = make_share(self.alice, [self.bob])
+        for i in range(60):
+            make_fare(self.share, self.alice, "10.00", [self.alice, self.bob], day=date(2025, 1, 1 + i % 28))
+
+    def test_main_view_queries_use_their_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("small test tables get sequential scans on Postgres, run manage.py explain_queries on real data")
+        for label, index, plan, ok in run_checks(self.alice, self.share):
+            self.assertTrue(ok, f"{label} should use {index}:\n{plan}")
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seeded_data_matches_the_ledger(self):
+        result = seed(users=30, shares=6, fares_per_share=20, rng_seed=3)
+        self.assertEqual(result['users'], 30)
+        self.assertEqual(Share.objects.count(), 6)
+        self.assertEqual(Fare.objects.count(), result['fares'])
+        for share in Share.objects.all():
+            self.assertTrue(share.participants.filter(pk=share.creator_id).exists())
+            self.assertEqual(verify_summary(share), [])
+
+    def test_views_stay_within_query_budgets(self):
+        seed(users=20, shares=4, fares_per_share=60)
+        latency_free = {name: (None, queries) for name, (ms, queries) in BUDGETS.items()} # timings are too noisy for CI
+        results = run(repeat=2, budgets=latency_free)
+        self.assertEqual([r['view'] for r in results], list(BUDGETS))
+        for r in results:
+            self.assertEqual(r['problems'], [], r['view'])
+        self.assertEqual(Fare.objects.filter(name__startswith='Bench').count(), 0) # the benchmark rolls back its writes
+
+        with self.assertRaises(CommandError):
+            call_command('bench_views', '--view', 'home', '--repeat', '2', '--budget', 'home=1000:1', stdout=StringIO())
+
+
+@override_settings(PERF_SAMPLE_RATE=1)
+class PerfMiddlewareTests(TestCase):
+
+    def setUp(self):
+        perf.histogram.clear()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.share = make_share(self.alice, [])
+        make_fare(self.share, self.alice, "10.00", [self.alice])
+        self.client.force_login(self.alice)
+
+    def test_sampled_requests_are_timed_logged_and_counted(self):
+        with self.assertLogs('main_app.perf', 'INFO') as logs:
+            response = self.client.get(reverse('share-detail', args=[self.share.pk]))
+        timing = response['Server-Timing']
+        for phase in ('db;dur=', 'view;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(phase, timing)
+        self.assertIn('share-detail GET 200', logs.output[0])
+        self.assertEqual(logs.records[0].url_name, 'share-detail')
+
+        stats = perf.histogram.snapshot()['share-detail']
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreater(stats['mean_queries'], 0)
+
+        self.assertEqual(self.client.get(reverse('perf-stats')).status_code, 403) # staff only
+        User.objects.filter(pk=self.alice.pk).update(is_staff=True)
+        data = self.client.get(reverse('perf-stats')).json()
+        self.assertEqual(data['views']['share-detail']['requests'], 1)
+
+    def test_histogram_forgets_old_requests(self):
+        now = [0]
+        histogram = perf.RollingHistogram(window=120, slice_seconds=60, clock=lambda: now[0])
+        histogram.add('home', 8, 1, 2)
+        histogram.add('home', 400, 1, 2)
+        self.assertEqual(histogram.snapshot()['home']['p50_ms'], 10)
+        self.assertEqual(histogram.snapshot()['home']['p99_ms'], 500)
+        now[0] = 180
+        self.assertEqual(histogram.snapshot(), {})
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_sampling_off_removes_the_middleware(self):
+        response = self.client.get(reverse('home'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(perf.histogram.snapshot(), {})
+
+
+class ShareCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.share = make_share(self.alice, [self.bob])
+        make_fare(self.share, self.alice, "30.00", [self.alice, self.bob])
+        self.url = reverse('share-detail', args=[self.share.pk])
+
+    def ledger_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url)
+        ledger_reads = ('FROM "main_app_participantbalance"', 'FROM "main_app_categorytotal"', 'FROM "auth_user" INNER JOIN "main_app_share_participants"')
+        return response, [q['sql'] for q in captured if any(t in q['sql'] for t in ledger_reads)]
+
+    def test_repeat_views_skip_the_ledger_until_the_version_changes(self):
+        self.client.force_login(self.alice)
+        response, queries = self.ledger_queries()
+        self.assertTrue(queries)
+        self.assertEqual(response.context["my_expenses"], Decimal("15.00"))
+
+        response, queries = self.ledger_queries()
+        self.assertEqual(queries, [])
+        self.assertContains(response, "$15.00")
+
+        make_fare(self.share, self.bob, "10.00", [self.alice]) # bumps the version
+        response, queries = self.ledger_queries()
+        self.assertTrue(queries)
+        self.assertEqual(response.context["my_expenses"], Decimal("25.00"))
+
+    def test_balances_fragment_is_cached_per_viewer(self):
+        self.client.force_login(self.alice)
+        self.client.get(self.url)
+        self.client.force_login(self.bob)
+        response, queries = self.ledger_queries()
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context["balances"][0]["participant"], self.bob) # viewer listed first
+        self.assertContains(response, '<span class="badge me" title="You">Me</span>', html=True)
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.share = make_share(self.alice, [self.bob])
+        for i in range(3):
+            make_fare(self.share, self.alice, "30.00", [self.alice, self.bob], day=date(2025, 1, 1 + i))
+
+    def call(self, view, user, path, **kwargs):
+        request = RequestFactory().get(path)
+        async def auser():
+            return user
+        request.auser = auser
+        response = async_to_sync(view.as_view())(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_async_pages_match_the_sync_ones(self):
+        self.client.force_login(self.alice)
+        url = reverse('share-detail', args=[self.share.pk])
+        expected = self.client.get(url).context
+        response = self.call(views.AsyncShareDetail, self.alice, url, pk=self.share.pk)
+        for key in ('fares', 'next_cursor', 'balances', 'my_expenses', 'total_expenses', 'category_totals'):
+            self.assertEqual(response.context_data[key], expected[key], key)
+
+        with mock.patch.object(views.AsyncShareIndex, 'page_size', 1):
+            shares = self.call(views.AsyncShareIndex, self.alice, reverse('share-index')).context_data
+        self.assertEqual(shares['shares'], [self.share])
+        self.assertEqual(self.call(views.AsyncHome, AnonymousUser(), '/').context_data['total_fares'], 3)
+
+    def test_async_pages_keep_the_access_rules(self):
+        url = reverse('share-detail', args=[self.share.pk])
+        self.assertEqual(self.call(views.AsyncShareDetail, AnonymousUser(), url, pk=self.share.pk).status_code, 302)
+        carol = User.objects.create_user('carol', password='pw')
+        with self.assertRaises(Http404):
+            self.call(views.AsyncShareDetail, carol, url, pk=self.share.pk)
+
+    @override_settings(PERF_SAMPLE_RATE=1)
+    async def test_middleware_stays_async_under_asgi(self):
+        await self.async_client.aforce_login(self.alice)
+        response = await self.async_client.get(reverse('share-index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+
+class FareAccessTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.share = make_share(self.alice, [self.bob])
+        self.other = make_share(self.bob, [])
+        self.fare = make_fare(self.share, self.alice, "20.00", [self.alice, self.bob])
+        self.client.force_login(self.alice)
+
+    def get(self, name, **kwargs):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse(name, kwargs=kwargs))
+        return response, len(captured)
+
+    def test_fare_routes_check_membership_in_their_query(self):
+        response, queries = self.get('fare-update', share_id=self.share.pk, pk=self.fare.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 6) # session, user, fare + share + membership, participants, current weights, split_between initial
+        self.assertContains(response, '<option value="%d">bob</option>' % self.bob.pk, html=True)
+
+        response, queries = self.get('fare-create', share_id=self.share.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 4) # session, user, share + membership, participants
+
+    def test_removed_participant_loses_access_everywhere(self):
+        self.client.force_login(self.bob)
+        url = reverse('fare-detail', kwargs={'share_id': self.share.pk, 'pk': self.fare.pk})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        cache.clear()
+        Share.participants.through.objects.filter(share=self.share, user=self.bob).delete() # no signal, like a change made by another worker
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('fare-create', kwargs={'share_id': self.share.pk})).status_code, 404)
+        self.assertEqual(self.client.post(reverse('fare-delete', kwargs={'share_id': self.share.pk, 'pk': self.fare.pk})).status_code, 404)
+        self.bob.shares_participating.add(self.share) # the reverse side too
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_fare_must_belong_to_the_share_in_the_url(self):
+        self.other.participants.add(self.alice)
+        url = reverse('fare-update', kwargs={'share_id': self.other.pk, 'pk': self.fare.pk})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.post(reverse('fare-delete', kwargs={'share_id': self.other.pk, 'pk': self.fare.pk})).status_code, 404)
+        self.assertTrue(Fare.objects.filter(pk=self.fare.pk).exists())
+
+
+class ReplicaRoutingTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        with mock.patch.object(routers, 'replica_configured', return_value=True):
+            self.middleware = routers.ReplicaMiddleware(self.view)
+
+    def view(self, request):
+        # what the handler does between the middleware and the view
+        self.middleware.process_view(request, None, (), {})
+        self.replica = routers._use_replica.get()
+        return HttpResponse()
+
+    def call(self, method, url, **kwargs):
+        request = getattr(self.factory, method)(url, **kwargs)
+        request.resolver_match = resolve(url)
+        return self.middleware(request)
+
+    def test_read_views_use_the_replica_until_the_user_writes(self):
+        response = self.call('get', reverse('share-index'))
+        self.assertTrue(self.replica)
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+        self.assertFalse(routers._use_replica.get()) # reset once the response is done
+
+        self.call('get', reverse('share-create'))
+        self.assertFalse(self.replica) # not a read-only page
+
+        response = self.call('post', reverse('fare-create', kwargs={'share_id': 1}))
+        self.assertFalse(self.replica)
+        cookie = response.cookies[routers.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+        self.factory.cookies[routers.STICKY_COOKIE] = '1'
+        self.call('get', reverse('share-index'))
+        self.assertFalse(self.replica) # reads its own writes from the primary
+
+    def test_router_sends_flagged_reads_to_the_replica(self):
+        router = routers.ReplicaRouter()
+        token = routers._use_replica.set(True)
+        try:
+            self.assertIsNone(router.db_for_read(Fare)) # no replica configured
+            with mock.patch.dict(connections.settings, {routers.REPLICA: {}}):
+                with mock.patch.object(connections['default'], 'in_atomic_block', False):
+                    self.assertEqual(router.db_for_read(Fare), routers.REPLICA)
+                self.assertIsNone(router.db_for_read(Fare)) # the test transaction is open on the primary
+            self.assertEqual(router.db_for_write(Fare), 'default')
+        finally:
+            routers._use_replica.reset(token)
+
+    def test_no_replica_removes_the_middleware(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            routers.ReplicaMiddleware(self.view)
+
+
+class StaticAssetTests(TestCase):
+
+    def test_css_bundles_are_up_to_date(self):
+        call_command('build_css', '--check', stdout=StringIO()) # run manage.py build_css after editing static/css
+
+    def test_minify_keeps_what_changes_meaning(self):
+        css = "/* note */\na :hover , b > i {\n  width: calc(100% - 2px);\n  content: \"✓\";\n}\n"
+        self.assertEqual(assets.minify(css), 'a :hover,b>i{width:calc(100% - 2px);content:"✓"}')
+
+    def test_repeat_page_loads_download_no_static_files(self):
+        with assets.collected_static():
+            results = assets.check_repeat_loads(Client(), [reverse('home'), reverse('login')])
+        urls = [r['url'] for r in results]
+        self.assertEqual(len(urls), 3) # one stylesheet per page and the logo
+        self.assertTrue(any(url.startswith('/static/css/bundles/home.') for url in urls))
+        for r in results:
+            self.assertEqual(r['status'], 200)
+            self.assertIn(r['encoding'], ('br', 'gzip'))
+            self.assertEqual(r['repeat_bytes'], 0, r['cache_control'])
+
+
+class SpendingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.share = make_share(self.alice, [self.bob])
+        self.dinner = make_fare(self.share, self.alice, "30.00", [self.alice, self.bob], day=date(2025, 1, 5))
+        make_fare(self.share, self.bob, "12.50", [self.alice, self.bob], category="transportation", day=date(2025, 1, 20))
+        make_fare(self.share, self.alice, "8.00", [self.alice], day=date(2025, 2, 3))
+        self.client.force_login(self.alice)
+
+    def days(self):
+        return set(DailyTotal.objects.filter(share=self.share, fare_count__gt=0).values_list('date', 'category', 'paid_by_id', 'total'))
+
+    def test_daily_rows_follow_fare_changes(self):
+        self.dinner.date = date(2025, 2, 3)
+        self.dinner.save()
+        self.assertIn((date(2025, 2, 3), 'food_drink', self.alice.pk, Decimal("38.00")), self.days())
+        self.assertEqual(verify_summary(self.share), [])
+
+        self.dinner.delete()
+        self.assertIn((date(2025, 2, 3), 'food_drink', self.alice.pk, Decimal("8.00")), self.days())
+        expected = self.days()
+        rebuild_summary(self.share)
+        self.assertEqual(self.days(), expected)
+
+    def test_share_series_by_month_and_payer(self):
+        summary = ShareSummary.objects.get(share=self.share)
+        months = analytics.share_series(self.share, summary, 'month')
+        self.assertEqual([p["start"] for p in months], [date(2025, 1, 1), date(2025, 2, 1)])
+        self.assertEqual(months[0]["total"], Decimal("42.50"))
+        self.assertEqual(months[0]["parts"], {'food_drink': Decimal("30.00"), 'transportation': Decimal("12.50")})
+
+        with self.assertNumQueries(0): # cached per share version
+            analytics.share_series(self.share, summary, 'month')
+        weeks = analytics.share_series(self.share, summary, 'week', 'paid_by')
+        self.assertEqual(weeks[0], {"start": date(2024, 12, 30), "total": Decimal("30.00"), "fare_count": 1, "parts": {self.alice.pk: Decimal("30.00")}})
+
+    def test_spending_api_and_page(self):
+        url = reverse('api-share-spending', args=[self.share.pk])
+        response = self.client.get(url, {'period': 'month', 'by': 'paid_by'})
+        data = response.json()
+        self.assertEqual(data["points"][0]["parts"], {str(self.alice.pk): "30.00", str(self.bob.pk): "12.50"})
+        again = self.client.get(url, {'period': 'month', 'by': 'paid_by'}, headers={'if-none-match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get(url, {'period': 'year'}).status_code, 404)
+
+        mine = self.client.get(reverse('api-spending')).json()
+        self.assertEqual([p["total"] for p in mine["currencies"]["USD"]], ["30.00", "8.00"]) # only what alice paid
+
+        response = self.client.get(reverse('share-spending', args=[self.share.pk]), {'period': 'week'})
+        self.assertContains(response, 'Dec 30, 2024')
+        self.client.force_login(User.objects.create_user('eve', password='pw'))
+        self.assertEqual(self.client.get(reverse('share-spending', args=[self.share.pk])).status_code, 404)
+
+
+class FareSearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.share = make_share(self.alice, [self.bob])
+        self.other = make_share(self.bob, [], title="Bob only")
+        make_fare(self.share, self.alice, "40.00", [self.alice, self.bob], name="Taxi to the airport", day=date(2025, 1, 2))
+        make_fare(self.share, self.bob, "12.00", [self.alice, self.bob], name="Taxi", category="transportation", day=date(2025, 1, 1))
+        make_fare(self.share, self.bob, "90.00", [self.alice, self.bob], name="Hotel", category="housing", day=date(2025, 1, 3))
+        make_fare(self.other, self.bob, "15.00", [self.bob], name="Taxi home")
+        self.client.force_login(self.alice)
+
+    def names(self, **filters):
+        return [fare.name for fare in search.search_fares(self.alice, **filters).order_by('-date', '-id')]
+
+    def test_search_is_limited_to_the_users_shares(self):
+        fares = search.search_fares(self.alice, 'taxi').order_by('-rank', '-date', '-id')
+        self.assertEqual([f.name for f in fares], ["Taxi", "Taxi to the airport"]) # exact name first, Bob's own share left out
+        self.assertEqual(self.names(text='airport taxi'), ["Taxi to the airport"])
+        self.assertEqual(self.names(category='transportation'), ["Taxi"])
+        self.assertEqual(self.names(paid_by=self.bob), ["Hotel", "Taxi"])
+        self.assertEqual(self.names(min_amount=Decimal("12"), max_amount=Decimal("40")), ["Taxi to the airport", "Taxi"])
+        self.assertEqual(self.names(share_id=self.other.pk), [])
+
+    def test_ranked_results_page_by_number_and_filters_by_cursor(self):
+        fares = search.search_fares(self.alice, 'taxi')
+        rows, next_page, cursor = search.search_page(fares, 'taxi', size=1)
+        self.assertEqual(([f.name for f in rows], next_page, cursor), (["Taxi"], 2, None))
+        rows, next_page, cursor = search.search_page(fares, 'taxi', page=2, size=1)
+        self.assertEqual(([f.name for f in rows], next_page), (["Taxi to the airport"], None))
+
+        rows, next_page, cursor = search.search_page(search.search_fares(self.alice), size=2)
+        self.assertEqual([f.name for f in rows], ["Hotel", "Taxi to the airport"])
+        self.assertIsNotNone(cursor)
+        rows, _, cursor = search.search_page(search.search_fares(self.alice), cursor=cursor, size=2)
+        self.assertEqual(([f.name for f in rows], cursor), (["Taxi"], None))
+
+    def test_search_page(self):
+        response = self.client.get(reverse('fare-search'), {'q': 'taxi', 'category': 'food_drink'})
+        self.assertContains(response, "Taxi to the airport")
+        self.assertNotContains(response, "Taxi home")
+        self.assertContains(response, '<option value="%d">bob</option>' % self.bob.pk, html=True)
+        self.assertNotContains(self.client.get(reverse('fare-search')), "No fares match") # nothing searched yet
+        self.assertContains(self.client.get(reverse('fare-search'), {'q': 'museum'}), "No fares match")
+
+
+class ParticipantPickerTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('Bob', password='pw')
+        User.objects.create_user('bobby', password='pw')
+        User.objects.create_user('bobcat', password='pw', is_active=False)
+        User.objects.bulk_create([User(username=f'someone{i}') for i in range(30)])
+        self.client.force_login(self.alice)
+
+    def test_usernames_match_by_prefix_in_any_case(self):
+        self.assertEqual([u['username'] for u in people.find_users('bo')], ['Bob', 'bobby'])
+        self.assertEqual(len(people.find_users('SOME')), people.LIMIT)
+        self.assertEqual(people.find_users('  '), [])
+
+        data = self.client.get(reverse('api-users'), {'q': 'BOBB'}).json()
+        self.assertEqual(data, {'results': [{'id': User.objects.get(username='bobby').pk, 'username': 'bobby'}]})
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api-users'), {'q': 'bo'}).status_code, 403)
+
+    def test_share_form_only_renders_chosen_participants(self):
+        share = make_share(self.alice, [self.bob])
+        response = self.client.get(reverse('share-update', args=[share.pk]))
+        self.assertContains(response, '<option value="%d" selected>Bob</option>' % self.bob.pk, html=True)
+        self.assertNotContains(response, 'someone')
+        self.assertContains(response, 'participant-picker')
+
+        with self.assertNumQueries(2): # session, user
+            self.client.get(reverse('share-create'))
+
+    def test_share_form_validates_submitted_ids(self):
+        url = reverse('share-create')
+        response = self.client.post(url, {'title': 'Ski', 'currency': 'EUR', 'participants': [self.bob.pk, 999999]})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Share.objects.filter(title='Ski').exists())
+
+        self.client.post(url, {'title': 'Ski', 'currency': 'EUR', 'participants': [self.bob.pk]})
+        share = Share.objects.get(title='Ski')
+        self.assertEqual(set(share.participants.values_list('username', flat=True)), {'alice', 'Bob'})
+
+
+class AttachmentTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        settings_override = override_settings(MEDIA_ROOT=self.media, FILE_UPLOAD_TEMP_DIR=self.media, THUMBNAIL_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.share = make_share(self.alice, [self.bob])
+        self.fare = make_fare(self.share, self.alice, '30.00', [self.alice, self.bob])
+        self.url = reverse('fare-attachments', args=[self.share.pk, self.fare.pk])
+        self.client.force_login(self.bob)
+
+    def upload(self, name='receipt.jpg', content=None):
+        upload = SimpleUploadedFile(name, content if content is not None else noise_jpeg(1600, 900), 'image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(self.url, {'file': upload})
+        return response, callbacks
+
+    def test_thumbnails_are_made_after_the_upload(self):
+        response, callbacks = self.upload()
+        self.assertRedirects(response, reverse('fare-detail', args=[self.share.pk, self.fare.pk]))
+        self.assertEqual(len(callbacks), 1) # scheduled once the row is committed
+
+        attachment = Attachment.objects.get()
+        self.assertEqual((attachment.status, attachment.content_type, attachment.uploaded_by), ('ready', 'image/jpeg', self.bob))
+        self.assertEqual(os.listdir(self.media), ['attachments']) # the streamed upload was moved, not copied
+        for field, size in attachments.VARIANTS.items():
+            with getattr(attachment, field).open('rb') as f, attachments.Image.open(f) as image:
+                self.assertEqual((image.format, max(image.size)), ('WEBP', size))
+
+        page = self.client.get(response.url)
+        self.assertContains(page, reverse('attachment-file', args=[attachment.pk, 'thumbnail']))
+
+    def test_files_are_cached_and_only_for_participants(self):
+        self.upload()
+        attachment = Attachment.objects.get()
+        url = reverse('attachment-file', args=[attachment.pk, 'thumbnail'])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], f'private, max-age={attachments.CACHE_SECONDS}, immutable')
+        response.close()
+        self.assertEqual(self.client.get(reverse('attachment-file', args=[attachment.pk, 'other'])).status_code, 404)
+
+        self.client.force_login(User.objects.create_user('carol', password='pw'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_pdfs_and_unreadable_images(self):
+        self.upload('receipt.pdf', b'%PDF-1.4 receipt')
+        self.upload('broken.png', b'not a png')
+        pdf, broken = Attachment.objects.order_by('pk')
+        self.assertEqual((pdf.status, pdf.thumbnail.name), ('ready', ''))
+        self.assertEqual((broken.status, broken.thumbnail.name), ('failed', ''))
+        response = self.client.get(reverse('attachment-file', args=[pdf.pk, 'original']))
+        self.assertEqual(response['Content-Disposition'].split(';')[0], 'attachment')
+        response.close()
+
+    @override_settings(ATTACHMENT_MAX_BYTES=1000)
+    def test_rejects_other_types_and_large_files(self):
+        self.assertEqual(self.upload('page.html', b'<script></script>')[0].status_code, 200)
+        self.assertEqual(self.upload('receipt.jpg', b'x' * 1001)[0].status_code, 200)
+        self.assertFalse(Attachment.objects.exists())
+
+    def test_share_photos_and_deleted_files(self):
+        self.url = reverse('share-attachments', args=[self.share.pk])
+        response, _ = self.upload()
+        self.assertRedirects(response, self.url)
+        attachment = Attachment.objects.get()
+        self.assertIsNone(attachment.fare)
+        paths = [attachment.file.path, attachment.thumbnail.path, attachment.preview.path]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.share.delete()
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='pw')
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.share = make_share(self.alice, [])
+        User.objects.bulk_create([User(username=f'someone{i}') for i in range(30)])
+        self.client.force_login(self.admin)
+
+    def count_queries(self, url, data=None):
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(url, data).status_code, 200)
+        return len(captured)
+
+    def test_changelists_cost_the_same_as_tables_grow(self):
+        pages = [
+            (reverse('admin:main_app_fare_changelist'), None),
+            (reverse('admin:main_app_fare_changelist'), {'category': 'food_drink'}),
+            (reverse('admin:main_app_share_changelist'), {'currency': 'USD'}),
+        ]
+        make_fare(self.share, self.alice, '1.00', [self.alice])
+        before = [self.count_queries(url, data) for url, data in pages]
+        for i in range(20):
+            make_fare(make_share(User.objects.create_user(f'payer{i}'), [], title=f"Trip {i}"), self.alice, '1.00', [self.alice])
+        self.assertEqual([self.count_queries(url, data) for url, data in pages], before)
+
+    def test_change_forms_only_render_chosen_users(self):
+        fare = make_fare(self.share, self.alice, '9.00', [self.alice])
+        for url in (reverse('admin:main_app_share_change', args=[self.share.pk]), reverse('admin:main_app_fare_change', args=[fare.pk])):
+            response = self.client.get(url)
+            self.assertContains(response, 'alice')
+            self.assertNotContains(response, 'someone')
+
+    def test_large_lists_use_the_estimated_count(self):
+        fares = Fare.objects.order_by(*FARE_ORDERING)
+        self.assertIsNone(fare_admin.estimated_count(fares)) # SQLite has no row estimates
+        make_fare(self.share, self.alice, '1.00', [self.alice])
+        with mock.patch.object(fare_admin, 'estimated_count', return_value=50000):
+            self.assertEqual(fare_admin.EstimatedCountPaginator(fares, 100).count, 50000)
+        with mock.patch.object(fare_admin, 'estimated_count', return_value=3):
+            self.assertEqual(fare_admin.EstimatedCountPaginator(fares, 100).count, 1)
+
+    def test_set_category_action_keeps_the_ledger_in_step(self):
+        fares = [make_fare(self.share, self.alice, '5.00', [self.alice]) for i in range(3)]
+        self.client.post(reverse('admin:main_app_fare_changelist'), {
+            'action': 'set_category', 'category': 'housing', '_selected_action': [fares[0].pk, fares[1].pk],
+        })
+        self.assertEqual(
+            dict(CategoryTotal.objects.filter(share=self.share).values_list('category', 'total')),
+            {'food_drink': Decimal('5.00'), 'housing': Decimal('10.00')},
+        )
+        self.assertEqual(verify_summary(self.share), [])
+
+
+class FareBatchTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.share = make_share(self.alice, [self.bob])
+        self.fare = make_fare(self.share, self.alice, '30.00', [self.alice, self.bob])
+        self.url = reverse('api-share-fares-batch', kwargs={'pk': self.share.pk})
+        self.client.force_login(self.bob)
+
+    def post(self, operations):
+        return self.client.post(self.url, json.dumps({'operations': operations}), content_type='application/json')
+
+    def creates(self, count):
+        return [{'op': 'create', 'name': f'Taxi {i}', 'amount': '9.00', 'date': '2025-02-01', 'paid_by': self.bob.pk} for i in range(count)]
+
+    def test_creates_updates_and_deletes_in_one_request(self):
+        doomed = make_fare(self.share, self.bob, '5.00', [self.bob])
+        response = self.post([
+            {'op': 'create', 'name': 'Hotel', 'amount': '100.00', 'date': '2025-02-01', 'paid_by': self.alice.pk,
+             'category': 'housing', 'split_method': 'shares', 'split_between': {str(self.alice.pk): 3, str(self.bob.pk): 1}},
+            {'op': 'update', 'id': self.fare.pk, 'amount': '40.00'},
+            {'op': 'delete', 'id': doomed.pk},
+        ])
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(data['applied'])
+        self.assertEqual([(r['op'], r['errors']) for r in data['results']], [('create', []), ('update', []), ('delete', [])])
+
+        hotel = Fare.objects.get(pk=data['results'][0]['id'])
+        self.assertEqual(dict(hotel.faresplit_set.values_list('user__username', 'amount_cents')), {'alice': 7500, 'bob': 2500})
+        self.assertEqual(dict(self.fare.faresplit_set.values_list('user__username', 'amount_cents')), {'alice': 2000, 'bob': 2000})
+        self.assertFalse(Fare.objects.filter(pk=doomed.pk).exists())
+        self.assertEqual(verify_summary(self.share), [])
+        self.assertEqual(data['version'], ShareSummary.objects.get(share=self.share).version)
+        self.assertEqual(home_metrics()['total_fares'], 2)
+
+    def test_any_invalid_operation_rejects_the_batch(self):
+        outsider = User.objects.create_user('carol', password='pw')
+        response = self.post([
+            {'op': 'update', 'id': self.fare.pk, 'name': 'Renamed'},
+            {'op': 'create', 'name': 'Taxi', 'amount': '9.00', 'date': '2025-02-01', 'paid_by': outsider.pk},
+            {'op': 'create', 'name': '', 'amount': 'lots', 'date': '2025-02-01', 'paid_by': self.bob.pk, 'split_between': [outsider.pk]},
+            {'op': 'create', 'name': 'Bus', 'amount': {'value': 3}, 'date': 20250101, 'paid_by': self.bob.pk, 'split_between': {str(self.bob.pk): 'NaN'}},
+            {'op': 'delete', 'id': self.fare.pk},
+            {'op': 'rename'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        data = response.json()
+        self.assertFalse(data['applied'])
+        self.assertEqual([len(r['errors']) for r in data['results']], [0, 1, 3, 3, 1, 1])
+        self.fare.refresh_from_db()
+        self.assertEqual((self.fare.name, Fare.objects.count()), ('Fare', 1))
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        self.post(self.creates(1)) # warms up the per-process caches
+        with CaptureQueriesContext(connection) as small:
+            self.post(self.creates(5))
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.post(self.creates(100)).status_code, 200)
+        self.assertEqual(len(large), len(small)) # 100 fares with two splits each stay inside one batch of each insert
+        self.assertEqual(Fare.objects.filter(name__startswith='Taxi').count(), 106)
+
+    def test_access_and_malformed_bodies(self):
+        self.assertEqual(self.client.post(self.url, 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+        self.client.force_login(User.objects.create_user('carol', password='pw'))
+        self.assertEqual(self.post(self.creates(1)).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.post(self.creates(1)).status_code, 403)
@@ -1,22 +1,45 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS: # running under ASGI, see fareshare/asgi.py
+    Home, ShareIndex, ShareDetail = views.AsyncHome.as_view(), views.AsyncShareIndex.as_view(), views.AsyncShareDetail.as_view()
+else:
+    Home, ShareIndex, ShareDetail = views.Home.as_view(), views.ShareIndex.as_view(), views.ShareDetail.as_view()
+
 urlpatterns = [
-    path('', views.Home.as_view(), name='home'),
+    path('', Home, name='home'),
     path('accounts/signup/', views.signup, name='signup'),
     path('accounts/login/', views.Login.as_view(), name='login'),
     path('about/', views.about, name='about'),
+    path('profile/', views.Profile.as_view(), name='profile'),
 
-    path('shares/', views.ShareIndex.as_view(), name='share-index'),
-    path('shares/<int:pk>/', views.ShareDetail.as_view(), name='share-detail'),
+    path('shares/', ShareIndex, name='share-index'),
+    path('shares/<int:pk>/', ShareDetail, name='share-detail'),
+    path('shares/<int:pk>/settle/', views.ShareSettle.as_view(), name='share-settle'),
+    path('shares/<int:pk>/spending/', views.ShareSpending.as_view(), name='share-spending'),
+    path('shares/<int:pk>/export/<str:fmt>/', views.ShareExport.as_view(), name='share-export'),
     path('shares/create/', views.ShareCreate.as_view(), name='share-create'),
     path('shares/<int:pk>/update/', views.ShareUpdate.as_view(), name='share-update'),
     path('shares/<int:pk>/delete/', views.ShareDelete.as_view(), name='share-delete'),
 
+    path('fares/search/', views.FareSearch.as_view(), name='fare-search'),
     path('shares/<int:share_id>/fare-create/', views.FareCreate.as_view(), name='fare-create'),
+    path('shares/<int:share_id>/fare-import/', views.FareImport.as_view(), name='fare-import'),
     path('shares/<int:share_id>/fare/<int:pk>/', views.FareDetail.as_view(), name='fare-detail'),
     path('share/<int:share_id>/fare/<int:pk>/fare-update', views.FareUpdate.as_view(), name='fare-update'),
     path('share/<int:share_id>/fare/<int:pk>/fare-delete', views.FareDelete.as_view(), name='fare-delete'),
 
-    
+    path('shares/<int:share_id>/attachments/', views.AttachmentUpload.as_view(), name='share-attachments'),
+    path('shares/<int:share_id>/fare/<int:pk>/attachments/', views.AttachmentUpload.as_view(), name='fare-attachments'),
+    path('attachments/<int:pk>/<str:variant>/', views.AttachmentFile.as_view(), name='attachment-file'),
+
+    path('api/shares/<int:pk>/', views.ShareSummaryApi.as_view(), name='api-share'),
+    path('api/shares/<int:pk>/fares/', views.ShareFaresApi.as_view(), name='api-share-fares'),
+    path('api/shares/<int:pk>/fares/batch/', views.ShareFaresBatchApi.as_view(), name='api-share-fares-batch'),
+    path('api/shares/<int:pk>/spending/', views.ShareSpendingApi.as_view(), name='api-share-spending'),
+    path('api/spending/', views.UserSpendingApi.as_view(), name='api-spending'),
+    path('api/users/', views.UserAutocompleteApi.as_view(), name='api-users'),
+
+    path('perf/', views.PerfStats.as_view(), name='perf-stats'),
 ]
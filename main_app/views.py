@@ -1,18 +1,31 @@
+import hashlib
+import json
+
+from django.conf import settings
 from django.shortcuts import render, redirect, reverse, get_object_or_404
+from django.http import Http404, JsonResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.functional import cached_property
+from django.utils.http import parse_etags
+from django.template.response import TemplateResponse
 
-from django.views.generic import ListView, DetailView
-from django.views.generic.edit import CreateView, UpdateView, DeleteView
+from django.views.generic import View, ListView, DetailView, TemplateView
+from django.views.generic.edit import CreateView, UpdateView, DeleteView, FormView
 
 from django.contrib.auth import login
-from django.contrib.auth.views import LoginView
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.views import LoginView, redirect_to_login
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 
 from django.contrib.auth.forms import UserCreationForm
 
-from decimal import Decimal, ROUND_HALF_UP # typically used when handling dollar amounts
-
-from .models import Share, Fare
-from .forms import FareForm
+from .models import Share, Fare, FareSplit, ShareSummary, Attachment
+from .forms import AttachmentForm, FareForm, FareImportForm, FareSearchForm, ShareForm
+from .importer import import_fares
+from .exporter import stream_csv, stream_json
+from .counters import home_metrics, ahome_metrics
+from .ledger import summary_context, cached_summary_context, acached_summary_context, share_summary, user_dashboard, get_summary, cents_to_amount, CATEGORY_KEYS, CATEGORY_LABELS
+from .pagination import keyset_page, akeyset_page, FARE_ORDERING, SHARE_ORDERING
+from .settlement import suggest_transfers
+from . import access, analytics, attachments, batch, people, perf, search
 
 # Create your views here.
 
@@ -35,116 +48,149 @@ def signup(request):
 class Login(LoginView):
     template_name = 'login.html'
 
-class Home(ListView):
-    model = Share
-    context_object_name = 'shares'
+class Home(TemplateView):
     template_name = 'home.html'
 
-    def get_queryset(self):
-        return (Share.objects.all())
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        shares = context['shares']
-
-        total_fares = 0
-        for share in shares:
-            total_fares += len(share.fare_set.all())
-
-        total_expenses = 0
-        for share in shares:
-            for fare in share.fare_set.all():
-                total_expenses += fare.amount
-        print(total_expenses)
-       
-        context["total_shares"] = shares.count()
-        context["total_fares"] = total_fares
-        context["total_expenses"] = total_expenses
-        
+        context.update(home_metrics()) # site-wide counters, one query no matter how much data exists
         return context
     
 
 def about(request):
     return render(request, 'about.html')
 
+class Profile(LoginRequiredMixin, TemplateView):
+    template_name = 'profile.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(user_dashboard(self.request.user)) # net position across every share, by currency
+        return context
+
 ####
 
+def with_next_cursor(response, context):
+    if context.get("next_cursor"):
+        response['X-Next-Cursor'] = context["next_cursor"] # read by static/js/load-more.js
+    return response
+
 class ShareIndex(LoginRequiredMixin, ListView):
     model = Share
     context_object_name = 'shares'
     template_name = 'shares/index.html'
-    ordering = ['-created_at']
+    page_size = 24
 
     def get_queryset(self):
         return (Share.objects.filter(participants=self.request.user)) # restricts the query set to only participants (inclduing creator)
 
+    def get_template_names(self):
+        if 'partial' in self.request.GET: # "load more" fetches only the next cards
+            return ['shares/_share_cards.html']
+        return [self.template_name]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        shares, next_cursor = keyset_page(self.object_list, SHARE_ORDERING, self.request.GET.get('cursor'), self.page_size)
+        context["shares"] = shares
+        context["next_cursor"] = next_cursor
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        return with_next_cursor(super().render_to_response(context, **response_kwargs), context)
+
 
 class ShareDetail(DetailView):
     model = Share
     template_name = 'shares/detail.html'
+    page_size = 50
     
     def get_queryset(self):
-        return (Share.objects.filter(participants=self.request.user)) # restricts the query set to only participants (inclduing creator)
+        return (Share.objects.filter(participants=self.request.user).select_related('summary')) # restricts the query set to only participants (inclduing creator)
+
+    def get_template_names(self):
+        if 'partial' in self.request.GET: # "load more" fetches only the next fare rows
+            return ['shares/_fare_rows.html']
+        return [self.template_name]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        share = self.object
-        user = self.request.user
-        fares = share.fare_set.all()
-        
-        total_expenses = sum(f.amount for f in fares)
-
-        my_expenses = Decimal("0")
-        for fare in fares:
-            count = fare.split_between.count()
-            if count and fare.split_between.filter(pk=user.pk).exists():
-                my_expenses += (fare.amount / count)
-
-        my_expenses = my_expenses.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        
-        category_totals = {}
-        for fare in fares:
-            label = fare.get_category_display()
-            category_totals[label] = category_totals.get(label, Decimal("0")) + fare.amount
-        sorted_category_totals = dict(sorted(category_totals.items(), key=lambda item: item[1], reverse=True)) # sorting by value in descending order
-
-        participants = list(share.participants.all())
-        balances = []
-
-        for p in participants:
-
-            owes = Decimal("0")
-            for fare in fares:
-                count = fare.split_between.count()
-                if count and fare.split_between.filter(pk=p.pk).exists():
-                    owes += (fare.amount / count)
-
-            paid = Decimal("0")
-            for fare in fares:
-                if fare.paid_by_id == p.pk:
-                    paid += fare.amount
-
-            net = paid - owes
-
-            owes = owes.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-            paid = paid.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-            net = net.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
-            balances.append({"participant": p, "owes": owes, "paid": paid, "net": net})
-            print(balances)
-            sorted_balances = sorted(balances, key=lambda p: (p["participant"].id != user.id)) # sorts logged in user first
-            
-        context["total_fares"] = fares.count()
-        context["total_expenses"] = total_expenses
-        context["my_expenses"] = my_expenses
-        context["balances"] = sorted_balances
-        context["category_totals"] = sorted_category_totals
+        fares, next_cursor = keyset_page(
+            self.object.fare_set.select_related('paid_by'), FARE_ORDERING, self.request.GET.get('cursor'), self.page_size)
+        context["fares"] = fares
+        context["next_cursor"] = next_cursor
+        if 'partial' not in self.request.GET:
+            context.update(cached_summary_context(self.object, self.request.user)) # cached per share version, no ledger queries on repeat views
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        return with_next_cursor(super().render_to_response(context, **response_kwargs), context)
+
+class ShareSettle(LoginRequiredMixin, DetailView):
+    model = Share
+    template_name = 'shares/settle.html'
 
+    def get_queryset(self):
+        return (Share.objects.filter(participants=self.request.user).select_related('summary')) # restricts the query set to only participants (inclduing creator)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        balances = cached_summary_context(self.object, self.request.user)["balances"]
+        context["transfers"] = suggest_transfers(balances)
         return context
 
+class ShareSpending(LoginRequiredMixin, DetailView):
+    model = Share
+    template_name = 'shares/spending.html'
+    date_formats = {'day': 'M j, Y', 'week': 'M j, Y', 'month': 'F Y'}
+
+    def get_queryset(self):
+        return (Share.objects.filter(participants=self.request.user).select_related('summary')) # restricts the query set to only participants (inclduing creator)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        period = self.request.GET.get('period', 'month')
+        if period not in analytics.PERIODS:
+            raise Http404("Unknown period")
+        points = analytics.share_series(self.object, share_summary(self.object), period) # cached per share version
+        largest = max((p["total"] for p in points), default=0)
+        context["period"] = period
+        context["periods"] = list(analytics.PERIODS)
+        context["date_format"] = self.date_formats[period]
+        context["points"] = [
+            {
+                **p,
+                "width": round(p["total"] / largest * 100) if largest else 0, # bar length relative to the biggest period
+                "categories": sorted(((CATEGORY_LABELS.get(k, k), v) for k, v in p["parts"].items()), key=lambda c: c[1], reverse=True),
+            }
+            for p in reversed(points) # newest first, like the fare list
+        ]
+        return context
+
+class ShareExport(LoginRequiredMixin, DetailView):
+    model = Share
+
+    def get_queryset(self):
+        return (Share.objects.filter(participants=self.request.user)) # restricts the query set to only participants (inclduing creator)
+
+    def render_to_response(self, context, **response_kwargs):
+        share = self.object
+        fmt = self.kwargs['fmt']
+        section = self.request.GET.get('section', 'fares')
+        if fmt == 'json':
+            response = StreamingHttpResponse(stream_json(share, self.request.user), content_type='application/json')
+            filename = f"share-{share.pk}.json"
+        elif fmt == 'csv' and section in ('fares', 'balances'):
+            response = StreamingHttpResponse(stream_csv(share, self.request.user, section), content_type='text/csv')
+            filename = f"share-{share.pk}-{section}.csv"
+        else:
+            raise Http404("Unknown export format")
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
 class ShareCreate(LoginRequiredMixin, CreateView):
     model = Share
-    fields = ['title', 'currency', 'participants']
+    form_class = ShareForm # participants are picked by username search, not a list of every user
 
     def form_valid(self, form):
         form.instance.creator = self.request.user
@@ -154,7 +200,7 @@ class ShareCreate(LoginRequiredMixin, CreateView):
 
 class ShareUpdate(LoginRequiredMixin, UpdateView):
     model = Share
-    fields = ['title', 'currency', 'participants']
+    form_class = ShareForm
 
     def get_queryset(self):
         return (Share.objects.filter(creator=self.request.user)) # restricts the query set to only creator
@@ -174,84 +220,373 @@ class ShareDelete(LoginRequiredMixin, DeleteView):
     
 ####
 
-class FareCreate(LoginRequiredMixin, CreateView):
+class ShareAccessMixin(LoginRequiredMixin):
+    # resolves self.share for the fare routes, 404 unless the user is a participant
+
+    def dispatch(self, request, *args, **kwargs): # protects URL route from those who do not have access
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        self.share = access.share_for(request.user, self.kwargs['share_id'])
+        return super().dispatch(request, *args, **kwargs)
+
+class FareAccessMixin(LoginRequiredMixin):
+    # loads the fare and its share in one query, 404 unless the fare belongs to that share and the user to it
+    with_splits = False
+
+    def dispatch(self, request, *args, **kwargs): # protects URL route from those who do not have access
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        self.object = access.fare_for(request.user, self.kwargs['share_id'], self.kwargs['pk'], self.with_splits)
+        self.share = self.object.share
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_object(self, queryset=None):
+        return self.object
+
+
+class FareCreate(ShareAccessMixin, CreateView):
     model = Fare
     form_class = FareForm
 
     def form_valid(self, form):
-        form.instance.share_id = self.kwargs['share_id']
+        form.instance.share = self.share
         return super().form_valid(form)
 
-    def dispatch(self, request, *args, **kwargs): # protects URL route from those who do not have access
-        self.share = get_object_or_404( # Django shortcut to return single object and if not found generate 404
-            Share.objects.filter(participants=request.user).distinct(), pk=self.kwargs['share_id'])
-        return super().dispatch(request, *args, **kwargs)
-
     def get_form(self): # renders correct info in form
         form = super().get_form()
-        form.fields['split_between'].queryset = self.share.participants.all() # limit form field to only show Share participants
-        form.fields['paid_by'].queryset = self.share.participants.all() # limit form field to only show Share participants
+        form.set_participants(access.share_participants(self.share.pk)) # limit form fields to only show Share participants
         return form
 
 
-class FareDetail(LoginRequiredMixin, DetailView):
+class FareImport(ShareAccessMixin, FormView):
+    form_class = FareImportForm
+    template_name = 'main_app/fare_import.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["share"] = self.share
+        return context
+
+    def form_valid(self, form):
+        result = import_fares(self.share, form.cleaned_data['file']) # streams the upload, valid rows are saved
+        return self.render_to_response(self.get_context_data(form=self.form_class(), result=result))
+
+
+class FareDetail(FareAccessMixin, DetailView):
     model = Fare
     template_name = 'shares/fare-detail.html'
+    with_splits = True
 
-    def dispatch(self, request, *args, **kwargs): # protects URL route from those who do not have access
-        self.share = get_object_or_404( # Django shortcut to return single object and if not found generate 404
-            Share.objects.filter(participants=request.user).distinct(), pk=self.kwargs['share_id'])
-        return super().dispatch(request, *args, **kwargs)
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["attachments"] = attachments.for_share(self.share, self.object)
+        context["attachment_form"] = AttachmentForm()
+        return context
 
-class FareUpdate(LoginRequiredMixin, UpdateView):
+class FareUpdate(FareAccessMixin, UpdateView):
     model = Fare
     form_class = FareForm
 
-    def dispatch(self, request, *args, **kwargs): # protects URL route from those who do not have access
-        self.share = get_object_or_404( # Django shortcut to return single object and if not found generate 404
-            Share.objects.filter(participants=request.user).distinct(), pk=self.kwargs['share_id'])
-        return super().dispatch(request, *args, **kwargs)
-
     def get_form(self): # renders correct info in form
         form = super().get_form()
-        form.fields['split_between'].queryset = self.share.participants.all() # limit form field to only show Share participants
-        form.fields['paid_by'].queryset = self.share.participants.all() # limit form field to only show Share participants
+        form.set_participants(access.share_participants(self.share.pk)) # limit form fields to only show Share participants
         return form
 
-class FareDelete(LoginRequiredMixin, DeleteView):
+class FareDelete(FareAccessMixin, DeleteView):
     model = Fare
 
     def get_success_url(self):
-        return reverse("share-detail", kwargs={"pk": self.object.share.pk})
-
-    def dispatch(self, request, *args, **kwargs): # protects URL route from those who do not have access
-        self.share = get_object_or_404( # Django shortcut to return single object and if not found generate 404
-            Share.objects.filter(participants=request.user).distinct(), pk=self.kwargs['share_id'])
-        return super().dispatch(request, *args, **kwargs)
-
-    
-
-
+        return reverse("share-detail", kwargs={"pk": self.share.pk})
 
 
+####
+# Receipts and photos, see attachments.py. The upload is already on disk when the view runs, saving it
+# is a rename and the thumbnails are made after the response, so an upload costs the same at any size.
 
+class AttachmentUpload(ShareAccessMixin, FormView):
+    # the share's photos, or a fare's when the route has the fare's pk
+    form_class = AttachmentForm
+    template_name = 'shares/attachments.html'
 
+    @cached_property
+    def fare(self):
+        if 'pk' not in self.kwargs:
+            return None
+        return get_object_or_404(Fare, pk=self.kwargs['pk'], share=self.share)
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["share"] = self.share
+        context["fare"] = self.fare
+        context["attachments"] = attachments.for_share(self.share, self.fare)
+        return context
 
+    def form_valid(self, form):
+        attachments.attach(self.share, form.cleaned_data['file'], self.request.user, self.fare)
+        if self.fare:
+            return redirect('fare-detail', share_id=self.share.pk, pk=self.fare.pk)
+        return redirect('share-attachments', share_id=self.share.pk)
 
+class AttachmentFile(LoginRequiredMixin, View):
+    def get(self, request, pk, variant):
+        attachment = get_object_or_404( # participants only, checked in the same query
+            Attachment.objects.only('share_id', 'content_type', 'file', 'thumbnail', 'preview'), pk=pk, share__participants=request.user)
+        return attachments.file_response(attachment, variant)
 
 
+####
+# Async versions of the read-heavy pages, routed instead of the sync ones when the app runs
+# under ASGI (see settings.ASYNC_VIEWS). Queries go through the async ORM so the worker's event
+# loop keeps serving other requests while they run, templates are rendered by Django in its sync thread.
+
+async def async_user(request):
+    user = await request.auser()
+    request.user = user # the auth context processor reads request.user while rendering, this saves a query
+    return user
+
+class AsyncHome(View):
+
+    async def get(self, request):
+        return TemplateResponse(request, Home.template_name, await ahome_metrics())
+
+class AsyncShareIndex(View):
+    page_size = ShareIndex.page_size
+
+    async def get(self, request):
+        user = await async_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        shares, next_cursor = await akeyset_page(
+            Share.objects.filter(participants=user), SHARE_ORDERING, request.GET.get('cursor'), self.page_size)
+        context = {"shares": shares, "next_cursor": next_cursor}
+        template = 'shares/_share_cards.html' if 'partial' in request.GET else ShareIndex.template_name
+        return with_next_cursor(TemplateResponse(request, template, context), context)
+
+class AsyncShareDetail(View):
+    page_size = ShareDetail.page_size
+
+    async def get(self, request, pk):
+        user = await async_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        try:
+            share = await Share.objects.filter(participants=user).select_related('summary').aget(pk=pk)
+        except Share.DoesNotExist:
+            raise Http404("No share found matching the query")
+
+        fares, next_cursor = await akeyset_page(
+            share.fare_set.select_related('paid_by'), FARE_ORDERING, request.GET.get('cursor'), self.page_size)
+        context = {"share": share, "object": share, "fares": fares, "next_cursor": next_cursor}
+        if 'partial' in request.GET:
+            template = 'shares/_fare_rows.html'
+        else:
+            template = ShareDetail.template_name
+            context.update(await acached_summary_context(share, user))
+        return with_next_cursor(TemplateResponse(request, template, context), context)
 
 
+####
+# Fare search across the user's shares, see search.py
 
+class FareSearch(LoginRequiredMixin, TemplateView):
+    template_name = 'shares/search.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = FareSearchForm(self.request.GET or None, share_ids=access.member_share_ids(self.request.user))
+        context["form"] = form
+        if not form.is_valid() or all(value in (None, '') for value in form.cleaned_data.values()):
+            return context
+
+        data = form.cleaned_data
+        fares = search.search_fares(
+            self.request.user, data['q'], data['category'], data['paid_by'], data['min_amount'], data['max_amount'])
+        try:
+            page = int(self.request.GET.get('page', 1))
+        except ValueError:
+            page = 1
+        results, next_page, next_cursor = search.search_page(fares, data['q'], page, self.request.GET.get('cursor'))
+
+        query = self.request.GET.copy() # the same search, one page further
+        query.pop('page', None)
+        query.pop('cursor', None)
+        if next_page:
+            query['page'] = next_page
+        elif next_cursor:
+            query['cursor'] = next_cursor
+        context["results"] = results
+        context["next_query"] = query.urlencode() if next_page or next_cursor else None
+        return context
 
+####
+# JSON API
+# Responses carry a strong ETag built from the share's summary version,
+# so an unchanged poll is answered with 304 after a single share query.
+# Fares are written in batches through ShareFaresBatchApi, see batch.py.
+
+class ShareJsonView(LoginRequiredMixin, View):
+    raise_exception = True # API clients get a 403 instead of a login redirect
+
+    def get(self, request, pk):
+        share = get_object_or_404( # same access rule as ShareDetail: participants only
+            Share.objects.filter(participants=request.user).select_related('summary'), pk=pk)
+        try:
+            summary = share.summary
+        except ShareSummary.DoesNotExist:
+            summary = get_summary(share)
+
+        etag = f'"share-{share.pk}-v{summary.version}-u{request.user.pk}-{self.representation()}"' # body differs per viewer
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(self.get_data(share, summary))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache' # always revalidate, the ETag keeps that cheap
+        return response
 
+    def representation(self):
+        return self.__class__.__name__.lower()
+
+    def get_data(self, share, summary):
+        raise NotImplementedError
+
+
+class ShareSummaryApi(ShareJsonView):
+
+    def get_data(self, share, summary):
+        ledger = summary_context(share, self.request.user, summary)
+        return {
+            "id": share.pk,
+            "title": share.title,
+            "currency": share.currency,
+            "version": summary.version,
+            "total_fares": ledger["total_fares"],
+            "total_expenses": ledger["total_expenses"],
+            "my_expenses": ledger["my_expenses"],
+            "balances": [
+                {
+                    "user_id": b["participant"].pk,
+                    "username": b["participant"].username,
+                    "paid": b["paid"],
+                    "owes": b["owes"],
+                    "net": b["net"],
+                }
+                for b in ledger["balances"]
+            ],
+            "categories": [
+                {"category": CATEGORY_KEYS.get(label, label), "label": label, "total": total}
+                for label, total in ledger["category_totals"].items()
+            ],
+        }
+
+
+class ShareSpendingApi(ShareJsonView):
+
+    def representation(self):
+        return f"spending-{self.request.GET.get('period', 'month')}-{self.request.GET.get('by', 'category')}"
+
+    def get_data(self, share, summary):
+        period = self.request.GET.get('period', 'month')
+        by = self.request.GET.get('by', 'category')
+        if period not in analytics.PERIODS or by not in analytics.GROUPS:
+            raise Http404("Unknown period or grouping")
+        return {
+            "share_id": share.pk,
+            "currency": share.currency,
+            "version": summary.version,
+            "period": period,
+            "by": by,
+            "points": analytics.share_series(share, summary, period, by), # cached per share version
+        }
+
+
+class UserSpendingApi(LoginRequiredMixin, View):
+    raise_exception = True
+
+    def get(self, request):
+        period = request.GET.get('period', 'month')
+        if period not in analytics.PERIODS:
+            raise Http404("Unknown period")
+        return JsonResponse({
+            "user_id": request.user.pk,
+            "period": period,
+            "by": "category",
+            "currencies": analytics.user_series(request.user, period), # what the user paid, per share currency
+        })
+
+
+class UserAutocompleteApi(LoginRequiredMixin, View):
+    raise_exception = True
+
+    def get(self, request):
+        response = JsonResponse({"results": people.find_users(request.GET.get('q', ''))}) # at most people.LIMIT users
+        response['Cache-Control'] = 'private, max-age=60' # typing the same prefix again does not refetch
+        return response
 
 
-    
+class ShareFaresApi(ShareJsonView):
+    page_size = 100
+
+    def representation(self):
+        query = self.request.GET.urlencode()
+        return "fares-" + hashlib.md5(query.encode()).hexdigest()[:12]
+
+    def get_data(self, share, summary):
+        fares, next_cursor = keyset_page(
+            share.fare_set.select_related('paid_by'), FARE_ORDERING, self.request.GET.get('cursor'), self.page_size)
+        splits = {}
+        for fare_id, user_id, cents in FareSplit.objects.filter(fare__in=fares).values_list('fare_id', 'user_id', 'amount_cents'):
+            splits.setdefault(fare_id, []).append({"user_id": user_id, "amount": cents_to_amount(cents)})
+
+        return {
+            "share_id": share.pk,
+            "version": summary.version,
+            "next_cursor": next_cursor,
+            "fares": [
+                {
+                    "id": fare.pk,
+                    "name": fare.name,
+                    "amount": fare.amount,
+                    "date": fare.date,
+                    "category": fare.category,
+                    "paid_by": {"id": fare.paid_by.pk, "username": fare.paid_by.username},
+                    "split_method": fare.split_method,
+                    "split_between": splits.get(fare.pk, []),
+                }
+                for fare in fares
+            ],
+        }
+
+
+class ShareFaresBatchApi(LoginRequiredMixin, View):
+    raise_exception = True
+
+    def post(self, request, pk):
+        share = access.share_for(request.user, pk) # participants only
+        try:
+            operations = json.loads(request.body)["operations"]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({"error": 'Send {"operations": [...]} as JSON.'}, status=400)
+        if not isinstance(operations, list) or not 0 < len(operations) <= batch.MAX_OPERATIONS:
+            return JsonResponse({"error": f"Send a list of 1 to {batch.MAX_OPERATIONS} operations."}, status=400)
+
+        result = batch.apply_operations(share, operations) # all of them or, when any is invalid, none
+        return JsonResponse(result.as_json(share), status=200 if result.applied else 400)
 
 
+####
+# Request timings for staff, the rolling histogram kept by perf.PerfMiddleware in this worker process
 
+class PerfStats(LoginRequiredMixin, UserPassesTestMixin, View):
+    raise_exception = True
 
+    def test_func(self):
+        return self.request.user.is_staff
 
+    def get(self, request):
+        return JsonResponse({
+            "sample_rate": settings.PERF_SAMPLE_RATE,
+            "window_seconds": perf.WINDOW_SECONDS,
+            "views": perf.histogram.snapshot(),
+        })